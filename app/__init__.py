@@ -32,10 +32,55 @@ class Config:
     @field SQLALCHEMY_DATABASE_URI: The URI for the database.
     @field UPLOADS_FOLDER: The folder where uploaded files are stored.
     @field THUMBNAILS_FOLDER: The folder where thumbnails are stored.
+    @field STAGING_FOLDER: The folder uploads and downloads are written to until they are accepted; it must not be served and must be on the same filesystem as UPLOADS_FOLDER, so moving them into place is atomic.
     @field SECRET_KEY: The secret key for the app.
     @field SQLALCHEMY_TRACK_MODIFICATIONS: Whether to track modifications to the database.
     @field SQLALCHEMY_ECHO: Whether to echo SQL statements to the console.
     @field ADMIN_PASSWORD: The password for the admin user.
+    @field FEED_PAGE_SIZE: The number of memes loaded per feed page.
+    @field AUTHOR_CACHE_TTL: Seconds a cached meme author stays valid.
+    @field AUTHOR_CACHE_SIZE: The maximum number of cached meme authors.
+    @field SESSION_USER_CACHE_TTL: Seconds a cached session user stays valid, 0 disables it.
+    @field SESSION_USER_CACHE_SIZE: The maximum number of cached session users.
+    @field JOB_WORKERS: The number of worker processes of the job queue, 0 for one per core.
+    @field JOB_WORKER_IN_APP: Whether the app process runs the job dispatcher itself, only for a single-process dev server; otherwise run one `flask run-jobs` per host.
+    @field JOB_POLL_INTERVAL: Seconds between polls of the job table.
+    @field JOB_MAX_ATTEMPTS: The number of attempts before a job fails for good.
+    @field JOB_RETRY_DELAY: Seconds before the first retry, doubled for each retry.
+    @field JOB_STALE_AFTER: Seconds after which a running job is considered lost.
+    @field JOB_IO_WORKERS: The number of threads running network-bound jobs such as URL fetches.
+    @field FETCH_CONNECT_TIMEOUT: Seconds to wait for a connection when fetching an image URL.
+    @field FETCH_READ_TIMEOUT: Seconds to wait for each read when fetching an image URL.
+    @field FETCH_TOTAL_TIMEOUT: Seconds a whole image download may take.
+    @field FETCH_PER_HOST: The maximum number of concurrent downloads from one host per dispatcher.
+    @field PHASH_MAX_DISTANCE: The maximum number of differing perceptual hash bits of a possible duplicate.
+    @field PHASH_INDEX_REFRESH: Seconds between loads of the memes other processes added to the duplicate index.
+    @field PHASH_INDEX_PRELOAD: Whether the duplicate index is loaded in the background at startup.
+    @field MAX_UPLOAD_BYTES: The maximum size of an uploaded image.
+    @field MAX_CONTENT_LENGTH: The maximum size of a request body, the upload plus room for the form fields.
+    @field MAX_IMAGE_PIXELS: The maximum width * height of an uploaded image, checked before decoding.
+    @field IMAGE_WIDTHS: The widths /img/<meme_id>/<width> serves, comma separated.
+    @field IMAGE_CACHE_FOLDER: The folder where the resized images of /img are cached.
+    @field IMAGE_CACHE_MAX_BYTES: The maximum total size of the resized image cache.
+    @field MEDIA_MAX_AGE: Seconds browsers and proxies may cache a versioned /media URL.
+    @field MEDIA_OFFLOAD: "x-accel-redirect" or "x-sendfile" to let the front proxy send /media files, empty to send them from Python.
+    @field MEDIA_ACCEL_PREFIX: The internal proxy location the uploads folder is mapped to for X-Accel-Redirect.
+    @field ANIMATION_MAX_BYTES: The maximum size of the animated WebP variant of an animated meme, 0 to render none.
+    @field ANIMATION_MAX_FRAMES: The maximum number of frames of the animated WebP variant.
+    @field PURGE_RETENTION_DAYS: Days a soft-deleted meme is kept before it is purged.
+    @field PURGE_CHUNK_SIZE: The number of memes hard-deleted per transaction.
+    @field FILE_REMOVAL_WORKERS: The threads unlinking the files of purged memes.
+    @field NORMALIZE_MAX_EDGE: The maximum long edge of a stored original; larger uploads are downscaled, 0 to keep any size.
+    @field NORMALIZE_MAX_BYTES: The maximum size of a stored original; larger uploads are re-encoded, 0 to keep any size.
+    @field NORMALIZE_FORMAT: The format oversized uploads are re-encoded in, "webp", "jpeg" or "png", or "original" to keep theirs.
+    @field NORMALIZE_QUALITIES: The encoder qualities tried in turn until a re-encoded original fits NORMALIZE_MAX_BYTES, comma separated.
+    @field KEEP_PRISTINE: Whether uploads are kept in PRISTINE_FOLDER as uploaded (without metadata) before they are normalized.
+    @field PRISTINE_FOLDER: The cold storage folder of pristine uploads, outside of the served static folder.
+    @field AVATARS_FOLDER: The folder where the resized avatar variants are stored.
+    @field DEFAULT_AVATARS_FOLDER: The folder of the default profile images users can choose from.
+    @field SEEN_FLUSH_INTERVAL: Seconds between writes of the buffered "seen" impressions.
+    @field SEEN_BUFFER_SIZE: The maximum number of buffered impressions; a full buffer is written right away.
+    @field SEEN_DURABILITY: "buffered" to write impressions behind, "sync" to write them before the request returns.
     """
 
     SQLALCHEMY_DATABASE_URI = os.environ.get("SQLALCHEMY_DATABASE_URI")
@@ -43,16 +88,87 @@ class Config:
     THUMBNAILS_FOLDER = (
         os.environ.get("PROJECT_ROOT") + "/app/static/uploads/thumbnails"
     )
+    STAGING_FOLDER = (
+        os.environ.get("STAGING_FOLDER") or os.environ.get("PROJECT_ROOT") + "/staging"
+    )
     SECRET_KEY = os.environ.get("SECRET_KEY")
     SQLALCHEMY_TRACK_MODIFICATIONS = (
         os.environ.get("SQLALCHEMY_TRACK_MODIFICATIONS") or False
     )
     SQLALCHEMY_ECHO = os.environ.get("SQLALCHEMY_ECHO") or False
     ADMIN_PASSWORD = os.environ.get("ADMIN_PASSWORD")
+    FEED_PAGE_SIZE = int(os.environ.get("FEED_PAGE_SIZE") or 10)
+    AUTHOR_CACHE_TTL = int(os.environ.get("AUTHOR_CACHE_TTL") or 300)
+    AUTHOR_CACHE_SIZE = int(os.environ.get("AUTHOR_CACHE_SIZE") or 10000)
+    SESSION_USER_CACHE_TTL = int(os.environ.get("SESSION_USER_CACHE_TTL") or 0)
+    SESSION_USER_CACHE_SIZE = int(os.environ.get("SESSION_USER_CACHE_SIZE") or 1000)
+    JOB_WORKERS = int(os.environ.get("JOB_WORKERS") or 0)
+    JOB_WORKER_IN_APP = (os.environ.get("JOB_WORKER_IN_APP") or "false") == "true"
+    JOB_POLL_INTERVAL = float(os.environ.get("JOB_POLL_INTERVAL") or 2)
+    JOB_MAX_ATTEMPTS = int(os.environ.get("JOB_MAX_ATTEMPTS") or 3)
+    JOB_RETRY_DELAY = int(os.environ.get("JOB_RETRY_DELAY") or 10)
+    JOB_STALE_AFTER = int(os.environ.get("JOB_STALE_AFTER") or 600)
+    JOB_IO_WORKERS = int(os.environ.get("JOB_IO_WORKERS") or 8)
+    FETCH_CONNECT_TIMEOUT = float(os.environ.get("FETCH_CONNECT_TIMEOUT") or 3.05)
+    FETCH_READ_TIMEOUT = float(os.environ.get("FETCH_READ_TIMEOUT") or 10)
+    FETCH_TOTAL_TIMEOUT = float(os.environ.get("FETCH_TOTAL_TIMEOUT") or 30)
+    FETCH_PER_HOST = int(os.environ.get("FETCH_PER_HOST") or 2)
+    PHASH_MAX_DISTANCE = int(os.environ.get("PHASH_MAX_DISTANCE") or 6)
+    PHASH_INDEX_REFRESH = int(os.environ.get("PHASH_INDEX_REFRESH") or 30)
+    PHASH_INDEX_PRELOAD = (os.environ.get("PHASH_INDEX_PRELOAD") or "true") == "true"
+    MAX_UPLOAD_BYTES = int(os.environ.get("MAX_UPLOAD_BYTES") or 20 * 1024 * 1024)
+    MAX_CONTENT_LENGTH = int(
+        os.environ.get("MAX_CONTENT_LENGTH") or MAX_UPLOAD_BYTES + 64 * 1024
+    )
+    MAX_IMAGE_PIXELS = int(os.environ.get("MAX_IMAGE_PIXELS") or 40000000)
+    IMAGE_WIDTHS = [
+        int(width)
+        for width in (os.environ.get("IMAGE_WIDTHS") or "160,320,480,640,960,1280").split(",")
+    ]
+    IMAGE_CACHE_FOLDER = (
+        os.environ.get("IMAGE_CACHE_FOLDER")
+        or os.environ.get("PROJECT_ROOT") + "/app/static/uploads/variants"
+    )
+    IMAGE_CACHE_MAX_BYTES = int(
+        os.environ.get("IMAGE_CACHE_MAX_BYTES") or 1024 * 1024 * 1024
+    )
+    MEDIA_MAX_AGE = int(os.environ.get("MEDIA_MAX_AGE") or 365 * 24 * 3600)
+    MEDIA_OFFLOAD = (os.environ.get("MEDIA_OFFLOAD") or "").lower()
+    MEDIA_ACCEL_PREFIX = os.environ.get("MEDIA_ACCEL_PREFIX") or "/protected-media/"
+    ANIMATION_MAX_BYTES = int(os.environ.get("ANIMATION_MAX_BYTES") or 2 * 1024 * 1024)
+    ANIMATION_MAX_FRAMES = int(os.environ.get("ANIMATION_MAX_FRAMES") or 200)
+    PURGE_RETENTION_DAYS = int(os.environ.get("PURGE_RETENTION_DAYS") or 30)
+    PURGE_CHUNK_SIZE = int(os.environ.get("PURGE_CHUNK_SIZE") or 500)
+    FILE_REMOVAL_WORKERS = int(os.environ.get("FILE_REMOVAL_WORKERS") or 4)
+    NORMALIZE_MAX_EDGE = int(os.environ.get("NORMALIZE_MAX_EDGE") or 2560)
+    NORMALIZE_MAX_BYTES = int(
+        os.environ.get("NORMALIZE_MAX_BYTES") or 1536 * 1024
+    )
+    NORMALIZE_FORMAT = (os.environ.get("NORMALIZE_FORMAT") or "webp").upper()
+    NORMALIZE_QUALITIES = [
+        int(quality)
+        for quality in (os.environ.get("NORMALIZE_QUALITIES") or "85,75,65,50").split(",")
+    ]
+    KEEP_PRISTINE = (os.environ.get("KEEP_PRISTINE") or "false") == "true"
+    PRISTINE_FOLDER = (
+        os.environ.get("PRISTINE_FOLDER")
+        or os.environ.get("PROJECT_ROOT") + "/pristine"
+    )
+    AVATARS_FOLDER = os.environ.get("PROJECT_ROOT") + "/app/static/uploads/avatars"
+    DEFAULT_AVATARS_FOLDER = (
+        os.environ.get("DEFAULT_AVATARS_FOLDER")
+        or os.environ.get("PROJECT_ROOT") + "/app/static/images/default_images"
+    )
+    SEEN_FLUSH_INTERVAL = float(os.environ.get("SEEN_FLUSH_INTERVAL") or 5)
+    SEEN_BUFFER_SIZE = int(os.environ.get("SEEN_BUFFER_SIZE") or 10000)
+    SEEN_DURABILITY = (os.environ.get("SEEN_DURABILITY") or "buffered").lower()
 
 
 # create the folder structure for the uploads and thumbnails, if they do not exist
 os.makedirs(Config.THUMBNAILS_FOLDER, exist_ok=True)
+os.makedirs(Config.IMAGE_CACHE_FOLDER, exist_ok=True)
+os.makedirs(Config.AVATARS_FOLDER, exist_ok=True)
+os.makedirs(Config.STAGING_FOLDER, exist_ok=True)
 
 # create an instance of the Config class
 conf = Config()
@@ -109,18 +225,30 @@ def create_app():
     # using the app context, register the blueprints and models
     with app.app_context():
 
-        # import the routes and models modules
+        # import the routes, models and commands modules
         from . import routes
         from . import models
+        from . import commands
+        from . import jobs
 
         # register the blueprints
         app.register_blueprint(routes.endpoint)
 
+        # bind the background job queue, see `flask run-jobs`
+        jobs.job_queue.init_app(app)
+
+        # register the cli commands, e.g. `flask reconcile-counters`
+        commands.register_commands(app)
+
         # create the database tables if they do not exist
         db.create_all()
 
-        # from .scripts import test_memes
-        # test_memes.generate_test_memes()
+        # build the near-duplicate index, see `flask scan-duplicates`
+        models.duplicate_index.init_app(app)
+
+        # buffer the impressions of the feed, see POST /seen
+        models.impression_buffer.init_app(app)
+
         # return the app instance
         return app
 
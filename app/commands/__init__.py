@@ -0,0 +1,23 @@
+from flask import Flask
+from .counters import reconcile_counters as reconcile_counters
+from .jobs import run_jobs as run_jobs
+from .duplicates import scan_duplicates as scan_duplicates
+from .storage import shard_uploads as shard_uploads
+from .imports import import_memes as import_memes
+from .purge import purge_memes as purge_memes
+from .maintenance import maintenance as maintenance
+
+
+def register_commands(app: Flask) -> None:
+    """
+    Register the maintenance commands with the flask cli.
+    @param app: The app instance.
+    @return: None
+    """
+    app.cli.add_command(reconcile_counters)
+    app.cli.add_command(run_jobs)
+    app.cli.add_command(scan_duplicates)
+    app.cli.add_command(shard_uploads)
+    app.cli.add_command(import_memes)
+    app.cli.add_command(purge_memes)
+    app.cli.add_command(maintenance)
@@ -0,0 +1,29 @@
+import click
+from flask.cli import with_appcontext
+from app import db
+from app.models import Meme
+
+
+@click.command("reconcile-counters")
+@click.option(
+    "--chunk-size",
+    default=10000,
+    show_default=True,
+    help="Number of meme ids recomputed per UPDATE and commit.",
+)
+@with_appcontext
+def reconcile_counters(chunk_size: int) -> None:
+    """Recompute the like, save and comment counters of every meme."""
+    first_id, last_id = db.session.execute(
+        db.select(db.func.min(Meme.id), db.func.max(Meme.id))
+    ).one()
+    if first_id is None:
+        click.echo("No memes to reconcile.")
+        return
+    updated = 0
+    for start in range(first_id, last_id + 1, chunk_size):
+        end = min(start + chunk_size - 1, last_id)
+        updated += Meme.reconcile_counters(start, end)
+        db.session.commit()
+        click.echo(f"Reconciled memes {start}-{end}")
+    click.echo(f"Reconciled counters of {updated} memes.")
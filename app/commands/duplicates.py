@@ -0,0 +1,113 @@
+import click
+from flask.cli import with_appcontext
+from app import db
+from app.models import Meme, duplicate_index
+
+
+def _backfill_phashes(chunk_size: int) -> int:
+    """Compute the missing perceptual hashes, preferring the small thumbnails."""
+    filled = 0
+    last_id = 0
+    while True:
+        memes = (
+            Meme.query.filter(Meme.phash.is_(None), Meme.id > last_id)
+            .order_by(Meme.id)
+            .limit(chunk_size)
+            .all()
+        )
+        if not memes:
+            return filled
+        for meme in memes:
+            # dHash only needs 9x8 pixels, so a thumbnail, which is rendered
+            # upright, hashes like the original turned upright
+            if meme.thumbnail_ready() and meme.md_thumbnail_path:
+                meme.phash = Meme.compute_phash(meme.md_thumbnail_path)
+            if meme.phash is None:
+                meme.phash = Meme.compute_phash(meme.filepath, meme.orientation or 1)
+            filled += meme.phash is not None
+        last_id = memes[-1].id
+        db.session.commit()
+        click.echo(f"Hashed memes up to {last_id}")
+
+
+@click.command("scan-duplicates")
+@click.option(
+    "--max-distance",
+    type=int,
+    default=None,
+    help="Maximum differing hash bits, defaults to PHASH_MAX_DISTANCE.",
+)
+@click.option(
+    "--backfill/--no-backfill",
+    default=True,
+    show_default=True,
+    help="Hash the memes that have no perceptual hash yet first.",
+)
+@click.option(
+    "--flag",
+    is_flag=True,
+    help="Set duplicate_of_id of unflagged memes to the nearest older match.",
+)
+@click.option(
+    "--chunk-size",
+    default=1000,
+    show_default=True,
+    help="Number of memes loaded per query and commit.",
+)
+@with_appcontext
+def scan_duplicates(
+    max_distance: int, backfill: bool, flag: bool, chunk_size: int
+) -> None:
+    """List the memes that look like a repost of an older meme."""
+    if backfill:
+        click.echo(f"Hashed {_backfill_phashes(chunk_size)} memes.")
+    duplicate_index.refresh(force=True)
+    found = flagged = 0
+    last_id = 0
+    while True:
+        rows = db.session.execute(
+            db.select(Meme.id, Meme.phash, Meme.duplicate_of_id)
+            .where(Meme.phash.isnot(None), Meme.deleted.is_(False), Meme.id > last_id)
+            .order_by(Meme.id)
+            .limit(chunk_size)
+        ).all()
+        if not rows:
+            break
+        candidates = {
+            meme_id: [
+                (distance, match_id)
+                for distance, match_id in duplicate_index.search(phash, max_distance)
+                if match_id < meme_id
+            ]
+            for meme_id, phash, _ in rows
+        }
+        # the index also holds deleted memes
+        match_ids = {match_id for older in candidates.values() for _, match_id in older}
+        live = set(
+            db.session.execute(
+                db.select(Meme.id).where(
+                    Meme.id.in_(match_ids), Meme.deleted.is_(False)
+                )
+            ).scalars()
+        )
+        for meme_id, _, duplicate_of_id in rows:
+            older = [match for match in candidates[meme_id] if match[1] in live]
+            if not older:
+                continue
+            distance, match_id = older[0]
+            found += 1
+            click.echo(f"meme {meme_id} ~ meme {match_id} (distance {distance})")
+            if flag and duplicate_of_id is None:
+                db.session.execute(
+                    db.update(Meme)
+                    .where(Meme.id == meme_id)
+                    .values(duplicate_of_id=match_id)
+                    .execution_options(synchronize_session=False)
+                )
+                flagged += 1
+        last_id = rows[-1][0]
+        db.session.commit()
+    click.echo(
+        f"Found {found} possible duplicates in {len(duplicate_index)} distinct hashes"
+        + (f", flagged {flagged}." if flag else ".")
+    )
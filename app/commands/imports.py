@@ -0,0 +1,166 @@
+import os, time
+from concurrent.futures import ProcessPoolExecutor
+import click
+from flask.cli import with_appcontext
+from app import conf, db
+from app.models import MediaFile, Meme, User
+from app.utils.ingest import UploadRejected, hash_file, ingest_file
+from app.utils.storage import content_filename
+
+# the extensions picked up by the walk; the content is sniffed regardless
+_EXTENSIONS = (".jpg", ".jpeg", ".png", ".gif", ".webp")
+
+_DEFAULT_DIRECTORY = os.path.join(
+    os.path.dirname(os.path.dirname(__file__)), "static", "images", "test_memes"
+)
+
+
+def _find_images(directory: str):
+    """Walk directory in a stable order, yielding the paths of image files."""
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for name in sorted(files):
+            if name.lower().endswith(_EXTENSIONS):
+                yield os.path.join(root, name)
+
+
+def _batches(paths, size: int):
+    """Split an iterable of paths into lists of at most size paths."""
+    batch = []
+    for path in paths:
+        batch.append(path)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _hash(path: str):
+    """Hash a file in a worker process, None if it cannot be read."""
+    try:
+        return hash_file(path)
+    except OSError:
+        return None
+
+
+def _ingest(path: str) -> dict:
+    """Ingest a file in a worker process, see app.utils.ingest_file."""
+    try:
+        return ingest_file(
+            path,
+            conf.STAGING_FOLDER,
+            conf.MAX_UPLOAD_BYTES,
+            conf.MAX_IMAGE_PIXELS,
+            Meme.normalize_policy(),
+        )
+    except (OSError, UploadRejected) as err:
+        return dict(error=str(err))
+
+
+@click.command("import-memes")
+@click.argument(
+    "directory",
+    required=False,
+    default=_DEFAULT_DIRECTORY,
+    type=click.Path(exists=True, file_okay=False),
+)
+@click.option(
+    "--user-id",
+    default=1,
+    show_default=True,
+    help="The id of the user the memes are posted by.",
+)
+@click.option("--private", is_flag=True, help="Post the memes as private.")
+@click.option(
+    "--workers",
+    type=int,
+    default=None,
+    help="Number of worker processes, defaults to the number of CPUs.",
+)
+@click.option(
+    "--batch-size",
+    default=200,
+    show_default=True,
+    help="Number of files hashed, ingested and committed together.",
+)
+@with_appcontext
+def import_memes(
+    directory: str, user_id: int, private: bool, workers: int, batch_size: int
+) -> None:
+    """
+    Post every image under DIRECTORY (default: the bundled test memes).
+    Files are hashed and ingested in parallel and inserted in batched
+    commits. Files whose content is already posted are skipped, so an
+    interrupted import is resumed by running it again.
+    """
+    if db.session.get(User, user_id) is None:
+        raise click.BadParameter(f"No user with id {user_id}.", param_hint="--user-id")
+    started = time.monotonic()
+    seen = imported = skipped = failed = imported_bytes = 0
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for batch in _batches(_find_images(directory), batch_size):
+            seen += len(batch)
+            hashes = dict(zip(batch, pool.map(_hash, batch)))
+            posted = set(
+                db.session.execute(
+                    db.select(Meme.content_hash).where(
+                        Meme.content_hash.in_(set(hashes.values()) - {None})
+                    )
+                ).scalars()
+            )
+            # the same content twice in one batch is posted once
+            pending = {}
+            for path, content_hash in hashes.items():
+                if content_hash is None:
+                    failed += 1
+                    click.echo(f"Failed {path}: could not be read", err=True)
+                elif content_hash in posted or content_hash in pending:
+                    skipped += 1
+                else:
+                    pending[content_hash] = path
+            paths = list(pending.values())
+            batch_ingested = []
+            for path, ingested in zip(paths, pool.map(_ingest, paths)):
+                if "error" in ingested:
+                    failed += 1
+                    click.echo(f"Failed {path}: {ingested['error']}", err=True)
+                    continue
+                imported_bytes += os.path.getsize(ingested["path"])
+                batch_ingested.append(ingested)
+            # one query each for the whole batch instead of some per file
+            stored = MediaFile.acquire_many(
+                {
+                    ingested["content_hash"]: content_filename(
+                        ingested["content_hash"], ingested["ext"]
+                    )
+                    for ingested in batch_ingested
+                }
+            )
+            reposts = Meme.find_reposts(stored)
+            duplicates = Meme.find_possible_duplicates(
+                ingested["phash"] for ingested in batch_ingested
+            )
+            for ingested in batch_ingested:
+                content_hash = ingested["content_hash"]
+                meme = Meme.from_ingested(
+                    ingested,
+                    user_id,
+                    private,
+                    stored[content_hash],
+                    reposts[content_hash],
+                    duplicates,
+                )
+                db.session.add(meme)
+                imported += 1
+            db.session.commit()
+            elapsed = time.monotonic() - started
+            click.echo(
+                f"{seen} files: {imported} imported, {skipped} skipped, "
+                f"{failed} failed ({seen / elapsed:.1f} files/s, "
+                f"{imported_bytes / elapsed / 1024 / 1024:.1f} MB/s)"
+            )
+    click.echo(
+        f"Imported {imported} memes in {time.monotonic() - started:.1f}s; "
+        "their thumbnails are rendered by the job queue, see `flask run-jobs`."
+    )
@@ -0,0 +1,21 @@
+import click
+from flask.cli import with_appcontext
+from app.jobs import job_queue
+
+
+@click.command("run-jobs")
+@click.option(
+    "--until-idle",
+    is_flag=True,
+    help="Exit once no job is runnable instead of polling forever.",
+)
+@with_appcontext
+def run_jobs(until_idle: bool) -> None:
+    """
+    Run the background job dispatcher (thumbnails, ...) in the foreground.
+    Run one per host next to the web server, which only queues jobs unless
+    JOB_WORKER_IN_APP is set.
+    """
+    click.echo(f"Running jobs with {job_queue.max_workers} worker processes.")
+    finished = job_queue.run(until_idle=until_idle)
+    click.echo(f"Finished {finished} jobs.")
@@ -0,0 +1,67 @@
+import click
+from flask.cli import with_appcontext
+from app import db
+from app.jobs import maintenance_runner
+from app.models import MaintenanceRun
+
+
+@click.group("maintenance")
+def maintenance() -> None:
+    """Run resumable maintenance tasks over every meme."""
+
+
+@maintenance.command("list")
+@with_appcontext
+def list_tasks() -> None:
+    """List the maintenance tasks and the state of their last run."""
+    runs = {
+        run.task: run for run in db.session.execute(db.select(MaintenanceRun)).scalars()
+    }
+    for name, task in sorted(maintenance_runner.tasks.items()):
+        run = runs.get(name)
+        if run is None:
+            state = "never run"
+        elif run.finished_at is None:
+            state = f"unfinished after meme {run.last_id} ({run.processed} done, {run.failed} failed, to retry)"
+        else:
+            state = f"finished {run.finished_at:%Y-%m-%d %H:%M} ({run.processed} done, {run.failed} failed)"
+        click.echo(f"{name}: {task.description} [{state}]")
+
+
+@maintenance.command("run")
+@click.argument("task")
+@click.option(
+    "--chunk-size",
+    default=200,
+    show_default=True,
+    help="Number of memes per chunk, commit and checkpoint.",
+)
+@click.option(
+    "--workers",
+    type=int,
+    default=None,
+    help="Number of workers, defaults to the number of CPUs.",
+)
+@click.option(
+    "--restart",
+    is_flag=True,
+    help="Start over instead of resuming an interrupted run.",
+)
+@with_appcontext
+def run_task(task: str, chunk_size: int, workers: int, restart: bool) -> None:
+    """Run TASK over every meme, resuming an unfinished run and retrying its failures."""
+    if task not in maintenance_runner.tasks:
+        raise click.BadParameter(
+            f"Unknown task, one of: {', '.join(sorted(maintenance_runner.tasks))}.",
+            param_hint="TASK",
+        )
+    run = maintenance_runner.run(
+        task, chunk_size=chunk_size, workers=workers, restart=restart, report=click.echo
+    )
+    if run.finished_at is None:
+        click.echo(
+            f"{task}: {run.processed} processed, {run.failed} failed, "
+            f"run `flask maintenance run {task}` again to retry them."
+        )
+    else:
+        click.echo(f"{task}: finished, {run.processed} processed.")
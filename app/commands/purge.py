@@ -0,0 +1,33 @@
+import click
+from flask.cli import with_appcontext
+from app.models import purge_all_memes, purge_expired_memes
+
+
+@click.command("purge-memes")
+@click.option(
+    "--retention-days",
+    type=int,
+    default=None,
+    help="Purge memes soft-deleted this many days ago, defaults to PURGE_RETENTION_DAYS.",
+)
+@click.option(
+    "--all",
+    "purge_all",
+    is_flag=True,
+    help="Purge every meme, deleted or not, e.g. to reset a test environment.",
+)
+@click.option(
+    "--chunk-size",
+    type=int,
+    default=None,
+    help="Number of memes deleted per transaction, defaults to PURGE_CHUNK_SIZE.",
+)
+@with_appcontext
+def purge_memes(retention_days: int, purge_all: bool, chunk_size: int) -> None:
+    """Hard-delete soft-deleted memes past the retention window, and their files."""
+    if purge_all:
+        click.confirm("Delete every meme and its files?", abort=True)
+        purged = purge_all_memes(chunk_size)
+    else:
+        purged = purge_expired_memes(retention_days, chunk_size)
+    click.echo(f"Purged {purged} memes.")
@@ -0,0 +1,159 @@
+import os, shutil
+from concurrent.futures import ThreadPoolExecutor
+import click
+from flask.cli import with_appcontext
+from app import conf, db
+from app.models import Meme
+from app.utils.storage import (
+    is_sharded,
+    remove_files,
+    sharded_folder,
+    temp_path,
+    thumbnail_paths,
+)
+from app.utils.thumbnails import thumbnail_filename
+
+
+def _link(source: str, target: str) -> bool:
+    """
+    Make target a copy of source without removing source, so the old path
+    keeps serving until the database points at the new one.
+    @return: Whether target exists afterwards.
+    """
+    if os.path.exists(target):
+        return True
+    if not os.path.exists(source):
+        return False
+    folder = os.path.dirname(target)
+    os.makedirs(folder, exist_ok=True)
+    try:
+        os.link(source, target)
+    except FileExistsError:
+        pass
+    except OSError:
+        # e.g. a filesystem without hard links
+        partial = temp_path(folder, "copy")
+        try:
+            shutil.copy2(source, partial)
+            os.replace(partial, target)
+        finally:
+            remove_files([partial])
+    return True
+
+
+def _shard_files(filename: str, filepath: str, thumb_path: str) -> dict:
+    """
+    Link the original and the thumbnails of one filename into their shards.
+    Runs in a worker thread, so it only touches the filesystem.
+    @param filename: The filename of the original.
+    @param filepath: The current Meme.filepath.
+    @param thumb_path: The current Meme.md_thumbnail_path, may be None.
+    @return: A dict with the new "filepath" and "thumb_folder" (None where
+    nothing moved) and the "old" paths to delete once committed.
+    """
+    moved = dict(filepath=None, thumb_folder=None, old=[])
+    if not is_sharded(filepath, filename):
+        target = os.path.join(sharded_folder(conf.UPLOADS_FOLDER, filename), filename)
+        if _link(filepath, target):
+            moved["filepath"] = target
+            moved["old"].append(filepath)
+    if thumb_path is None or not is_sharded(thumb_path, filename):
+        old_folder = (
+            os.path.dirname(thumb_path) if thumb_path else conf.THUMBNAILS_FOLDER
+        )
+        new_folder = sharded_folder(conf.THUMBNAILS_FOLDER, filename)
+        pairs = zip(
+            thumbnail_paths(old_folder, filename), thumbnail_paths(new_folder, filename)
+        )
+        linked = [source for source, target in pairs if _link(source, target)]
+        if linked:
+            moved["thumb_folder"] = new_folder
+            moved["old"].extend(linked)
+    return moved
+
+
+def _update_paths(filename: str, moved: dict) -> None:
+    """Point every meme sharing filename at the files _shard_files moved."""
+    values = {}
+    if moved["filepath"] is not None:
+        values["filepath"] = moved["filepath"]
+    if moved["thumb_folder"] is not None:
+        for size_type in ("sm", "md"):
+            column = getattr(Meme, f"{size_type}_thumbnail_path")
+            # pending reposts have no thumbnails yet
+            values[column.key] = db.case(
+                (column.is_(None), None),
+                else_=os.path.join(
+                    moved["thumb_folder"], thumbnail_filename(size_type, filename)
+                ),
+            )
+    if values:
+        db.session.execute(
+            db.update(Meme)
+            .where(Meme.filename == filename)
+            .values(values)
+            .execution_options(synchronize_session=False)
+        )
+
+
+@click.command("shard-uploads")
+@click.option(
+    "--chunk-size",
+    default=500,
+    show_default=True,
+    help="Number of memes moved per commit.",
+)
+@click.option(
+    "--workers",
+    default=8,
+    show_default=True,
+    help="Number of threads linking files into their shards.",
+)
+@click.option(
+    "--start-id",
+    default=0,
+    show_default=True,
+    help="Resume after this meme id, as printed by an interrupted run.",
+)
+@with_appcontext
+def shard_uploads(chunk_size: int, workers: int, start_id: int) -> None:
+    """
+    Move the originals and thumbnails of the flat uploads folder into the
+    sharded layout. Safe to run while the app serves: files are linked into
+    place first, the paths are committed, and only then are the old names
+    removed. Already sharded memes are skipped, so it can be rerun any time.
+    """
+    last_id = start_id
+    moved_files = 0
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        while True:
+            rows = db.session.execute(
+                db.select(Meme.id, Meme.filename, Meme.filepath, Meme.md_thumbnail_path)
+                .where(Meme.id > last_id, Meme.filename.isnot(None))
+                .order_by(Meme.id)
+                .limit(chunk_size)
+            ).all()
+            if not rows:
+                break
+            # reposts share their files, so each filename is moved once
+            pending = {}
+            for _, filename, filepath, thumb_path in rows:
+                if not is_sharded(filepath, filename) or not (
+                    thumb_path and is_sharded(thumb_path, filename)
+                ):
+                    pending.setdefault(filename, (filepath, thumb_path))
+            futures = {
+                filename: pool.submit(_shard_files, filename, *paths)
+                for filename, paths in pending.items()
+            }
+            old = []
+            for filename, future in futures.items():
+                moved = future.result()
+                old.extend(moved["old"])
+                _update_paths(filename, moved)
+            db.session.commit()
+            remove_files(old)
+            moved_files += len(old)
+            last_id = rows[-1][0]
+            click.echo(f"Sharded memes up to {last_id}")
+    click.echo(f"Moved {moved_files} files into the sharded layout.")
@@ -2,3 +2,5 @@ from .login_form import LoginForm as LoginForm
 from .register_form import RegistrationForm as RegistrationForm
 from .upload_meme_form import UploadMemeForm as UploadMemeForm
 from .admin_login_form import AdminLoginForm as AdminLoginForm
+from .avatar_form import AvatarForm as AvatarForm
+from .avatar_form import DefaultAvatarForm as DefaultAvatarForm
@@ -0,0 +1,14 @@
+from flask_wtf import FlaskForm
+from wtforms import FileField, SubmitField
+from wtforms.validators import DataRequired
+
+
+class AvatarForm(FlaskForm):
+    file = FileField("Image", validators=[DataRequired()])
+    submit = SubmitField("Upload")
+
+
+class DefaultAvatarForm(FlaskForm):
+    # the chosen default is in the URL the button posts to, the form only
+    # carries the CSRF token
+    pass
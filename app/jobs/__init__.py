@@ -0,0 +1,24 @@
+from .queue import (
+    JobHandler as JobHandler,
+    JobQueue as JobQueue,
+    job_queue as job_queue,
+)
+from .maintenance import (
+    MaintenanceTask as MaintenanceTask,
+    MaintenanceRunner as MaintenanceRunner,
+    maintenance_runner as maintenance_runner,
+)
+from .thumbnails import (
+    ThumbnailHandler as ThumbnailHandler,
+    RegenerateThumbnailsTask as RegenerateThumbnailsTask,
+    PlaceholderTask as PlaceholderTask,
+)
+from .fetch import FetchHandler as FetchHandler
+from .phash import PerceptualHashTask as PerceptualHashTask
+
+job_queue.register(ThumbnailHandler())
+job_queue.register(FetchHandler())
+
+maintenance_runner.register(RegenerateThumbnailsTask())
+maintenance_runner.register(PerceptualHashTask())
+maintenance_runner.register(PlaceholderTask())
@@ -0,0 +1,39 @@
+from urllib.parse import urlsplit
+from app import conf
+from app.models import Meme
+from app.utils import UploadRejected
+from app.utils.fetch import fetch_image
+from .queue import JobHandler
+
+
+class FetchHandler(JobHandler):
+    """Downloads the original of a meme posted by URL on the dispatcher's thread pool."""
+
+    kind = "fetch"
+    io_bound = True
+    max_per_key = conf.FETCH_PER_HOST
+    # not an image or too large: the same bytes come back on a retry, while
+    # a FetchError (timeout, HTTP error) may be transient
+    permanent_errors = (UploadRejected,)
+
+    def concurrency_key(self, meme: Meme):
+        return urlsplit(meme.url).hostname
+
+    def prepare(self, meme: Meme) -> tuple:
+        return fetch_image, (
+            meme.url,
+            conf.STAGING_FOLDER,
+            conf.MAX_UPLOAD_BYTES,
+            conf.MAX_IMAGE_PIXELS,
+            conf.FETCH_CONNECT_TIMEOUT,
+            conf.FETCH_READ_TIMEOUT,
+            conf.FETCH_TOTAL_TIMEOUT,
+            Meme.normalize_policy(),
+        )
+
+    def complete(self, meme: Meme, result: dict) -> None:
+        # queues the thumbnail job, or reuses the thumbnails of a repost
+        meme.attach_fetched(result)
+
+    def fail(self, meme: Meme, error: str) -> None:
+        meme.thumbnail_status = Meme.THUMBNAIL_FAILED
@@ -0,0 +1,204 @@
+import os, time
+from concurrent.futures import (
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    as_completed,
+)
+from datetime import datetime
+from app import db
+from app.models import MaintenanceRun, Meme
+
+
+class MaintenanceTask:
+    """
+    Base class of the tasks MaintenanceRunner applies to every meme, e.g.
+    "regenerate all thumbnails".
+
+    Like JobHandler, prepare() and apply() run in the runner with an app
+    context, and the function returned by prepare() runs in a worker
+    process, so it must be a module-level function taking and returning
+    plain values.
+
+    @field name: The name the task is run by.
+    @field description: A one line description for `flask maintenance list`.
+    @field io_bound: Run the work in a thread pool instead of a process pool.
+    """
+
+    name: str = None
+    description: str = ""
+    io_bound: bool = False
+
+    def criteria(self):
+        """
+        Get the condition selecting the memes the task applies to.
+        @return: A SQL expression on Meme.
+        """
+        return db.and_(Meme.filename.isnot(None), Meme.deleted.is_(False))
+
+    def prepare(self, meme: Meme) -> tuple:
+        """
+        Get the work to run in a worker.
+        @param meme: The meme to process.
+        @return: A (function, args) tuple.
+        """
+        raise NotImplementedError
+
+    def apply(self, meme: Meme, result) -> None:
+        """
+        Store the result of the work. The runner commits.
+        @param meme: The meme processed.
+        @param result: The return value of the worker function.
+        @return: None
+        """
+        raise NotImplementedError
+
+
+class MaintenanceRunner:
+    """
+    Applies a MaintenanceTask to every meme it selects: memes are loaded in
+    keyset chunks by id, each chunk is fanned out to a worker pool, and its
+    results are committed together with the run's checkpoint, so an
+    interrupted run resumes after the last committed chunk. The memes the
+    task failed on are recorded and retried first when the run is resumed,
+    the run is only finished once none are left.
+    """
+
+    def __init__(self) -> None:
+        """
+        Instantiate an object of the class.
+        @return: None
+        """
+        self.tasks = {}
+
+    def register(self, task: MaintenanceTask) -> None:
+        """
+        Register a task under its name.
+        @param task: The task.
+        @return: None
+        """
+        self.tasks[task.name] = task
+
+    def run(
+        self,
+        name: str,
+        chunk_size: int = 200,
+        workers: int = None,
+        restart: bool = False,
+        report=print,
+    ) -> MaintenanceRun:
+        """
+        Run or resume a task.
+        @param name: The name of the task.
+        @param chunk_size: The number of memes per chunk and commit.
+        @param workers: The size of the worker pool, defaults to the CPU count.
+        @param restart: Start over even if a previous run is unfinished.
+        @param report: Called with a progress line after every chunk.
+        @return: The MaintenanceRun, unfinished if some memes failed.
+        """
+        task = self.tasks[name]
+        run = MaintenanceRun.resume(name, restart)
+        criteria = task.criteria()
+        run.forget_failures(criteria)
+        db.session.commit()
+        retries = run.failed
+        remaining = (
+            retries
+            + db.session.execute(
+                db.select(db.func.count())
+                .select_from(Meme)
+                .where(criteria, Meme.id > run.last_id)
+            ).scalar_one()
+        )
+        report(
+            f"{name}: {remaining} memes to process after meme {run.last_id}, "
+            f"{retries} of them failed before"
+        )
+        executor = ThreadPoolExecutor if task.io_bound else ProcessPoolExecutor
+        started = time.monotonic()
+        done = 0
+        with executor(max_workers=workers or os.cpu_count() or 1) as pool:
+            # first the memes that failed before, then the ones after the
+            # checkpoint; those failing now are left for the next run
+            retry_ids = [meme_id for meme_id, in db.session.execute(run.failures())]
+            for start in range(0, len(retry_ids), chunk_size):
+                memes = (
+                    Meme.query.filter(
+                        criteria, Meme.id.in_(retry_ids[start : start + chunk_size])
+                    )
+                    .order_by(Meme.id)
+                    .all()
+                )
+                done += self._checkpoint(task, pool, run, memes, None, report)
+                self._report(run, done, remaining, started, report)
+            while True:
+                memes = (
+                    Meme.query.filter(criteria, Meme.id > run.last_id)
+                    .order_by(Meme.id)
+                    .limit(chunk_size)
+                    .all()
+                )
+                if not memes:
+                    break
+                done += self._checkpoint(task, pool, run, memes, memes[-1].id, report)
+                self._report(run, done, remaining, started, report)
+        if run.failed == 0:
+            run.finished_at = datetime.utcnow()
+        db.session.commit()
+        return run
+
+    def _checkpoint(
+        self,
+        task: MaintenanceTask,
+        pool,
+        run: MaintenanceRun,
+        memes: list,
+        last_id,
+        report,
+    ) -> int:
+        """
+        Run a chunk and commit its results together with the checkpoint.
+        @return: The number of memes in the chunk.
+        """
+        processed, failed = self._run_chunk(task, pool, memes, report)
+        run.checkpoint(last_id, processed, failed)
+        db.session.commit()
+        return len(memes)
+
+    def _report(
+        self, run: MaintenanceRun, done: int, remaining: int, started: float, report
+    ) -> None:
+        """Report the progress of a run."""
+        rate = done / (time.monotonic() - started)
+        eta = (remaining - done) / rate if rate else 0
+        report(
+            f"{run.task}: {done}/{remaining} memes, {run.failed} failed, "
+            f"{rate:.1f} memes/s, ETA {eta:.0f}s (resumes after meme {run.last_id})"
+        )
+
+    def _run_chunk(self, task: MaintenanceTask, pool, memes: list, report) -> tuple:
+        """
+        Fan a chunk out to the pool and apply the results as they finish.
+        @return: A (processed, failed) tuple of meme id lists.
+        """
+        futures = {}
+        failed = []
+        for meme in memes:
+            try:
+                function, args = task.prepare(meme)
+                futures[pool.submit(function, *args)] = meme
+            except Exception as err:
+                failed.append(meme.id)
+                report(f"meme {meme.id}: {err}")
+        for future in as_completed(futures):
+            meme = futures[future]
+            try:
+                task.apply(meme, future.result())
+            except Exception as err:
+                failed.append(meme.id)
+                report(f"meme {meme.id}: {err}")
+        processed = [meme.id for meme in memes if meme.id not in failed]
+        return processed, failed
+
+
+# the process-wide runner, tasks are registered in app.jobs
+maintenance_runner = MaintenanceRunner()
@@ -0,0 +1,25 @@
+from app.models import Meme
+from app.utils.phash import dhash_file, to_signed
+from .maintenance import MaintenanceTask
+
+
+def signed_dhash_file(path: str, orientation: int = 1) -> int:
+    """Compute the perceptual hash of an image file as stored in Meme.phash."""
+    return to_signed(dhash_file(path, orientation))
+
+
+class PerceptualHashTask(MaintenanceTask):
+    """Recomputes the perceptual hash of every meme, see `flask scan-duplicates`."""
+
+    name = "phash"
+    description = "Recompute the perceptual hash of every meme."
+
+    def prepare(self, meme: Meme) -> tuple:
+        # dHash only needs 9x8 pixels, so the thumbnail hashes like the original
+        if meme.thumbnail_ready() and meme.md_thumbnail_path:
+            # thumbnails are rendered upright
+            return signed_dhash_file, (meme.md_thumbnail_path,)
+        return signed_dhash_file, (meme.filepath, meme.orientation or 1)
+
+    def apply(self, meme: Meme, result: int) -> None:
+        meme.phash = result
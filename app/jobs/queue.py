@@ -0,0 +1,344 @@
+import atexit, os, threading, time
+from collections import Counter
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    wait,
+)
+from concurrent.futures.process import BrokenProcessPool
+from flask import Flask
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from app import db
+from app.models import Job, Meme
+
+
+class JobHandler:
+    """
+    Base class of the handlers that run a kind of Job.
+
+    prepare() and complete() run in the dispatcher thread with an app
+    context. The function returned by prepare() runs in a worker process,
+    so it must be a module-level function taking and returning plain values.
+
+    @field kind: The Job.kind this handler runs.
+    @field io_bound: Run the work in the dispatcher's thread pool instead of
+    the process pool, for jobs that mostly wait on the network.
+    @field max_per_key: The maximum number of jobs with the same
+    concurrency_key running at once in a dispatcher, None for no limit.
+    @field permanent_errors: The exception types retrying cannot fix; the
+    job fails on the first of them instead of using up its attempts.
+    """
+
+    kind: str = None
+    io_bound: bool = False
+    max_per_key: int = None
+    permanent_errors: tuple = ()
+
+    def concurrency_key(self, meme: Meme):
+        """
+        Get the key max_per_key limits, e.g. the host a job downloads from.
+        @param meme: The meme of the job.
+        @return: The key, or None if the job is not limited.
+        """
+        return None
+
+    def prepare(self, meme: Meme) -> tuple:
+        """
+        Get the work to run in a worker process.
+        @param meme: The meme of the job.
+        @return: A (function, args) tuple.
+        """
+        raise NotImplementedError
+
+    def complete(self, meme: Meme, result) -> None:
+        """
+        Store the result of the work. The queue commits.
+        @param meme: The meme of the job.
+        @param result: The return value of the worker function.
+        @return: None
+        """
+        raise NotImplementedError
+
+    def fail(self, meme: Meme, error: str) -> None:
+        """
+        Record that the job failed for good. The queue commits.
+        @param meme: The meme of the job.
+        @param error: A description of the last error.
+        @return: None
+        """
+
+
+class JobQueue:
+    """
+    Dispatches the persistent Job rows to a process pool, or to a thread
+    pool for io_bound handlers.
+
+    The dispatcher runs in `flask run-jobs`, one per host, so web workers
+    never fork a process pool; JOB_WORKER_IN_APP runs it in the app process
+    instead, for a single-process dev server. It claims runnable jobs with
+    an atomic UPDATE, so dispatchers on several hosts can share the table.
+    Failed jobs are retried with exponential backoff.
+    """
+
+    def __init__(self) -> None:
+        """
+        Instantiate an object of the class.
+        @return: None
+        """
+        self.app = None
+        self.handlers = {}
+        self._thread = None
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+
+    def init_app(self, app: Flask) -> None:
+        """
+        Bind the queue to an app and read its configuration.
+        @param app: The app instance.
+        @return: None
+        """
+        self.app = app
+        self.max_workers = app.config["JOB_WORKERS"] or os.cpu_count() or 1
+        self.io_workers = app.config["JOB_IO_WORKERS"]
+        self.in_app = app.config["JOB_WORKER_IN_APP"]
+        self.poll_interval = app.config["JOB_POLL_INTERVAL"]
+        self.max_attempts = app.config["JOB_MAX_ATTEMPTS"]
+        self.retry_delay = app.config["JOB_RETRY_DELAY"]
+        self.stale_after = app.config["JOB_STALE_AFTER"]
+        atexit.register(self.stop)
+
+    def register(self, handler: JobHandler) -> None:
+        """
+        Register the handler of a kind of job.
+        @param handler: The handler.
+        @return: None
+        """
+        self.handlers[handler.kind] = handler
+
+    def wake(self) -> None:
+        """
+        Tell the dispatcher new jobs were queued, starting the in-app
+        dispatcher thread if it is enabled and not running yet.
+        @return: None
+        """
+        if self.in_app:
+            self.start()
+        self._wake.set()
+
+    def start(self) -> None:
+        """
+        Start the dispatcher in a daemon thread.
+        @return: None
+        """
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(
+                target=self.run, name="job-dispatcher", daemon=True
+            )
+            self._thread.start()
+
+    def stop(self, timeout: float = 5) -> None:
+        """
+        Stop the dispatcher thread, letting running jobs finish.
+        @param timeout: Seconds to wait for the thread.
+        @return: None
+        """
+        self._stop.set()
+        self._wake.set()
+        thread = self._thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout)
+
+    def run(self, until_idle: bool = False) -> int:
+        """
+        Run the dispatcher loop in the current thread.
+        @param until_idle: Return once no job is runnable or running.
+        @return: The number of jobs that finished.
+        """
+        finished = 0
+        # future -> (job id, io_bound, concurrency key)
+        running = {}
+        # jobs put back for their concurrency limit are runnable again after this
+        deferred_until = 0
+        pools = {
+            False: ProcessPoolExecutor(max_workers=self.max_workers),
+            True: ThreadPoolExecutor(
+                max_workers=self.io_workers, thread_name_prefix="job-io"
+            ),
+        }
+        try:
+            while not self._stop.is_set():
+                try:
+                    if self._submit_runnable(pools, running):
+                        deferred_until = time.monotonic() + self.poll_interval
+                except BrokenProcessPool:
+                    pools[False] = ProcessPoolExecutor(max_workers=self.max_workers)
+                except Exception as err:
+                    # e.g. the database went away; jobs claimed meanwhile are
+                    # claimed again once stale
+                    self.app.logger.exception(f"Submitting jobs failed: {err}")
+                if not running:
+                    if until_idle and time.monotonic() >= deferred_until:
+                        break
+                    self._wake.wait(self.poll_interval)
+                    self._wake.clear()
+                    continue
+                done, _ = wait(
+                    running, timeout=self.poll_interval, return_when=FIRST_COMPLETED
+                )
+                for future in done:
+                    job_id = running.pop(future)[0]
+                    try:
+                        self._finish(job_id, future)
+                    except Exception as err:
+                        # one job must not end the loop
+                        self.app.logger.exception(
+                            f"Finishing job {job_id} failed: {err}"
+                        )
+                    finished += 1
+        finally:
+            for pool in pools.values():
+                pool.shutdown(wait=True)
+        return finished
+
+    def _submit_runnable(self, pools: dict, running: dict) -> bool:
+        """
+        Claim runnable jobs for the free workers of each pool and submit their work.
+        @return: Whether a job was put back because of its concurrency limit.
+        """
+        deferred = False
+        with self.app.app_context():
+            for io_bound, pool in pools.items():
+                size = self.io_workers if io_bound else self.max_workers
+                free = size - sum(1 for task in running.values() if task[1] == io_bound)
+                kinds = [
+                    kind
+                    for kind, handler in self.handlers.items()
+                    if handler.io_bound == io_bound
+                ]
+                if free > 0 and kinds:
+                    deferred |= self._submit_kinds(pool, running, kinds, free)
+            db.session.remove()
+        return deferred
+
+    def _submit_kinds(self, pool, running: dict, kinds: list, limit: int) -> bool:
+        """
+        Claim up to limit runnable jobs of some kinds and submit their work to pool.
+        @return: Whether a job was put back because of its concurrency limit.
+        """
+        deferred = False
+        keys = Counter(task[2] for task in running.values() if task[2] is not None)
+        for job_id in Job.runnable_ids(limit, self.stale_after, kinds=kinds):
+            claimed = Job.claim(job_id, self.stale_after)
+            db.session.commit()
+            if not claimed:
+                continue
+            job = db.session.get(Job, job_id)
+            if job is None:
+                # deleted since it was claimed, e.g. by purge-deleted
+                continue
+            handler = self.handlers[job.kind]
+            try:
+                meme = self._meme(job)
+                key = handler.concurrency_key(meme)
+                if key is not None:
+                    key = (job.kind, key)
+                    if keys[key] >= handler.max_per_key:
+                        # leave the slot to other jobs and try again shortly
+                        job.defer(self.poll_interval)
+                        db.session.commit()
+                        deferred = True
+                        continue
+                fn, args = handler.prepare(meme)
+            except Exception as err:
+                self._record_error(job, err)
+                continue
+            keys[key] += 1
+            running[pool.submit(fn, *args)] = (job_id, handler.io_bound, key)
+        return deferred
+
+    def _finish(self, job_id: int, future) -> None:
+        """Store the result of a finished job, or schedule its retry."""
+        with self.app.app_context():
+            job = db.session.get(Job, job_id)
+            if job is None:
+                # deleted while it ran, e.g. by purge-deleted
+                self.app.logger.info(f"Job {job_id} was deleted, result dropped")
+                db.session.remove()
+                return
+            try:
+                self._handler(job).complete(self._meme(job), future.result())
+                job.succeed()
+                db.session.commit()
+            except Exception as err:
+                db.session.rollback()
+                self._record_error(db.session.get(Job, job_id), err)
+            db.session.remove()
+
+    def _record_error(self, job: Job, err: Exception) -> None:
+        """Retry the job later, or mark it and its meme as failed."""
+        error = f"{type(err).__name__}: {err}"
+        if job is None:
+            # deleted while it ran, there is nothing to retry
+            self.app.logger.info(f"A deleted job failed: {error}")
+            return
+        name = repr(job)
+        self.app.logger.warning(f"{name} failed: {error}")
+        handler = self.handlers.get(job.kind)
+        max_attempts = self.max_attempts
+        if handler is not None and isinstance(err, handler.permanent_errors):
+            max_attempts = 1
+        try:
+            if not job.retry_or_fail(error, max_attempts, self.retry_delay):
+                meme = db.session.get(Meme, job.meme_id)
+                if meme is not None and handler is not None:
+                    handler.fail(meme, error)
+            db.session.commit()
+        except Exception as record_err:
+            # the job stays claimed and is claimed again once stale
+            db.session.rollback()
+            self.app.logger.exception(
+                f"Recording the failure of {name} failed: {record_err}"
+            )
+
+    def _handler(self, job: Job) -> JobHandler:
+        """Get the handler of a job."""
+        handler = self.handlers.get(job.kind)
+        if handler is None:
+            raise LookupError(f"no handler for job kind {job.kind!r}")
+        return handler
+
+    def _meme(self, job: Job) -> Meme:
+        """Get the meme of a job."""
+        meme = db.session.get(Meme, job.meme_id)
+        if meme is None:
+            raise LookupError(f"meme {job.meme_id} no longer exists")
+        return meme
+
+
+job_queue = JobQueue()
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_new_jobs(session, flush_context) -> None:
+    """Remember that this transaction queued jobs."""
+    if any(isinstance(obj, Job) for obj in session.new):
+        session.info["jobs_queued"] = True
+
+
+@event.listens_for(Session, "after_commit")
+def _wake_job_queue(session) -> None:
+    """Wake the dispatcher once the queued jobs are visible to it."""
+    if session.info.pop("jobs_queued", False):
+        job_queue.wake()
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_new_jobs(session) -> None:
+    """Nothing was committed, so nothing was queued."""
+    session.info.pop("jobs_queued", None)
@@ -0,0 +1,77 @@
+from app import conf, db
+from app.models import Meme
+from app.utils.thumbnails import describe_thumbnail, render_thumbnails
+from .maintenance import MaintenanceTask
+from .queue import JobHandler
+
+
+class ThumbnailHandler(JobHandler):
+    """Renders the thumbnails of a meme in a worker process."""
+
+    kind = "thumbnails"
+
+    def prepare(self, meme: Meme) -> tuple:
+        return render_thumbnails, (
+            meme.filepath,
+            meme.filename,
+            meme.thumbnail_folder(),
+            None,
+            conf.ANIMATION_MAX_BYTES,
+            conf.ANIMATION_MAX_FRAMES,
+            meme.orientation or 1,
+        )
+
+    def complete(self, meme: Meme, result: dict) -> None:
+        meme.sm_thumbnail_path = result["paths"]["sm"]
+        meme.md_thumbnail_path = result["paths"]["md"]
+        meme.thumbnail_formats = ",".join(result["formats"])
+        meme.animated = result["animated"]
+        meme.record_placeholder(result)
+        meme.thumbnail_status = Meme.THUMBNAIL_READY
+
+    def fail(self, meme: Meme, error: str) -> None:
+        meme.thumbnail_status = Meme.THUMBNAIL_FAILED
+
+
+class RegenerateThumbnailsTask(MaintenanceTask):
+    """Renders the thumbnails of every meme again, e.g. after THUMBNAIL_VERSION changed."""
+
+    name = "thumbnails"
+    description = "Regenerate the thumbnails of every meme."
+    handler = ThumbnailHandler()
+
+    def prepare(self, meme: Meme) -> tuple:
+        return self.handler.prepare(meme)
+
+    def apply(self, meme: Meme, result: dict) -> None:
+        self.handler.complete(meme, result)
+
+
+class PlaceholderTask(MaintenanceTask):
+    """
+    Computes the placeholders of memes thumbnailed before they existed,
+    from their small thumbnail. Originals are never decoded; their header
+    is read when their dimensions were not recorded either.
+    """
+
+    name = "placeholders"
+    description = "Compute the missing placeholders from the existing thumbnails."
+
+    def criteria(self):
+        return db.and_(
+            super().criteria(),
+            Meme.thumbnail_status == Meme.THUMBNAIL_READY,
+            Meme.md_thumbnail_path.isnot(None),
+            Meme.placeholder.is_(None),
+        )
+
+    def prepare(self, meme: Meme) -> tuple:
+        known = meme.width is not None and meme.file_size is not None
+        return describe_thumbnail, (
+            meme.sm_thumbnail_path or meme.md_thumbnail_path,
+            None if known else meme.filepath,
+            meme.orientation or 1,
+        )
+
+    def apply(self, meme: Meme, result: dict) -> None:
+        meme.record_placeholder(result)
@@ -2,12 +2,50 @@
 # filename: app\models\__init__.py
 
 from .user import User as User
+from .authors import (
+    Author as Author,
+    author_cache as author_cache,
+    load_authors as load_authors,
+    get_author as get_author,
+)
 from .meme import Meme as Meme
 from .group import Group as Group
 from .comment import Comment as Comment
+from .job import Job as Job
+from .media_file import MediaFile as MediaFile
+from .maintenance_run import (
+    MaintenanceRun as MaintenanceRun,
+    maintenance_failures as maintenance_failures,
+)
+from .duplicates import (
+    DuplicateIndex as DuplicateIndex,
+    duplicate_index as duplicate_index,
+)
 from .tables import (
     group_members as group_members,
     saved_memes as saved_memes,
     seen_memes as seen_memes,
     posted_comments as posted_comments,
+    liked_memes as liked_memes,
+)
+from .purge import (
+    purge_memes as purge_memes,
+    purge_all_memes as purge_all_memes,
+    purge_expired_memes as purge_expired_memes,
+)
+from .avatars import (
+    avatar_key as avatar_key,
+    avatar_url as avatar_url,
+    default_avatars as default_avatars,
+    store_avatar as store_avatar,
+)
+from .impressions import (
+    ImpressionBuffer as ImpressionBuffer,
+    impression_buffer as impression_buffer,
+    mark_seen as mark_seen,
+)
+from .viewer_state import (
+    ViewerState as ViewerState,
+    EMPTY_VIEWER_STATE as EMPTY_VIEWER_STATE,
+    load_viewer_state as load_viewer_state,
 )
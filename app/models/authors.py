@@ -0,0 +1,80 @@
+# filename: authors.py
+# filepath: app\models\authors.py
+
+from collections import namedtuple
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+from app import db, conf
+from app.utils.cache import TTLCache
+from .user import User
+
+# the columns of a user needed to render a meme card
+Author = namedtuple("Author", ["id", "username", "profile_image"])
+
+# the user attributes that, when changed, make a cached Author stale
+_AUTHOR_FIELDS = ("username", "profile_image")
+
+# process-local cache of Author tuples keyed by user id. Entries expire after
+# AUTHOR_CACHE_TTL so other worker processes pick up profile changes, and are
+# dropped immediately in this process when such a change is committed.
+author_cache = TTLCache(conf.AUTHOR_CACHE_TTL, conf.AUTHOR_CACHE_SIZE)
+
+
+def load_authors(user_ids) -> dict:
+    """
+    Load the authors for a page of memes, using the cache and at most one
+    column-limited query (id, username, profile_image) for the misses.
+    @param user_ids: The ids of the users, e.g. Meme.posted_by of each meme.
+    @return: A dict of user id to Author.
+    """
+    user_ids = {user_id for user_id in user_ids if user_id is not None}
+    authors = author_cache.get_many(user_ids)
+    missing = user_ids - authors.keys()
+    if missing:
+        rows = db.session.execute(
+            db.select(User.id, User.username, User.profile_image).where(
+                User.id.in_(missing)
+            )
+        )
+        loaded = [Author(*row) for row in rows]
+        author_cache.put_many({author.id: author for author in loaded})
+        authors.update((author.id, author) for author in loaded)
+    return authors
+
+
+def get_author(user_id: int):
+    """
+    Get a single author.
+    @param user_id: The id of the user.
+    @return: The Author, or None if the user does not exist.
+    """
+    return load_authors([user_id]).get(user_id)
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_stale_authors(session, flush_context) -> None:
+    """Remember the users whose cached Author is stale once this commits."""
+    stale = session.info.setdefault("stale_author_ids", set())
+    for obj in session.dirty:
+        if isinstance(obj, User):
+            state = inspect(obj)
+            if any(
+                state.attrs[field].history.has_changes() for field in _AUTHOR_FIELDS
+            ):
+                stale.add(obj.id)
+    for obj in session.deleted:
+        if isinstance(obj, User):
+            stale.add(obj.id)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_stale_authors(session) -> None:
+    """Drop the cached Author of every user changed in the committed transaction."""
+    for user_id in session.info.pop("stale_author_ids", ()):
+        author_cache.invalidate(user_id)
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_stale_authors(session) -> None:
+    """Nothing was committed, so nothing became stale."""
+    session.info.pop("stale_author_ids", None)
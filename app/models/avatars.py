@@ -0,0 +1,70 @@
+# filename: avatars.py
+# filepath: app\models\avatars.py
+
+import os
+from flask import url_for
+from app import conf
+from app.utils.avatars import (
+    AvatarManifest,
+    KEY_LENGTH,
+    avatar_filename,
+    is_avatar_key,
+    render_avatar,
+)
+from app.utils.ingest import ingest_stream
+
+# the avatars of the default profile images, see User.profile_image
+default_avatars = AvatarManifest(conf.DEFAULT_AVATARS_FOLDER, conf.AVATARS_FOLDER)
+
+
+def avatar_key(user):
+    """
+    Get the avatar key of a user: the avatar they chose, or a default one
+    picked by their id.
+    @param user: A User or Author, None for a deleted author.
+    @return: The avatar key, or None if there are no default images.
+    """
+    profile_image = user.profile_image if user is not None else None
+    if is_avatar_key(profile_image):
+        return profile_image
+    defaults = default_avatars.get()
+    if profile_image in defaults:
+        # chosen by filename before avatars were keyed
+        return defaults[profile_image]
+    keys = list(defaults.values())
+    if not keys:
+        return None
+    return keys[(user.id if user is not None else 0) % len(keys)]
+
+
+def avatar_url(user, size: int = 40):
+    """
+    Get the immutable URL of a user's avatar.
+    @param user: A User or Author, None for a deleted author.
+    @param size: One of app.utils.AVATAR_SIZES.
+    @return: The URL, or None if the user has no avatar.
+    """
+    key = avatar_key(user)
+    if key is None:
+        return None
+    return url_for(
+        "routes.media", version=key, filename=f"avatars/{avatar_filename(key, size)}"
+    )
+
+
+def store_avatar(stream) -> str:
+    """
+    Render the avatar variants of an uploaded image.
+    @param stream: A readable binary file object.
+    @return: The avatar key to store in User.profile_image.
+    @raise UploadRejected: If the file is not an accepted image or too large.
+    """
+    ingested = ingest_stream(
+        stream, conf.STAGING_FOLDER, conf.MAX_UPLOAD_BYTES, conf.MAX_IMAGE_PIXELS
+    )
+    try:
+        return render_avatar(
+            ingested.path, conf.AVATARS_FOLDER, ingested.content_hash[:KEY_LENGTH]
+        )
+    finally:
+        os.remove(ingested.path)
@@ -2,7 +2,9 @@
 # filepath: app\models\comment.py
 
 from datetime import datetime
+from sqlalchemy import event
 from app import db
+from .meme import Meme
 
 
 class Comment(db.Model):
@@ -116,3 +118,22 @@ class Comment(db.Model):
         @return: The content of the comment.
         """
         return self.content
+
+
+def _bump_comment_count(connection, meme_id: int, delta: int) -> None:
+    """Adjust Meme.comment_count in the same transaction as the comment row."""
+    connection.execute(
+        db.update(Meme.__table__)
+        .where(Meme.__table__.c.id == meme_id)
+        .values(comment_count=Meme.__table__.c.comment_count + delta)
+    )
+
+
+@event.listens_for(Comment, "after_insert")
+def _comment_inserted(mapper, connection, comment: Comment) -> None:
+    _bump_comment_count(connection, comment.meme_id, 1)
+
+
+@event.listens_for(Comment, "after_delete")
+def _comment_deleted(mapper, connection, comment: Comment) -> None:
+    _bump_comment_count(connection, comment.meme_id, -1)
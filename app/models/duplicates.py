@@ -0,0 +1,220 @@
+# filename: duplicates.py
+# filepath: app\models\duplicates.py
+
+import threading, time
+from datetime import datetime, timedelta
+from itertools import chain
+from flask import Flask
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+from app import db
+from app.utils.phash import MultiIndexHash, to_unsigned
+
+# memes loaded per query while (re)building the index
+_LOAD_CHUNK_SIZE = 10000
+
+# how far back a refresh looks for changed hashes before the previous one
+# started: Meme.phash_updated_at is stamped at flush, before the commit
+_CHANGE_OVERLAP = timedelta(minutes=5)
+
+
+class DuplicateIndex:
+    """
+    Process-local near-duplicate index of the perceptual hash (Meme.phash)
+    of every meme, for "possible duplicate of" lookups without scanning
+    the meme table.
+
+    The index is built from the database once per process, in a
+    background thread when PHASH_INDEX_PRELOAD is set. Hashes committed in
+    this process are added, moved or removed right away; those committed
+    by other processes are picked up every PHASH_INDEX_REFRESH seconds by
+    loading the ids after the last one seen and the memes whose
+    phash_updated_at is recent, e.g. memes hashed by a fetch job or by
+    `flask maintenance run phash`.
+    """
+
+    def __init__(self) -> None:
+        """
+        Instantiate an object of the class.
+        @return: None
+        """
+        self.app = None
+        self.max_distance = 6
+        self.refresh_interval = 30
+        self._index = MultiIndexHash()
+        self._last_id = None
+        self._changed_since = None
+        self._refreshed_at = 0.0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        """Get the number of distinct hashes in the index."""
+        return len(self._index)
+
+    def init_app(self, app: Flask) -> None:
+        """
+        Bind the index to an app, read its configuration and start loading it.
+        @param app: The app instance.
+        @return: None
+        """
+        self.app = app
+        self.max_distance = app.config["PHASH_MAX_DISTANCE"]
+        self.refresh_interval = app.config["PHASH_INDEX_REFRESH"]
+        if app.config["PHASH_INDEX_PRELOAD"]:
+            threading.Thread(
+                target=self._preload, name="duplicate-index", daemon=True
+            ).start()
+
+    def _preload(self) -> None:
+        """Load the index in the background with its own app context."""
+        with self.app.app_context():
+            try:
+                self.refresh(force=True)
+            except Exception as err:
+                # lookups load the index themselves if this fails
+                self.app.logger.error(f"Loading the duplicate index failed: {err}")
+            finally:
+                db.session.remove()
+
+    def refresh(self, force: bool = False) -> int:
+        """
+        Load the hashes of the memes added or rehashed since the last
+        refresh, or of every meme on the first call.
+        @param force: Refresh even if PHASH_INDEX_REFRESH has not elapsed.
+        @return: The number of memes loaded.
+        """
+        from .meme import Meme
+
+        if not force and time.monotonic() - self._refreshed_at < self.refresh_interval:
+            return 0
+        with self._lock:
+            if not force and (
+                time.monotonic() - self._refreshed_at < self.refresh_interval
+            ):
+                return 0
+            started = datetime.utcnow()
+            loaded = 0
+            while True:
+                query = db.select(Meme.id, Meme.phash).where(Meme.phash.isnot(None))
+                if self._last_id is not None:
+                    query = query.where(Meme.id > self._last_id)
+                rows = db.session.execute(
+                    query.order_by(Meme.id).limit(_LOAD_CHUNK_SIZE)
+                ).all()
+                for meme_id, phash in rows:
+                    self._index.add(to_unsigned(phash), meme_id)
+                if rows:
+                    self._last_id = rows[-1][0]
+                    loaded += len(rows)
+                if len(rows) < _LOAD_CHUNK_SIZE:
+                    break
+            if self._changed_since is not None:
+                loaded += self._load_changed(self._changed_since)
+            self._changed_since = started - _CHANGE_OVERLAP
+            self._refreshed_at = time.monotonic()
+            return loaded
+
+    def _load_changed(self, since: datetime) -> int:
+        """Move, add or remove the memes whose hash was set since a time."""
+        from .meme import Meme
+
+        loaded = 0
+        last_id = 0
+        while True:
+            rows = db.session.execute(
+                db.select(Meme.id, Meme.phash)
+                .where(Meme.phash_updated_at >= since, Meme.id > last_id)
+                .order_by(Meme.id)
+                .limit(_LOAD_CHUNK_SIZE)
+            ).all()
+            for meme_id, phash in rows:
+                if phash is None:
+                    self._index.remove(meme_id)
+                else:
+                    self._index.add(to_unsigned(phash), meme_id)
+            loaded += len(rows)
+            if len(rows) < _LOAD_CHUNK_SIZE:
+                return loaded
+            last_id = rows[-1][0]
+
+    def add(self, meme_id: int, phash: int) -> None:
+        """
+        Add a committed meme to the index, or move it if its hash changed.
+        @param meme_id: The id of the meme.
+        @param phash: The Meme.phash of the meme.
+        @return: None
+        """
+        self._index.add(to_unsigned(phash), meme_id)
+
+    def remove(self, meme_id: int) -> None:
+        """
+        Remove a meme from the index, e.g. once it lost its hash or was purged.
+        @param meme_id: The id of the meme.
+        @return: None
+        """
+        self._index.remove(meme_id)
+
+    def search(self, phash: int, max_distance: int = None) -> list:
+        """
+        Find the memes whose perceptual hash is close to phash. The result
+        can include deleted memes.
+        @param phash: A Meme.phash value.
+        @param max_distance: The maximum Hamming distance, defaults to PHASH_MAX_DISTANCE.
+        @return: A list of (distance, meme id) tuples, nearest first.
+        """
+        self.refresh()
+        if max_distance is None:
+            max_distance = self.max_distance
+        return self._index.search(to_unsigned(phash), max_distance)
+
+
+# the index of the app, bound in create_app
+duplicate_index = DuplicateIndex()
+
+
+def _hash_changed(session, obj) -> bool:
+    """Check if a pending or dirty meme's phash is written by the flush."""
+    if obj in session.new:
+        return obj.phash is not None
+    return inspect(obj).attrs.phash.history.has_changes()
+
+
+@event.listens_for(Session, "before_flush")
+def _stamp_changed_hashes(session, flush_context, instances) -> None:
+    """Stamp the memes whose hash is set, for the refresh of other processes."""
+    from .meme import Meme
+
+    now = datetime.utcnow()
+    for obj in chain(session.new, session.dirty):
+        if isinstance(obj, Meme) and _hash_changed(session, obj):
+            obj.phash_updated_at = now
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_changed_hashes(session, flush_context) -> None:
+    """Remember the hashes this flush wrote or deleted until they are committed."""
+    from .meme import Meme
+
+    changed = session.info.setdefault("changed_meme_hashes", [])
+    for obj in chain(session.new, session.dirty):
+        if isinstance(obj, Meme) and _hash_changed(session, obj):
+            changed.append((obj.id, obj.phash))
+    for obj in session.deleted:
+        if isinstance(obj, Meme):
+            changed.append((obj.id, None))
+
+
+@event.listens_for(Session, "after_commit")
+def _index_changed_hashes(session) -> None:
+    """Apply the hashes of the committed transaction to the index."""
+    for meme_id, phash in session.info.pop("changed_meme_hashes", ()):
+        if phash is None:
+            duplicate_index.remove(meme_id)
+        else:
+            duplicate_index.add(meme_id, phash)
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_changed_hashes(session) -> None:
+    """Nothing was committed, so there is nothing to index."""
+    session.info.pop("changed_meme_hashes", None)
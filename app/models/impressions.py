@@ -0,0 +1,199 @@
+# filename: impressions.py
+# filepath: app\models\impressions.py
+
+import atexit, threading
+from flask import Flask
+from sqlalchemy.exc import IntegrityError
+from app import db
+from .tables import seen_memes
+from .user import User
+
+# the impressions written per INSERT ... SELECT while flushing
+_CHUNK_SIZE = 500
+
+# the attempts of a chunk that lost an insert race to another process
+_MAX_ATTEMPTS = 3
+
+
+def _chunks(values: list):
+    """Split a list into lists of at most _CHUNK_SIZE values."""
+    for start in range(0, len(values), _CHUNK_SIZE):
+        yield values[start : start + _CHUNK_SIZE]
+
+
+def mark_seen(pairs) -> int:
+    """
+    Insert the (user_id, meme_id) rows of seen_memes that are missing, in
+    bulk, skipping deleted or missing memes and users. Each chunk is a
+    single INSERT ... SELECT ... WHERE NOT EXISTS, like MediaFile.acquire.
+    Commits.
+    @param pairs: An iterable of (user_id, meme_id) tuples.
+    @return: The number of rows inserted.
+    """
+    from .meme import Meme
+
+    inserted = 0
+    for chunk in _chunks(sorted(set(pairs))):
+        source = (
+            db.select(User.id, Meme.id)
+            .join(Meme, db.tuple_(User.id, Meme.id).in_(chunk))
+            .where(
+                # narrow both sides by index before matching the pairs
+                User.id.in_({user_id for user_id, _ in chunk}),
+                Meme.id.in_({meme_id for _, meme_id in chunk}),
+                Meme.deleted.is_(False),
+                ~db.exists().where(
+                    seen_memes.c.user_id == User.id, seen_memes.c.meme_id == Meme.id
+                ),
+            )
+        )
+        for attempt in range(_MAX_ATTEMPTS):
+            try:
+                # a savepoint, so a lost race keeps the chunks already inserted
+                with db.session.begin_nested():
+                    inserted += db.session.execute(
+                        seen_memes.insert().from_select(["user_id", "meme_id"], source)
+                    ).rowcount
+                break
+            except IntegrityError:
+                # another process inserted some of the rows first; they are
+                # visible now, so the next attempt skips them
+                if attempt == _MAX_ATTEMPTS - 1:
+                    raise
+    db.session.commit()
+    return inserted
+
+
+class ImpressionBuffer:
+    """
+    Write-behind buffer of the memes users have seen, fed in batches by
+    the feed. Impressions are deduplicated in a bounded in-process set and
+    written with mark_seen every SEEN_FLUSH_INTERVAL seconds by a daemon
+    thread, when the buffer is full, and when the process exits.
+
+    With SEEN_DURABILITY set to "sync", impressions are written before
+    the request returns instead; with the default "buffered", a crash
+    loses at most the impressions of the last interval.
+    """
+
+    def __init__(self) -> None:
+        """
+        Instantiate an object of the class.
+        @return: None
+        """
+        self.app = None
+        self.max_size = 10000
+        self.flush_interval = 5.0
+        self.sync = False
+        self._pending = set()
+        self._thread = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        # serializes flushes, so rows are not inserted twice in one process
+        self._flush_lock = threading.Lock()
+
+    def init_app(self, app: Flask) -> None:
+        """
+        Bind the buffer to an app and read its configuration.
+        @param app: The app instance.
+        @return: None
+        """
+        self.app = app
+        self.max_size = app.config["SEEN_BUFFER_SIZE"]
+        self.flush_interval = app.config["SEEN_FLUSH_INTERVAL"]
+        self.sync = app.config["SEEN_DURABILITY"] == "sync"
+        atexit.register(self.stop)
+
+    def record(self, user_id: int, meme_ids) -> int:
+        """
+        Record that a user has seen memes.
+        @param user_id: The id of the user.
+        @param meme_ids: The ids of the memes.
+        @return: The number of impressions accepted, duplicates excluded.
+        """
+        pairs = {(user_id, meme_id) for meme_id in meme_ids}
+        if self.sync:
+            with self._flush_lock:
+                mark_seen(pairs)
+            return len(pairs)
+        with self._lock:
+            pairs -= self._pending
+            self._pending |= pairs
+            full = len(self._pending) >= self.max_size
+        if full:
+            # the request that filled the buffer pays for writing it
+            self.flush()
+        else:
+            self.start()
+        return len(pairs)
+
+    def pending(self) -> int:
+        """Get the number of impressions not written yet."""
+        return len(self._pending)
+
+    def flush(self) -> int:
+        """
+        Write the buffered impressions. If the write fails, they are kept
+        for the next flush, as far as the buffer has room.
+        @return: The number of rows inserted.
+        """
+        with self._flush_lock:
+            with self._lock:
+                pairs, self._pending = self._pending, set()
+            if not pairs:
+                return 0
+            try:
+                return mark_seen(pairs)
+            except Exception as err:
+                db.session.rollback()
+                with self._lock:
+                    room = self.max_size - len(self._pending)
+                    self._pending |= set(list(pairs)[: max(room, 0)])
+                self.app.logger.error(f"Writing seen impressions failed: {err}")
+                return 0
+
+    def start(self) -> None:
+        """
+        Start the flushing thread if it is not running yet.
+        @return: None
+        """
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(
+                target=self.run, name="impression-flusher", daemon=True
+            )
+            self._thread.start()
+
+    def run(self) -> None:
+        """Flush every flush_interval seconds until stopped."""
+        while not self._stop.wait(self.flush_interval):
+            self._flush_in_context()
+
+    def stop(self, timeout: float = 5) -> None:
+        """
+        Stop the flushing thread and write what is left.
+        @param timeout: Seconds to wait for the thread.
+        @return: None
+        """
+        self._stop.set()
+        thread = self._thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout)
+        if self._pending and self.app is not None:
+            self._flush_in_context()
+
+    def _flush_in_context(self) -> None:
+        """Flush with an app context of its own, outside of any request."""
+        with self.app.app_context():
+            try:
+                self.flush()
+            finally:
+                db.session.remove()
+
+
+# the buffer of the app, bound in create_app
+impression_buffer = ImpressionBuffer()
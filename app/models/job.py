@@ -0,0 +1,156 @@
+# filename: job.py
+# filepath: app\models\job.py
+
+from datetime import datetime, timedelta
+from app import db
+
+
+class Job(db.Model):
+    """
+    A row of the persistent background job queue, see app.jobs.
+
+    @field id: The id of the job.
+    @field kind: The handler that runs the job, e.g. "thumbnails".
+    @field meme_id: The meme the job works on.
+    @field status: pending, running, done or failed.
+    @field attempts: The number of times the job was started.
+    @field last_error: The error of the last failed attempt.
+    @field run_after: The job is not started before this time.
+    @field created_at: The date the job was queued.
+    @field updated_at: The date the job last changed state.
+    """
+
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
+    id: int = db.Column(db.Integer, primary_key=True)
+    kind: str = db.Column(db.String(50), nullable=False)
+    meme_id: int = db.Column(
+        db.Integer, db.ForeignKey("meme.id", ondelete="CASCADE"), nullable=False
+    )
+    status: str = db.Column(db.String(20), nullable=False, default=PENDING)
+    attempts: int = db.Column(db.Integer, nullable=False, default=0)
+    last_error: str = db.Column(db.String(1000), nullable=True, default=None)
+    run_after: datetime = db.Column(
+        db.DateTime, nullable=False, default=datetime.utcnow
+    )
+    created_at: datetime = db.Column(
+        db.DateTime, nullable=False, default=datetime.utcnow
+    )
+    updated_at: datetime = db.Column(
+        db.DateTime, nullable=False, default=datetime.utcnow
+    )
+
+    # the dispatcher polls for runnable jobs by status and run_after
+    __table_args__ = (db.Index("ix_job_runnable", "status", "run_after"),)
+
+    def __init__(self, kind: str, meme_id: int = None) -> None:
+        """
+        Instantiate an object of the class.
+        @param kind: The handler that runs the job.
+        @param meme_id: The meme the job works on, optional when the job is
+        added through a relationship such as Meme.jobs.
+        @return: None
+        """
+        self.kind = kind
+        self.meme_id = meme_id
+        self.status = Job.PENDING
+        self.attempts = 0
+
+    def __repr__(self) -> str:
+        """Return a string representation of the object."""
+        return f"Job('{self.id}', '{self.kind}', '{self.status}')"
+
+    @classmethod
+    def runnable_ids(cls, limit: int, stale_after: int, kinds: list = None) -> list:
+        """
+        Get the ids of jobs that can be started now: pending jobs whose
+        run_after has passed, and running jobs whose worker died.
+        @param limit: The maximum number of ids.
+        @param stale_after: Seconds after which a running job is considered lost.
+        @param kinds: Only return jobs of these kinds, defaults to every kind.
+        @return: A list of job ids, oldest first.
+        """
+        now = datetime.utcnow()
+        stale = now - timedelta(seconds=stale_after)
+        query = db.select(cls.id).where(
+            db.or_(
+                db.and_(cls.status == cls.PENDING, cls.run_after <= now),
+                db.and_(cls.status == cls.RUNNING, cls.updated_at < stale),
+            )
+        )
+        if kinds is not None:
+            query = query.where(cls.kind.in_(kinds))
+        return list(
+            db.session.execute(
+                query.order_by(cls.run_after, cls.id).limit(limit)
+            ).scalars()
+        )
+
+    @classmethod
+    def claim(cls, job_id: int, stale_after: int) -> bool:
+        """
+        Atomically mark a job as running. Safe with several dispatchers:
+        only one UPDATE can match the row. The caller commits.
+        @param job_id: The id of the job.
+        @param stale_after: Seconds after which a running job is considered lost.
+        @return: Whether this caller claimed the job.
+        """
+        now = datetime.utcnow()
+        stale = now - timedelta(seconds=stale_after)
+        result = db.session.execute(
+            db.update(cls)
+            .where(
+                cls.id == job_id,
+                db.or_(
+                    db.and_(cls.status == cls.PENDING, cls.run_after <= now),
+                    db.and_(cls.status == cls.RUNNING, cls.updated_at < stale),
+                ),
+            )
+            .values(status=cls.RUNNING, attempts=cls.attempts + 1, updated_at=now)
+            .execution_options(synchronize_session=False)
+        )
+        return result.rowcount == 1
+
+    def succeed(self) -> None:
+        """
+        Mark the job as done. The caller commits.
+        @return: None
+        """
+        self.status = Job.DONE
+        self.last_error = None
+        self.updated_at = datetime.utcnow()
+
+    def defer(self, delay: float) -> None:
+        """
+        Put a claimed job back without counting the attempt, e.g. when its
+        concurrency limit is reached. The caller commits.
+        @param delay: Seconds before the job can be claimed again.
+        @return: None
+        """
+        now = datetime.utcnow()
+        self.status = Job.PENDING
+        self.attempts -= 1
+        self.run_after = now + timedelta(seconds=delay)
+        self.updated_at = now
+
+    def retry_or_fail(self, error: str, max_attempts: int, retry_delay: int) -> bool:
+        """
+        Schedule another attempt with exponential backoff, or mark the job
+        as failed once max_attempts is reached. The caller commits.
+        @param error: A description of the error.
+        @param max_attempts: The number of attempts before giving up.
+        @param retry_delay: The delay in seconds before the first retry.
+        @return: True if the job will be retried, False if it failed for good.
+        """
+        now = datetime.utcnow()
+        self.last_error = error[:1000]
+        self.updated_at = now
+        if self.attempts >= max_attempts:
+            self.status = Job.FAILED
+            return False
+        self.status = Job.PENDING
+        self.run_after = now + timedelta(seconds=retry_delay * 2 ** (self.attempts - 1))
+        return True
@@ -0,0 +1,127 @@
+# filename: maintenance_run.py
+# filepath: app\models\maintenance_run.py
+
+from datetime import datetime
+from app import db
+from .meme import Meme
+
+# the memes a maintenance run failed on, retried when the run is resumed
+maintenance_failures = db.Table(
+    "maintenance_failures",
+    db.Column(
+        "task", db.String(50), db.ForeignKey("maintenance_run.task"), primary_key=True
+    ),
+    db.Column("meme_id", db.Integer, primary_key=True),
+)
+
+
+class MaintenanceRun(db.Model):
+    """
+    The checkpoint of a maintenance task, see app.jobs.MaintenanceRunner.
+    It is committed together with each chunk of results, so an interrupted
+    run resumes after the last committed meme. The memes the task failed
+    on are recorded in maintenance_failures and retried on resume; a run
+    is finished once every meme is processed and none of them failed.
+
+    @field task: The name of the maintenance task.
+    @field last_id: The id of the last meme processed.
+    @field processed: The number of memes processed.
+    @field failed: The number of memes the task failed on and has yet to retry.
+    @field started_at: The date the run started.
+    @field updated_at: The date of the last checkpoint.
+    @field finished_at: The date the run finished, None while it is unfinished.
+    """
+
+    task: str = db.Column(db.String(50), primary_key=True)
+    last_id: int = db.Column(db.Integer, nullable=False, default=0)
+    processed: int = db.Column(db.Integer, nullable=False, default=0)
+    failed: int = db.Column(db.Integer, nullable=False, default=0)
+    started_at: datetime = db.Column(
+        db.DateTime, nullable=False, default=datetime.utcnow
+    )
+    updated_at: datetime = db.Column(
+        db.DateTime, nullable=False, default=datetime.utcnow
+    )
+    finished_at: datetime = db.Column(db.DateTime, nullable=True, default=None)
+
+    def __repr__(self) -> str:
+        """Return a string representation of the object."""
+        return f"MaintenanceRun('{self.task}', '{self.last_id}')"
+
+    @classmethod
+    def resume(cls, task: str, restart: bool = False):
+        """
+        Get the unfinished run of a task, or start a new one.
+        @param task: The name of the maintenance task.
+        @param restart: Start over even if a run is unfinished.
+        @return: The MaintenanceRun.
+        """
+        run = db.session.get(cls, task)
+        if run is None:
+            run = cls(task=task)
+            db.session.add(run)
+        elif restart or run.finished_at is not None:
+            db.session.execute(
+                maintenance_failures.delete().where(maintenance_failures.c.task == task)
+            )
+            run.last_id = run.processed = run.failed = 0
+            run.started_at = run.updated_at = datetime.utcnow()
+            run.finished_at = None
+        db.session.commit()
+        return run
+
+    def failures(self):
+        """
+        Get the ids of the memes the run failed on.
+        @return: A select of meme ids.
+        """
+        return db.select(maintenance_failures.c.meme_id).where(
+            maintenance_failures.c.task == self.task
+        )
+
+    def forget_failures(self, keep) -> None:
+        """
+        Stop retrying the memes the task no longer applies to, e.g. deleted ones.
+        @param keep: The SQL condition on Meme selecting the memes to keep retrying.
+        @return: None
+        """
+        db.session.execute(
+            maintenance_failures.delete().where(
+                maintenance_failures.c.task == self.task,
+                maintenance_failures.c.meme_id.not_in(db.select(Meme.id).where(keep)),
+            )
+        )
+        self._count_failures()
+
+    def checkpoint(self, last_id: int, processed: list, failed: list) -> None:
+        """
+        Record the progress of a chunk. The caller commits it together
+        with the chunk's results.
+        @param last_id: The id of the last meme of the chunk, None for a chunk of retried failures.
+        @param processed: The ids of the memes of the chunk that were processed.
+        @param failed: The ids of the memes of the chunk the task failed on.
+        @return: None
+        """
+        if last_id is not None:
+            self.last_id = last_id
+        if processed or failed:
+            db.session.execute(
+                maintenance_failures.delete().where(
+                    maintenance_failures.c.task == self.task,
+                    maintenance_failures.c.meme_id.in_(list(processed) + list(failed)),
+                )
+            )
+        if failed:
+            db.session.execute(
+                maintenance_failures.insert(),
+                [dict(task=self.task, meme_id=meme_id) for meme_id in failed],
+            )
+        self.processed += len(processed)
+        self._count_failures()
+        self.updated_at = datetime.utcnow()
+
+    def _count_failures(self) -> None:
+        """Update failed from the recorded failures."""
+        self.failed = db.session.execute(
+            db.select(db.func.count()).select_from(self.failures().subquery())
+        ).scalar_one()
@@ -0,0 +1,181 @@
+# filename: media_file.py
+# filepath: app\models\media_file.py
+
+from sqlalchemy.exc import IntegrityError
+from app import db
+
+
+class MediaFile(db.Model):
+    """
+    A content-addressed original in the uploads folder, shared by every
+    meme with the same content and reference counted so the bytes (and the
+    thumbnails derived from them) are deleted with the last meme.
+
+    @field content_hash: The sha256 hex digest of the content.
+    @field filename: The filename of the original, <content_hash>.<ext>.
+    @field ref_count: The number of memes using the file.
+    """
+
+    content_hash: str = db.Column(db.String(64), primary_key=True)
+    filename: str = db.Column(db.String(200), nullable=False)
+    ref_count: int = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self) -> str:
+        """Return a string representation of the object."""
+        return f"MediaFile('{self.content_hash}', '{self.ref_count}')"
+
+    @classmethod
+    def acquire(cls, content_hash: str, filename: str) -> tuple:
+        """
+        Add a reference to a file, registering it if it is new. The caller
+        commits; a lost insert race only rolls back its own savepoint.
+        @param content_hash: The sha256 hex digest of the content.
+        @param filename: The filename to register if the file is new.
+        @return: A (filename, created) tuple; created is True if the caller
+        must move the new bytes into place under filename.
+        """
+        table = cls.__table__
+        source = db.select(
+            db.literal(content_hash), db.literal(filename), db.literal(1)
+        ).where(~db.exists().where(table.c.content_hash == content_hash))
+        try:
+            # a savepoint, so a lost race keeps the rest of the caller's
+            # transaction, e.g. the other memes of an import batch
+            with db.session.begin_nested():
+                created = db.session.execute(
+                    table.insert().from_select(
+                        ["content_hash", "filename", "ref_count"], source
+                    )
+                ).rowcount
+        except IntegrityError:
+            # a concurrent upload of the same content registered it first
+            created = 0
+        if not created:
+            db.session.execute(
+                db.update(table)
+                .where(table.c.content_hash == content_hash)
+                .values(ref_count=table.c.ref_count + 1)
+            )
+        stored = db.session.execute(
+            db.select(table.c.filename).where(table.c.content_hash == content_hash)
+        ).scalar_one()
+        return stored, bool(created)
+
+    @classmethod
+    def acquire_many(cls, files: dict) -> dict:
+        """
+        Add a reference to many files at once, e.g. for an import batch,
+        looking up the registered ones with one query. The caller commits.
+        @param files: The filename to register per content hash, if the file is new.
+        @return: A (filename, created) tuple per content hash, see MediaFile.acquire.
+        """
+        if not files:
+            return {}
+        table = cls.__table__
+        stored = dict(
+            db.session.execute(
+                db.select(table.c.content_hash, table.c.filename).where(
+                    table.c.content_hash.in_(files)
+                )
+            ).all()
+        )
+        if stored:
+            db.session.execute(
+                db.update(table)
+                .where(table.c.content_hash.in_(stored))
+                .values(ref_count=table.c.ref_count + 1)
+            )
+        acquired = {key: (filename, False) for key, filename in stored.items()}
+        new = {key: filename for key, filename in files.items() if key not in stored}
+        if new:
+            try:
+                with db.session.begin_nested():
+                    db.session.execute(
+                        table.insert(),
+                        [
+                            dict(content_hash=key, filename=filename, ref_count=1)
+                            for key, filename in new.items()
+                        ],
+                    )
+                acquired.update(
+                    (key, (filename, True)) for key, filename in new.items()
+                )
+            except IntegrityError:
+                # a concurrent upload registered some of them first
+                for key, filename in new.items():
+                    acquired[key] = cls.acquire(key, filename)
+        return acquired
+
+    @classmethod
+    def release(cls, content_hash: str) -> bool:
+        """
+        Drop a reference to a file. The caller commits, then deletes the
+        bytes if this was the last reference.
+        @param content_hash: The sha256 hex digest of the content.
+        @return: True if no meme uses the file anymore.
+        """
+        table = cls.__table__
+        db.session.execute(
+            db.update(table)
+            .where(table.c.content_hash == content_hash)
+            .values(ref_count=table.c.ref_count - 1)
+        )
+        # only the caller whose DELETE matches owns removing the bytes
+        return bool(
+            db.session.execute(
+                table.delete().where(
+                    table.c.content_hash == content_hash, table.c.ref_count <= 0
+                )
+            ).rowcount
+        )
+
+    @classmethod
+    def release_many(cls, counts: dict) -> set:
+        """
+        Drop many references at once, e.g. when purging memes in bulk. The
+        caller commits, then deletes the bytes of the released files that
+        are still unregistered, see MediaFile.registered.
+        @param counts: The number of references to drop per content hash.
+        @return: The content hashes no meme uses anymore.
+        """
+        if not counts:
+            return set()
+        table = cls.__table__
+        db.session.execute(
+            db.update(table)
+            .where(table.c.content_hash == db.bindparam("b_hash"))
+            .values(ref_count=table.c.ref_count - db.bindparam("b_count")),
+            [dict(b_hash=key, b_count=count) for key, count in counts.items()],
+        )
+        unused = db.and_(table.c.content_hash.in_(counts), table.c.ref_count <= 0)
+        released = set(
+            db.session.execute(db.select(table.c.content_hash).where(unused)).scalars()
+        )
+        db.session.execute(table.delete().where(unused))
+        return released
+
+    @classmethod
+    def registered(cls, content_hashes) -> set:
+        """
+        Get the content hashes among content_hashes that are registered.
+        @param content_hashes: The content hashes to check.
+        @return: The registered ones.
+        """
+        table = cls.__table__
+        return set(
+            db.session.execute(
+                db.select(table.c.content_hash).where(
+                    table.c.content_hash.in_(set(content_hashes))
+                )
+            ).scalars()
+        )
+
+    @classmethod
+    def is_registered(cls, content_hash: str) -> bool:
+        """
+        Check if a file is still referenced, e.g. re-acquired by a repost
+        between a release and the removal of its bytes.
+        @param content_hash: The sha256 hex digest of the content.
+        @return: Whether the file is registered.
+        """
+        return db.session.get(cls, content_hash) is not None
@@ -1,18 +1,52 @@
 # filename: meme.py
 # filepath: app\models\meme.py
 
+import glob
 import pathlib
 from PIL import Image
 from app import db
 from datetime import datetime
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Mapped
-import os, requests, uuid
-from io import BytesIO
+import os
+from flask import url_for
 from werkzeug.datastructures import FileStorage
 from app import conf
+from app.utils.feed import FeedPage, get_feed_page
+from app.utils.fetch import check_url
+from app.utils.ingest import ingest_stream, prepare_original, stored_format
+from app.utils.metadata import ORIENTATION_TAG
+from app.utils.normalize import NormalizePolicy
+from app.utils.phash import dhash_file, to_signed
+from app.utils.thumbnails import (
+    THUMBNAIL_SIZES,
+    THUMBNAIL_VERSION,
+    alternative_formats,
+    animated_thumbnail_filename,
+    fit_size,
+    make_thumbnail,
+    thumbnail_filename,
+)
+from app.utils.storage import (
+    content_filename,
+    is_sharded,
+    locate_original,
+    remove_files,
+    shard_dir,
+    sharded_folder,
+    thumbnail_paths,
+    variant_filenames,
+)
 from . import User
+from .authors import get_author
+from .viewer_state import load_viewer_state
+from .impressions import impression_buffer
+from .job import Job
+from .media_file import MediaFile
+from .duplicates import duplicate_index
 
 _upload_folder = conf.UPLOADS_FOLDER
+_staging_folder = conf.STAGING_FOLDER
 _thumb_folder = conf.THUMBNAILS_FOLDER
 _static_folder = os.path.join(os.environ.get("PROJECT_ROOT"), "app", "static")
 
@@ -22,6 +56,7 @@ class Meme(db.Model):
     @field id: The id of the meme.
     @field date_posted: The date the meme was posted.
     @field posted_by: The user who posted the meme.
+    @field author: The User who posted the meme.
     @field url: The URL of the meme.
     @field filename: The filename of the meme.
     @field filepath: The filepath of the meme.
@@ -29,12 +64,34 @@ class Meme(db.Model):
     @field md_thumbnail_path: The filepath of the medium thumbnail of the meme.
     @field lg_thumbnail_path: The filepath of the large thumbnail of the meme.
     @field deleted: Whether the meme is deleted.
+    @field deleted_at: When the meme was soft-deleted; it is purged a retention window later.
     @field private: Whether the meme is private.
     @field group_id: The id of the group the meme is in.
     @field seen_by: The users who have seen the meme.
     @field comments: The comments on the meme.
+    @field like_count: The number of users who liked the meme.
+    @field save_count: The number of users who saved the meme.
+    @field comment_count: The number of comments on the meme.
+    @field thumbnail_status: pending until the thumbnail job ran, then ready or failed.
+    @field jobs: The background jobs queued for the meme.
+    @field thumbnail_formats: Comma separated modern formats the thumbnails also exist in, e.g. "avif,webp".
+    @field content_hash: The sha256 of the original, shared with reposts through MediaFile.
+    @field orientation: The EXIF orientation of the original (1 to 8), applied by the thumbnailer.
+    @field width: The width of the stored original as displayed, i.e. after its orientation.
+    @field height: The height of the stored original as displayed.
+    @field file_size: The size of the stored original in bytes.
+    @field dominant_color: The most common color of the meme as #rrggbb, shown until its thumbnail loads.
+    @field placeholder: A data URI of a tiny, blurry copy of the meme, shown until its thumbnail loads.
+    @field animated: Whether the original is animated and has an animated WebP variant.
+    @field phash: The 64 bit perceptual hash (dHash) of the original, stored signed.
+    @field phash_updated_at: When phash was last set, so every process can update its duplicate index.
+    @field duplicate_of_id: The id of an older meme this one looked like a repost of when posted.
     """
 
+    THUMBNAIL_PENDING = "pending"
+    THUMBNAIL_READY = "ready"
+    THUMBNAIL_FAILED = "failed"
+
     id: int = db.Column(db.Integer, primary_key=True)
     date_posted: datetime = db.Column(
         db.DateTime, nullable=False, default=datetime.utcnow
@@ -45,81 +102,444 @@ class Meme(db.Model):
         nullable=True,
         default=None,
     )
+    author: Mapped["User"] = db.relationship("User", back_populates="memes")
     url: str = db.Column(db.String(200), nullable=True, default=None)
     filename: str = db.Column(db.String(200), nullable=True, default=None)
     filepath: str = db.Column(db.String(200), nullable=True, default=None)
     sm_thumbnail_path = db.Column(db.String(200), nullable=True, default=None)
     md_thumbnail_path = db.Column(db.String(200), nullable=True, default=None)
     deleted: bool = db.Column(db.Boolean, nullable=False, default=False)
+    # None for memes deleted before it was tracked, see purge_expired_memes
+    deleted_at: datetime = db.Column(db.DateTime, nullable=True, default=None)
     private: bool = db.Column(db.Boolean, nullable=False, default=False)
     group_id: int = db.Column(db.Integer, db.ForeignKey("group.id"), nullable=True)
     seen_by: Mapped[list] = db.relationship(
         "User",
         secondary="seen_memes",
-        lazy="subquery",
-        backref=db.backref("seen_memes", lazy=True),
+        lazy="dynamic",
+        backref=db.backref("seen_memes", lazy="dynamic"),
     )
     comments: Mapped[list] = db.relationship(
         "Comment", backref="meme", lazy=True, cascade="all, delete-orphan"
     )
+    # denormalized counters, kept in step with liked_memes, saved_memes and
+    # Comment in the same transaction; see Meme.reconcile_counters
+    like_count: int = db.Column(
+        db.Integer, nullable=False, default=0, server_default="0"
+    )
+    save_count: int = db.Column(
+        db.Integer, nullable=False, default=0, server_default="0"
+    )
+    comment_count: int = db.Column(
+        db.Integer, nullable=False, default=0, server_default="0"
+    )
+    # rows created before the job queue already have their thumbnails
+    thumbnail_status: str = db.Column(
+        db.String(20), nullable=False, default="pending", server_default="ready"
+    )
+    thumbnail_formats: str = db.Column(db.String(50), nullable=True, default=None)
+    # read from the stored original, which keeps only this EXIF tag
+    orientation: int = db.Column(
+        db.SmallInteger, nullable=False, default=1, server_default="1"
+    )
+    # None for memes stored before they were recorded
+    width: int = db.Column(db.Integer, nullable=True, default=None)
+    height: int = db.Column(db.Integer, nullable=True, default=None)
+    file_size: int = db.Column(db.Integer, nullable=True, default=None)
+    # computed with the thumbnails, see `flask maintenance run placeholders`
+    dominant_color: str = db.Column(db.String(7), nullable=True, default=None)
+    placeholder: str = db.Column(db.Text, nullable=True, default=None)
+    animated: bool = db.Column(
+        db.Boolean, nullable=False, default=False, server_default=db.false()
+    )
+    # None for memes stored before content-addressed storage
+    content_hash: str = db.Column(
+        db.String(64), nullable=True, default=None, index=True
+    )
+    # None until computed, see `flask scan-duplicates --backfill`
+    phash: int = db.Column(db.BigInteger, nullable=True, default=None)
+    # stamped on flush, see app.models.duplicates
+    phash_updated_at: datetime = db.Column(
+        db.DateTime, nullable=True, default=None, index=True
+    )
+    duplicate_of_id: int = db.Column(
+        db.Integer,
+        db.ForeignKey("meme.id", ondelete="SET NULL"),
+        nullable=True,
+        default=None,
+    )
+    jobs: Mapped[list] = db.relationship(
+        "Job",
+        backref="meme",
+        lazy=True,
+        cascade="all, delete-orphan",
+        passive_deletes=True,
+    )
 
-    def __init__(self, posted_by: int, filename: str, private: bool) -> None:
+    # serves the keyset-paginated feed, see Meme.feed_page
+    __table_args__ = (db.Index("ix_meme_feed", "deleted", "date_posted", "id"),)
+
+    def __init__(
+        self,
+        posted_by: int,
+        filename: str,
+        private: bool,
+        content_hash: str = None,
+        phash: int = None,
+        reposts: tuple = None,
+        duplicates: dict = None,
+    ) -> None:
         """
         Instantiate an object of the class.
 
         @param posted_by: The user who posted the meme.
-        @param filename: The filename of the meme.
+        @param filename: The filename of the meme, None to download it from
+        the url in a background job, see Meme.from_url.
         @param private: Whether the meme is private.
+        @param content_hash: The sha256 of the original, if content-addressed.
+        @param phash: The perceptual hash of the original, if already computed.
+        @param reposts: See Meme.attach_original.
+        @param duplicates: See Meme.attach_original.
 
         @return: None
 
         """
         self.posted_by = posted_by
-        self.filename = filename
-        self.filepath = os.path.join(_upload_folder, filename)
         self.private = private
-        self.create_thumbnail("sm")
-        self.create_thumbnail("md")
+        if filename is None:
+            # the fetch job attaches the original once it is downloaded
+            self.thumbnail_status = Meme.THUMBNAIL_PENDING
+            self.jobs.append(Job("fetch"))
+        else:
+            self.attach_original(filename, content_hash, phash, reposts, duplicates)
+
+    def attach_original(
+        self,
+        filename: str,
+        content_hash: str = None,
+        phash: int = None,
+        reposts: tuple = None,
+        duplicates: dict = None,
+    ) -> None:
+        """
+        Point the meme at its stored original, then reuse the thumbnails of
+        the same content or queue the job that renders them.
+        @param filename: The filename of the original.
+        @param content_hash: The sha256 of the original, if content-addressed.
+        @param phash: The perceptual hash of the original, if already computed.
+        @param reposts: The (original, sibling) tuple Meme.find_reposts
+        returned for the content, None to look them up.
+        @param duplicates: The result of Meme.find_possible_duplicates, for
+        a batch of memes; a perceptual hash it lacks is looked up.
+        @return: None
+        """
+        self.filename = filename
+        # originals stored before sharding stay flat until `flask shard-uploads`
+        self.filepath = locate_original(_upload_folder, filename)
+        self.content_hash = content_hash
+        self.describe_original()
+        # a repost reuses the thumbnails and perceptual hash of the same content
+        original = sibling = None
+        if reposts is not None:
+            original, sibling = reposts
+        elif content_hash is not None:
+            # a fetched meme is attached after it got its id
+            older = Meme.id < self.id if self.id is not None else db.true()
+            original = (
+                Meme.query.filter_by(content_hash=content_hash, deleted=False)
+                .filter(older)
+                .order_by(Meme.id)
+                .first()
+            )
+            sibling = Meme.query.filter_by(
+                content_hash=content_hash, thumbnail_status=Meme.THUMBNAIL_READY
+            ).first()
+        self.phash = sibling.phash if sibling is not None else phash
+        if self.phash is None:
+            self.phash = Meme.compute_phash(self.filepath, self.orientation)
+        if original is not None:
+            self.duplicate_of_id = original.id
+        elif duplicates is not None and self.phash in duplicates:
+            self.duplicate_of_id = duplicates[self.phash]
+        else:
+            self.duplicate_of_id = Meme.find_possible_duplicate(
+                self.phash, before_id=self.id
+            )
+        if sibling is not None:
+            self.sm_thumbnail_path = sibling.sm_thumbnail_path
+            self.md_thumbnail_path = sibling.md_thumbnail_path
+            self.thumbnail_formats = sibling.thumbnail_formats
+            self.animated = sibling.animated
+            self.dominant_color = sibling.dominant_color
+            self.placeholder = sibling.placeholder
+            self.thumbnail_status = Meme.THUMBNAIL_READY
+        else:
+            # thumbnails are rendered by the job queue once this meme is committed
+            self.thumbnail_status = Meme.THUMBNAIL_PENDING
+            self.jobs.append(Job("thumbnails"))
 
     def __repr__(self) -> str:
         """Return a string representation of the object."""
         return f"Meme('{self.id}', '{self.filename}')"
 
+    def describe_original(self) -> None:
+        """
+        Record the orientation, dimensions and size of the stored original,
+        reading only its header.
+        @return: None
+        """
+        try:
+            self.file_size = os.path.getsize(self.filepath)
+            with Image.open(self.filepath) as img:
+                width, height = img.size
+                orientation = img.getexif().get(ORIENTATION_TAG, 1)
+        except OSError as err:
+            print(err)
+            return
+        self.orientation = orientation if orientation in range(1, 9) else 1
+        if self.orientation in (5, 6, 7, 8):
+            width, height = height, width
+        self.width, self.height = width, height
+
+    @staticmethod
+    def normalize_policy() -> NormalizePolicy:
+        """Get the policy originals are stored under, see the NORMALIZE_* settings."""
+        return NormalizePolicy(
+            conf.NORMALIZE_MAX_EDGE,
+            conf.NORMALIZE_FORMAT if conf.NORMALIZE_FORMAT != "ORIGINAL" else None,
+            conf.NORMALIZE_QUALITIES,
+            conf.NORMALIZE_MAX_BYTES,
+            conf.PRISTINE_FOLDER if conf.KEEP_PRISTINE else None,
+        )
+
+    def record_placeholder(self, result: dict) -> None:
+        """
+        Store the placeholder computed with the thumbnails, and the
+        dimensions and size of the original if they were read too.
+        @param result: The dict returned by render_thumbnails or describe_thumbnail.
+        @return: None
+        """
+        self.dominant_color = result["color"]
+        self.placeholder = result["placeholder"]
+        if "size" in result:
+            self.width, self.height = result["size"]
+        if "file_size" in result:
+            self.file_size = result["file_size"]
+
+    def thumb_size(self, size_type: str = "md"):
+        """Get the (width, height) of a thumbnail, None if the dimensions are unknown."""
+        if not self.width or not self.height:
+            return None
+        return fit_size((self.width, self.height), THUMBNAIL_SIZES[size_type])
+
     def create_thumbnail(self, size_type="md") -> bool:
-        """Create thumbnails of the meme with different sizes."""
-        # Sizes mapping
-        size_mapping = {"sm": (309, 309), "md": (468, 468)}
-        size = size_mapping.get(size_type)
+        """Create a thumbnail of the meme synchronously, see app.jobs for the queued path."""
         try:
-            img = Image.open(self.filepath)
-            img.thumbnail(size)
-            thumb_filename = f"{size_type}_thumbnail_{self.filename}"
-            thumb_path = os.path.join(_thumb_folder, thumb_filename)
-            img.save(thumb_path)
+            thumb_path = make_thumbnail(
+                self.filepath,
+                self.filename,
+                self.thumbnail_folder(),
+                size_type,
+                self.orientation or 1,
+            )
             setattr(self, f"{size_type}_thumbnail_path", thumb_path)
             return True
         except Exception as err:
             print(err)
             return False
 
-    def render_sm_thumb(self):
-        return f"uploads/thumbnails/sm_thumbnail_{self.filename}"
+    @staticmethod
+    def compute_phash(path: str, orientation: int = 1):
+        """
+        Compute the perceptual hash of an image file, upright.
+        @param path: The path of the image, e.g. the original or a thumbnail.
+        @param orientation: The EXIF orientation of the image, 1 for thumbnails.
+        @return: The hash as stored in Meme.phash, or None if the file is not a readable image.
+        """
+        try:
+            return to_signed(dhash_file(path, orientation))
+        except (OSError, ValueError) as err:
+            print(err)
+            return None
 
-    def render_md_thumb(self):
-        return f"uploads/thumbnails/md_thumbnail_{self.filename}"
+    @classmethod
+    def find_possible_duplicate(cls, phash: int, before_id: int = None):
+        """
+        Find the nearest older meme that looks like the same image.
+        @param phash: The Meme.phash to look up, may be None.
+        @param before_id: Only consider memes with a lower id, e.g. the id
+        of the meme being checked; None for any meme.
+        @return: The id of the nearest meme that is not deleted, or None.
+        """
+        if phash is None:
+            return None
+        matches = [
+            meme_id
+            for _, meme_id in duplicate_index.search(phash)
+            if before_id is None or meme_id < before_id
+        ]
+        if not matches:
+            return None
+        # the index also holds deleted memes; keep the nearest live match
+        live = set(
+            db.session.execute(
+                db.select(cls.id).where(cls.id.in_(matches), cls.deleted.is_(False))
+            ).scalars()
+        )
+        return next((meme_id for meme_id in matches if meme_id in live), None)
+
+    @classmethod
+    def find_possible_duplicates(cls, phashes) -> dict:
+        """
+        Find the nearest meme that looks like each of many images, checking
+        which matches are live with one query, e.g. for an import batch.
+        @param phashes: The Meme.phash values to look up, None is skipped.
+        @return: The id of the nearest meme that is not deleted, or None,
+        per perceptual hash.
+        """
+        matches = {
+            phash: [meme_id for _, meme_id in duplicate_index.search(phash)]
+            for phash in set(phashes) - {None}
+        }
+        candidates = {meme_id for ids in matches.values() for meme_id in ids}
+        live = set()
+        if candidates:
+            live = set(
+                db.session.execute(
+                    db.select(cls.id).where(
+                        cls.id.in_(candidates), cls.deleted.is_(False)
+                    )
+                ).scalars()
+            )
+        return {
+            phash: next((meme_id for meme_id in ids if meme_id in live), None)
+            for phash, ids in matches.items()
+        }
+
+    @classmethod
+    def find_reposts(cls, content_hashes) -> dict:
+        """
+        Look up the memes that already have the content of many new memes,
+        with one query, e.g. for an import batch.
+        @param content_hashes: The content hashes of the new memes.
+        @return: An (original, sibling) tuple per content hash: the oldest
+        live meme with the content, and one whose thumbnails are ready.
+        Either may be None.
+        """
+        reposts = {content_hash: (None, None) for content_hash in content_hashes}
+        if not reposts:
+            return reposts
+        memes = (
+            cls.query.filter(
+                cls.content_hash.in_(reposts),
+                db.or_(
+                    cls.deleted.is_(False),
+                    cls.thumbnail_status == cls.THUMBNAIL_READY,
+                ),
+            )
+            .order_by(cls.id)
+            .all()
+        )
+        for meme in memes:
+            original, sibling = reposts[meme.content_hash]
+            if original is None and not meme.deleted:
+                original = meme
+            if sibling is None and meme.thumbnail_status == cls.THUMBNAIL_READY:
+                sibling = meme
+            reposts[meme.content_hash] = (original, sibling)
+        return reposts
+
+    def thumbnail_folder(self) -> str:
+        """Get the folder the thumbnails of the meme are, or will be, stored in."""
+        if self.md_thumbnail_path:
+            return os.path.dirname(self.md_thumbnail_path)
+        return sharded_folder(_thumb_folder, self.filename)
+
+    def _relative_dir(self, path: str) -> str:
+        """Get the shard prefix of a stored path, empty for the flat layout."""
+        if path and is_sharded(path, self.filename):
+            return shard_dir(self.filename) + "/"
+        return ""
+
+    def upload_path(self) -> str:
+        """Get the path of the original relative to the uploads folder."""
+        return self._relative_dir(self.filepath) + self.filename
+
+    def thumbnail_upload_path(self, size_type: str, fmt: str = None) -> str:
+        """Get the path of a thumbnail relative to the uploads folder."""
+        name = thumbnail_filename(size_type, self.filename, fmt)
+        return f"thumbnails/{self._relative_dir(self.md_thumbnail_path)}{name}"
+
+    def thumbnail_ready(self) -> bool:
+        """Check if the thumbnails of the meme can be served."""
+        return self.thumbnail_status == Meme.THUMBNAIL_READY
+
+    def get_thumbnail_formats(self) -> list:
+        """
+        Get the modern formats the thumbnails exist in, best first, but the
+        original's own, whose thumbnails are the legacy ones.
+        """
+        if not self.thumbnail_formats:
+            return []
+        return alternative_formats(self.filename, self.thumbnail_formats.split(","))
+
+    def render_thumb(self, size_type: str, fmt: str = None) -> str:
+        """Get the static path of a thumbnail, in a modern format if fmt is given."""
+        return f"uploads/{self.thumbnail_upload_path(size_type, fmt)}"
+
+    def render_sm_thumb(self, fmt: str = None):
+        return self.render_thumb("sm", fmt)
+
+    def render_md_thumb(self, fmt: str = None):
+        return self.render_thumb("md", fmt)
 
     def render_full(self):
-        return f"uploads/{self.filename}"
+        return f"uploads/{self.upload_path()}"
+
+    def media_version(self) -> str:
+        """Get the version segment of the meme's media URLs, which changes with its content."""
+        if self.content_hash is not None:
+            return self.content_hash[:16]
+        # files stored before content addressing are never rewritten
+        return f"{self.id}-{int(self.date_posted.timestamp())}"
+
+    def media_url(self, filename: str, version: str = None) -> str:
+        """
+        Get the immutable URL of a file in the uploads folder.
+        @param filename: The path of the file relative to the uploads folder.
+        @param version: The version segment, defaults to Meme.media_version.
+        @return: The URL.
+        """
+        return url_for(
+            "routes.media", version=version or self.media_version(), filename=filename
+        )
+
+    def thumb_url(self, size_type: str, fmt: str = None) -> str:
+        """Get the immutable URL of a thumbnail, in a modern format if fmt is given."""
+        return self.media_url(
+            self.thumbnail_upload_path(size_type, fmt),
+            version=f"{self.media_version()}-t{THUMBNAIL_VERSION}",
+        )
+
+    def animation_url(self) -> str:
+        """Get the immutable URL of the animated WebP variant, see Meme.animated."""
+        relative_dir = self._relative_dir(self.md_thumbnail_path)
+        return self.media_url(
+            f"thumbnails/{relative_dir}{animated_thumbnail_filename(self.filename)}",
+            version=f"{self.media_version()}-t{THUMBNAIL_VERSION}",
+        )
+
+    def full_url(self) -> str:
+        """Get the immutable URL of the original."""
+        return self.media_url(self.upload_path())
 
     def check_seen_by_user(self, user_id: int) -> bool:
         """Check if a user has seen the meme."""
-        return user_id in [user.id for user in self.seen_by]
+        return load_viewer_state(user_id, [self.id])[self.id].seen
 
     def seen_by_user(self, user_id: int) -> None:
-        """Add a user to the list of users who have seen the meme."""
-        if not self.check_seen_by_user(user_id):
-            self.seen_by.append(user_id)
-            self.save()
+        """Record that a user has seen the meme, see ImpressionBuffer."""
+        impression_buffer.record(user_id, [self.id])
 
     def get_comments(self):
         """Return the comments on the meme."""
@@ -131,9 +551,18 @@ class Meme(db.Model):
         db.session.commit()
 
     def delete(self) -> None:
-        """Delete the meme from the database."""
+        """Delete the meme from the database, and its files if not shared."""
+        content_hash = self.content_hash
+        paths = self.release_files()
         db.session.delete(self)
         db.session.commit()
+        Meme.remove_released_files(content_hash, paths)
+
+    def soft_delete(self) -> None:
+        """Hide the meme; it and its files are purged later, see purge_expired_memes."""
+        self.deleted = True
+        self.deleted_at = datetime.utcnow()
+        db.session.commit()
 
     def get_id(self) -> int:
         """Get the id of the meme."""
@@ -181,66 +610,322 @@ class Meme(db.Model):
 
     def get_username(self) -> str:
         """Get the username of the user who posted the meme."""
-        return User.query.get(self.posted_by).get_username()
+        author = get_author(self.posted_by)
+        return author.username if author else None
 
     @classmethod
-    def from_url(cls, url: str, posted_by: int, private: bool):
-        """Create a meme from a URL."""
-        # Download the image from the URL
-        response = requests.get(url)
-        if response.status_code != 200:
-            print(f"Failed to download image from {url}")
-            return None
-
-        # Open the image with PIL to remove EXIF data
-        img = Image.open(BytesIO(response.content))
-
-        # Generate a unique filename
-        unique_filename = str(uuid.uuid4()) + ".png"
+    def feed_page(cls, cursor: str = None, per_page: int = None) -> FeedPage:
+        """
+        Get one page of the feed, newest first.
+        @param cursor: The cursor of the page to load, None for the first page.
+        @param per_page: The number of memes per page, defaults to FEED_PAGE_SIZE.
+        @return: A FeedPage with the memes and the cursor of the next page.
+        """
+        return get_feed_page(
+            cls.query.filter_by(deleted=False),
+            cls,
+            cursor=cursor,
+            per_page=per_page or conf.FEED_PAGE_SIZE,
+        )
 
-        # Create the full file path
-        filepath = os.path.join(_upload_folder, unique_filename)
+    @classmethod
+    def _store_original(cls, temp_path: str, content_hash: str, ext: str, save) -> str:
+        """
+        Register a content-addressed original and move it into place, or
+        drop the temp file if the same content is already stored.
+        @param temp_path: The temp file holding the content.
+        @param content_hash: The sha256 of the content.
+        @param ext: The extension of the stored original.
+        @param save: Called with (temp_path, final_path) to write a new original.
+        @return: The filename of the stored original.
+        """
+        filename, created = MediaFile.acquire(
+            content_hash, content_filename(content_hash, ext)
+        )
+        cls._place_original(temp_path, filename, created, save)
+        return filename
+
+    @staticmethod
+    def _place_original(temp_path: str, filename: str, created: bool, save) -> None:
+        """
+        Move a new original into place, or drop the temp file of a stored one.
+        @param temp_path: The temp file holding the content.
+        @param filename: The filename of the original.
+        @param created: Whether the original is new, see MediaFile.acquire.
+        @param save: Called with (temp_path, final_path) to write a new original.
+        @return: None
+        """
+        if created:
+            folder = sharded_folder(_upload_folder, filename, create=True)
+            save(temp_path, os.path.join(folder, filename))
+        else:
+            os.remove(temp_path)
 
-        # Save the original image
-        img.save(filepath)
+    @classmethod
+    def from_url(cls, url: str, posted_by: int, private: bool):
+        """
+        Create a meme from a URL. The image is downloaded by a fetch job
+        once the meme is committed, see app.jobs.FetchHandler.
+        @raise UploadRejected: If the URL is not an http(s) URL.
+        """
+        check_url(url)
+        meme = cls(posted_by, None, private)
+        meme.url = url
+        return meme
 
-        # Create a Meme object with the downloaded image and thumbnails
-        meme = cls(posted_by, unique_filename, private)
+    def attach_fetched(self, result: dict) -> None:
+        """
+        Store the original downloaded by the fetch job. The caller commits.
+        @param result: The dict returned by app.utils.fetch_image.
+        @return: None
+        """
+        filename = Meme._store_original(
+            result["path"], result["content_hash"], result["ext"], os.replace
+        )
+        self.attach_original(filename, result["content_hash"])
 
-        return meme
+    @classmethod
+    def from_ingested(
+        cls,
+        ingested: dict,
+        posted_by: int,
+        private: bool,
+        stored: tuple = None,
+        reposts: tuple = None,
+        duplicates: dict = None,
+    ):
+        """
+        Create a meme from a local image a worker already ingested, e.g. by
+        `flask import-memes`. A batch passes what it looked up for all its
+        memes at once, so creating each one runs no query.
+        @param ingested: The dict returned by app.utils.ingest_file.
+        @param stored: The (filename, created) tuple MediaFile.acquire_many
+        returned for the content, None to acquire the file here.
+        @param reposts: See Meme.attach_original.
+        @param duplicates: See Meme.attach_original.
+        """
+        if stored is None:
+            filename = cls._store_original(
+                ingested["path"], ingested["content_hash"], ingested["ext"], os.replace
+            )
+        else:
+            filename, created = stored
+            cls._place_original(ingested["path"], filename, created, os.replace)
+        return cls(
+            posted_by,
+            filename,
+            private,
+            content_hash=ingested["content_hash"],
+            phash=ingested["phash"],
+            reposts=reposts,
+            duplicates=duplicates,
+        )
 
     @classmethod
     def from_upload(cls, file: FileStorage, posted_by: int, private: bool):
-        """Create a meme from an uploaded file."""
-        # Generate a unique filename
-        unique_filename = str(uuid.uuid4()) + "." + file.filename.split(".")[-1]
-
-        # Create the full file path
-        filepath = os.path.join(_upload_folder, unique_filename)
+        """
+        Create a meme from an uploaded file.
+        @raise UploadRejected: If the file is not an accepted image or too large.
+        """
+        # Stream the upload to a temp file, hashing it so reposts share files
+        # and checking its format and dimensions without decoding it
+        ingested = ingest_stream(
+            file.stream, _staging_folder, conf.MAX_UPLOAD_BYTES, conf.MAX_IMAGE_PIXELS
+        )
+
+        # decided from the header, so a repost skips the re-encode
+        policy = cls.normalize_policy()
+        try:
+            target, ext = stored_format(ingested, policy)
+        except BaseException:
+            os.remove(ingested.path)
+            raise
 
-        # Save the uploaded file
-        file.save(filepath)
+        def save(temp_path, final_path):
+            try:
+                prepare_original(ingested, target, policy)
+            except BaseException:
+                os.remove(temp_path)
+                raise
+            os.replace(temp_path, final_path)
 
-        # Open the image with PIL to remove EXIF data
-        img = Image.open(filepath)
-        img.save(filepath)
+        filename = cls._store_original(ingested.path, ingested.content_hash, ext, save)
 
         # Create a Meme object with the saved image
-        meme = cls(posted_by, unique_filename, private)
-
-        return meme
+        return cls(posted_by, filename, private, content_hash=ingested.content_hash)
 
     def saved_by_user(self, user_id: int) -> bool:
         """Check if a user has saved the meme."""
-        return user_id in [user.id for user in self.saved_by]
+        return load_viewer_state(user_id, [self.id])[self.id].saved
 
     def liked_by_user(self, user_id: int) -> bool:
         """Check if a user has liked the meme."""
-        return user_id in [user.id for user in self.liked_by]
+        return load_viewer_state(user_id, [self.id])[self.id].liked
+
+    def bump_counter(self, counter: str, delta: int) -> None:
+        """
+        Add delta to one of the counters with an atomic UPDATE ... SET
+        counter = counter + delta when the session flushes.
+        @param counter: like_count, save_count or comment_count.
+        @param delta: The amount to add, negative to subtract.
+        @return: None
+        """
+        setattr(self, counter, getattr(Meme, counter) + delta)
+
+    @classmethod
+    def _set_association(
+        cls, table: db.Table, counter: str, meme_id: int, user_id: int, present: bool
+    ):
+        """
+        Idempotently add or remove the (user_id, meme_id) row of an association
+        table and adjust the matching counter only if the row changed.
+        The caller commits; a lost insert race only rolls back its savepoint.
+        @param table: liked_memes or saved_memes.
+        @param counter: The counter column kept in step with the table.
+        @param meme_id: The id of the meme.
+        @param user_id: The id of the user.
+        @param present: True to insert the row if absent, False to delete it.
+        @return: The counter value afterwards, or None if the meme does not
+        exist or is deleted.
+        """
+        row = db.and_(table.c.user_id == user_id, table.c.meme_id == meme_id)
+        if present:
+            # insert-if-absent that also skips deleted or missing memes
+            source = db.select(db.literal(user_id), cls.id).where(
+                cls.id == meme_id,
+                cls.deleted.is_(False),
+                ~db.exists().where(row),
+            )
+            statement = table.insert().from_select(["user_id", "meme_id"], source)
+            try:
+                # a savepoint, so a lost race keeps the caller's transaction
+                with db.session.begin_nested():
+                    changed = db.session.execute(statement).rowcount
+            except IntegrityError:
+                # a concurrent request inserted the same row first
+                changed = 0
+        else:
+            changed = db.session.execute(table.delete().where(row)).rowcount
+        column = getattr(cls, counter)
+        if changed:
+            db.session.execute(
+                db.update(cls)
+                .where(cls.id == meme_id)
+                .values({counter: column + (1 if present else -1)})
+                .execution_options(synchronize_session=False)
+            )
+        # None for a deleted meme too: nothing was inserted for it
+        return db.session.execute(
+            db.select(column).where(cls.id == meme_id, cls.deleted.is_(False))
+        ).scalar_one_or_none()
+
+    @classmethod
+    def set_liked(cls, meme_id: int, user_id: int, liked: bool):
+        """
+        Like or unlike a meme without loading the meme or the user.
+        @param meme_id: The id of the meme.
+        @param user_id: The id of the user.
+        @param liked: Whether the meme should be liked afterwards.
+        @return: The new like_count, or None if the meme does not exist or is deleted.
+        """
+        from .tables import liked_memes
+
+        return cls._set_association(liked_memes, "like_count", meme_id, user_id, liked)
+
+    @classmethod
+    def set_saved(cls, meme_id: int, user_id: int, saved: bool):
+        """
+        Save or unsave a meme without loading the meme or the user.
+        @param meme_id: The id of the meme.
+        @param user_id: The id of the user.
+        @param saved: Whether the meme should be saved afterwards.
+        @return: The new save_count, or None if the meme does not exist or is deleted.
+        """
+        from .tables import saved_memes
+
+        return cls._set_association(saved_memes, "save_count", meme_id, user_id, saved)
+
+    @classmethod
+    def reconcile_counters(cls, first_id: int, last_id: int) -> int:
+        """
+        Recompute like_count, save_count and comment_count from the
+        association and comment tables for a range of memes, in one
+        set-based UPDATE. The caller commits.
+        @param first_id: The first meme id of the range (inclusive).
+        @param last_id: The last meme id of the range (inclusive).
+        @return: The number of rows updated.
+        """
+        from .comment import Comment
+        from .tables import liked_memes, saved_memes
+
+        def count_of(table_column):
+            return (
+                db.select(db.func.count())
+                .where(table_column == cls.id)
+                .scalar_subquery()
+            )
+
+        result = db.session.execute(
+            db.update(cls)
+            .where(cls.id.between(first_id, last_id))
+            .values(
+                like_count=count_of(liked_memes.c.meme_id),
+                save_count=count_of(saved_memes.c.meme_id),
+                comment_count=count_of(Comment.meme_id),
+            )
+            .execution_options(synchronize_session=False)
+        )
+        return result.rowcount
+
+    def release_files(self) -> list:
+        """
+        Drop the meme's reference to its original and thumbnails. The caller
+        commits, then passes the result to Meme.remove_released_files.
+        @return: The paths to delete, empty while other memes share them.
+        """
+        if self.filename is None:
+            # the fetch job never stored an original
+            return []
+        if self.content_hash is not None and not MediaFile.release(self.content_hash):
+            return []
+        return self.file_paths()
+
+    def file_paths(self) -> list:
+        """Get every path the original and its derived files can be stored at."""
+        return [
+            self.filepath,
+            self.sm_thumbnail_path,
+            self.md_thumbnail_path,
+            *thumbnail_paths(self.thumbnail_folder(), self.filename),
+            *(
+                os.path.join(conf.IMAGE_CACHE_FOLDER, name)
+                for name in variant_filenames(self.filename, conf.IMAGE_WIDTHS)
+            ),
+            *self.pristine_paths(),
+        ]
+
+    def pristine_paths(self) -> list:
+        """Get the upload kept in cold storage before the original was normalized, if any."""
+        if self.content_hash is None:
+            return []
+        # kept under the content hash with the extension of the upload
+        folder = sharded_folder(conf.PRISTINE_FOLDER, self.filename)
+        return glob.glob(os.path.join(folder, glob.escape(self.content_hash) + ".*"))
+
+    @staticmethod
+    def remove_released_files(content_hash: str, paths: list) -> None:
+        """
+        Delete the files returned by release_files once the release is
+        committed, unless a repost registered the same content meanwhile.
+        @param content_hash: The content_hash of the released meme.
+        @param paths: The paths returned by release_files.
+        @return: None
+        """
+        if paths and content_hash is not None and MediaFile.is_registered(content_hash):
+            return
+        remove_files(paths)
 
     def delete_files(self):
-        """Delete the meme files from the filesystem."""
-        os.remove(os.path.abspath(self.filepath))
-        os.remove(os.path.abspath(self.sm_thumbnail_path))
-        os.remove(os.path.abspath(self.md_thumbnail_path))
-        os.remove(os.path.abspath(self.lg_thumbnail_path))
+        """Delete the meme files from the filesystem, unless other memes share them."""
+        content_hash = self.content_hash
+        Meme.remove_released_files(content_hash, self.release_files())
@@ -0,0 +1,123 @@
+# filename: purge.py
+# filepath: app\models\purge.py
+
+from collections import Counter
+from datetime import datetime, timedelta
+from app import conf, db
+from app.utils.storage import remove_files_later
+from .comment import Comment
+from .job import Job
+from .media_file import MediaFile
+from .meme import Meme
+from .tables import liked_memes, posted_comments, saved_memes, seen_memes
+
+
+def purge_memes(meme_ids: list) -> int:
+    """
+    Hard-delete memes with set-based statements in one transaction: their
+    likes, saves, views, comments and jobs, then the memes. Once committed,
+    the files no other meme uses are unlinked on a background thread pool.
+    @param meme_ids: The ids of the memes, e.g. one chunk of purge_all_memes.
+    @return: The number of memes deleted.
+    """
+    memes = (
+        db.session.execute(db.select(Meme).where(Meme.id.in_(meme_ids))).scalars().all()
+    )
+    if not memes:
+        return 0
+    ids = [meme.id for meme in memes]
+    stored = [meme for meme in memes if meme.filename is not None]
+    released = MediaFile.release_many(
+        Counter(meme.content_hash for meme in stored if meme.content_hash)
+    )
+    # files stored before content addressing belong to a single meme
+    paths = {}
+    for meme in stored:
+        if meme.content_hash is None or meme.content_hash in released:
+            paths.setdefault(meme.content_hash or meme.id, meme.file_paths())
+
+    comment_ids = db.select(Comment.id).where(Comment.meme_id.in_(ids))
+    db.session.execute(
+        posted_comments.delete().where(posted_comments.c.comment_id.in_(comment_ids))
+    )
+    for table in (liked_memes, saved_memes, seen_memes):
+        db.session.execute(table.delete().where(table.c.meme_id.in_(ids)))
+    for model in (Comment, Job):
+        db.session.execute(
+            db.delete(model)
+            .where(model.meme_id.in_(ids))
+            .execution_options(synchronize_session=False)
+        )
+    db.session.execute(
+        db.update(Meme)
+        .where(Meme.duplicate_of_id.in_(ids))
+        .values(duplicate_of_id=None)
+        .execution_options(synchronize_session=False)
+    )
+    # evaluated against the session, so the loaded memes are marked deleted
+    db.session.execute(db.delete(Meme).where(Meme.id.in_(ids)))
+    db.session.commit()
+
+    # a repost may have registered released content again meanwhile
+    for content_hash in MediaFile.registered(released):
+        paths.pop(content_hash, None)
+    remove_files_later(
+        [path for group in paths.values() for path in group],
+        conf.FILE_REMOVAL_WORKERS,
+    )
+    return len(ids)
+
+
+def _purge_where(condition, chunk_size: int) -> int:
+    """Purge the memes matching condition in chunks of chunk_size, by id."""
+    purged = 0
+    last_id = 0
+    while True:
+        ids = (
+            db.session.execute(
+                db.select(Meme.id)
+                .where(condition, Meme.id > last_id)
+                .order_by(Meme.id)
+                .limit(chunk_size)
+            )
+            .scalars()
+            .all()
+        )
+        if not ids:
+            return purged
+        purged += purge_memes(ids)
+        last_id = ids[-1]
+
+
+def purge_all_memes(chunk_size: int = None) -> int:
+    """
+    Hard-delete every meme, see purge_memes.
+    @param chunk_size: The memes per transaction, defaults to PURGE_CHUNK_SIZE.
+    @return: The number of memes deleted.
+    """
+    return _purge_where(db.true(), chunk_size or conf.PURGE_CHUNK_SIZE)
+
+
+def purge_expired_memes(retention_days: int = None, chunk_size: int = None) -> int:
+    """
+    Hard-delete the memes soft-deleted more than retention_days ago. Memes
+    deleted before deleted_at was tracked start their window now.
+    @param retention_days: Defaults to PURGE_RETENTION_DAYS.
+    @param chunk_size: The memes per transaction, defaults to PURGE_CHUNK_SIZE.
+    @return: The number of memes deleted.
+    """
+    if retention_days is None:
+        retention_days = conf.PURGE_RETENTION_DAYS
+    now = datetime.utcnow()
+    db.session.execute(
+        db.update(Meme)
+        .where(Meme.deleted.is_(True), Meme.deleted_at.is_(None))
+        .values(deleted_at=now)
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+    cutoff = now - timedelta(days=retention_days)
+    return _purge_where(
+        db.and_(Meme.deleted.is_(True), Meme.deleted_at <= cutoff),
+        chunk_size or conf.PURGE_CHUNK_SIZE,
+    )
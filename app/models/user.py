@@ -3,14 +3,69 @@
 
 from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
-from app import login_manager, db
-from sqlalchemy.orm import Mapped
+from app import login_manager, db, conf
+from app.utils.cache import TTLCache
+from app.utils.feed import get_feed_page
+from sqlalchemy import event
+from sqlalchemy.orm import Mapped, Session, load_only, make_transient_to_detached
 import os
 
+# the columns the session user is loaded with, the rest load on first access
+_SESSION_FIELDS = ("id", "username", "profile_image", "admin")
+
+# optional short-lived cache of the session columns keyed by user id, disabled
+# when SESSION_USER_CACHE_TTL is 0. Dropped on commit when the user changes.
+session_user_cache = TTLCache(conf.SESSION_USER_CACHE_TTL, conf.SESSION_USER_CACHE_SIZE)
+
 
 @login_manager.user_loader
 def load_user(user_id: int):
-    return User.query.get(int(user_id))
+    """
+    Load the user of the current session with only the session columns.
+    @param user_id: The id stored in the session.
+    @return: The User, or None if it no longer exists.
+    """
+    user_id = int(user_id)
+    cached = session_user_cache.get(user_id)
+    if cached is not None:
+        # rebuild the user from the cached columns and attach it without a query
+        user = User.__mapper__.class_manager.new_instance()
+        for field, value in cached.items():
+            setattr(user, field, value)
+        make_transient_to_detached(user)
+        return db.session.merge(user, load=False)
+    user = db.session.get(
+        User,
+        user_id,
+        options=[load_only(*(getattr(User, field) for field in _SESSION_FIELDS))],
+    )
+    if user is not None:
+        session_user_cache.put(
+            user_id, {field: getattr(user, field) for field in _SESSION_FIELDS}
+        )
+    return user
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_stale_session_users(session, flush_context) -> None:
+    """Remember the users changed or deleted in this transaction."""
+    stale = session.info.setdefault("stale_session_user_ids", set())
+    for obj in list(session.dirty) + list(session.deleted):
+        if isinstance(obj, User):
+            stale.add(obj.id)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_stale_session_users(session) -> None:
+    """Drop the cached session columns of every user changed in the commit."""
+    for user_id in session.info.pop("stale_session_user_ids", ()):
+        session_user_cache.invalidate(user_id)
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_stale_session_users(session) -> None:
+    """Nothing was committed, so nothing became stale."""
+    session.info.pop("stale_session_user_ids", None)
 
 
 # create the user model
@@ -23,9 +78,10 @@ class User(db.Model, UserMixin):
     - username (str, unique, not nullable)
     - email (str, unique, not nullable)
     - password (str, not nullable)
-    - memes (list, backref="posted_memes", lazy=True)
-    - saved_memes (list, secondary="saved_memes", lazy="subquery", backref=db.backref("saved_by", lazy=True))
-    - is_admin (bool, not nullable, default=False)
+    - memes (list, back_populates="author", lazy=True)
+    - saved_memes (query, secondary="saved_memes", lazy="dynamic", backref=db.backref("saved_by", lazy="dynamic"))
+    - liked_memes (query, secondary="liked_memes", lazy="dynamic", backref=db.backref("liked_by", lazy="dynamic"))
+    - admin (bool, not nullable, default=False, stored in the is_admin column)
 
     This model should have the following methods:
     - __init__ (instantiate an object of the class)
@@ -45,25 +101,31 @@ class User(db.Model, UserMixin):
     username: str = db.Column(db.String(20), unique=True, nullable=False)
     email: str = db.Column(db.String(120), unique=True, nullable=False)
     password: str = db.Column(db.String(120), nullable=False)
-    memes: Mapped[list] = db.relationship("Meme", backref="posted_memes", lazy=True)
+    memes: Mapped[list] = db.relationship("Meme", back_populates="author", lazy=True)
+    # the collections below can hold thousands of rows, so they are queried
+    # on demand (lazy="dynamic") and can be filtered or paged
     saved_memes: Mapped[list] = db.relationship(
         "Meme",
         secondary="saved_memes",
-        lazy="subquery",
-        backref=db.backref("saved_by", lazy=True),
+        lazy="dynamic",
+        backref=db.backref("saved_by", lazy="dynamic"),
     )
     liked_memes: Mapped[list] = db.relationship(
         "Meme",
         secondary="liked_memes",
-        lazy="subquery",
-        backref=db.backref("liked_by", lazy=True),
+        lazy="dynamic",
+        backref=db.backref("liked_by", lazy="dynamic"),
     )
 
-    is_admin: bool = db.Column(db.Boolean, nullable=False, default=False)
+    # mapped as "admin" so the is_admin() method below does not shadow it
+    admin: bool = db.Column(
+        "is_admin", db.Boolean, nullable=False, default=False, server_default=db.false()
+    )
     comments: Mapped[list] = db.relationship(
         "Comment", backref="posted_comments", lazy=True
     )
-    profile_image: str = db.Column(  # the name of the image file
+    # the avatar key of the chosen avatar, anything else gets a default one
+    profile_image: str = db.Column(
         db.String(100), nullable=False, default="default.jpg"
     )
 
@@ -87,7 +149,7 @@ class User(db.Model, UserMixin):
     def set_profile_image(self, image: str) -> None:
         """
         Set the profile image of the user.
-        @param image: The image of the user.
+        @param image: The avatar key of the image, see app.models.avatars.
         @return: None
         """
         self.profile_image = image
@@ -152,7 +214,7 @@ class User(db.Model, UserMixin):
         Check if the user is an admin.
         @return: True if the user is an admin, False otherwise.
         """
-        return self.is_admin
+        return bool(self.admin)
 
     def set_admin(self, is_admin: bool) -> None:
         """
@@ -160,7 +222,7 @@ class User(db.Model, UserMixin):
         @param is_admin: Whether the user is an admin.
         @return: None
         """
-        self.is_admin = is_admin
+        self.admin = is_admin
         db.session.commit()
 
     def admin_login(self, password: str) -> bool:
@@ -170,7 +232,8 @@ class User(db.Model, UserMixin):
         @return: True if the user is an admin and the password is correct, False otherwise.
         """
         return (
-            check_password_hash(os.getenv("ADMIN_PASSWORD"), password) and self.is_admin
+            check_password_hash(os.getenv("ADMIN_PASSWORD"), password)
+            and self.is_admin()
         )
 
     def get_id(self) -> str:
@@ -208,19 +271,44 @@ class User(db.Model, UserMixin):
         """
         return self.memes
 
-    def get_saved_memes(self) -> list:
+    def get_saved_memes(self, cursor: str = None, per_page: int = None):
+        """
+        Get one page of the saved memes of the user, newest first.
+        @param cursor: The cursor of the page to load, None for the first page.
+        @param per_page: The number of memes per page, defaults to FEED_PAGE_SIZE.
+        @return: A FeedPage with the memes and the cursor of the next page.
+        """
+        from .meme import Meme
+
+        return get_feed_page(
+            self.saved_memes.filter_by(deleted=False),
+            Meme,
+            cursor=cursor,
+            per_page=per_page or conf.FEED_PAGE_SIZE,
+        )
+
+    def get_liked_memes(self, cursor: str = None, per_page: int = None):
         """
-        Get the saved memes of the user.
-        @return: The saved memes of the user.
+        Get one page of the liked memes of the user, newest first.
+        @param cursor: The cursor of the page to load, None for the first page.
+        @param per_page: The number of memes per page, defaults to FEED_PAGE_SIZE.
+        @return: A FeedPage with the memes and the cursor of the next page.
         """
-        return self.saved_memes
+        from .meme import Meme
+
+        return get_feed_page(
+            self.liked_memes.filter_by(deleted=False),
+            Meme,
+            cursor=cursor,
+            per_page=per_page or conf.FEED_PAGE_SIZE,
+        )
 
     def get_is_admin(self) -> bool:
         """
         Get whether the user is an admin.
         @return: Whether the user is an admin.
         """
-        return self.is_admin
+        return self.is_admin()
 
     def get_comments(self) -> list:
         """
@@ -236,6 +324,7 @@ class User(db.Model, UserMixin):
         @return: None
         """
         self.saved_memes.remove(meme)
+        meme.bump_counter("save_count", -1)
 
     def save_meme(self, meme: int) -> None:
         """
@@ -244,6 +333,7 @@ class User(db.Model, UserMixin):
         @return: None
         """
         self.saved_memes.append(meme)
+        meme.bump_counter("save_count", 1)
 
     def like_meme(self, meme) -> None:
         """
@@ -252,6 +342,7 @@ class User(db.Model, UserMixin):
         @return: None
         """
         self.liked_memes.append(meme)
+        meme.bump_counter("like_count", 1)
 
     def unlike_meme(self, meme) -> None:
         """
@@ -260,6 +351,7 @@ class User(db.Model, UserMixin):
         @return: None
         """
         self.liked_memes.remove(meme)
+        meme.bump_counter("like_count", -1)
 
     def liked_by_user(self, meme: int):
         """
@@ -267,4 +359,4 @@ class User(db.Model, UserMixin):
         @param meme: a Meme instance.
         @return: True if the user has liked the meme, False otherwise.
         """
-        return meme in self.liked_memes
+        return self.liked_memes.filter_by(id=meme.id).first() is not None
@@ -0,0 +1,49 @@
+# filename: viewer_state.py
+# filepath: app\models\viewer_state.py
+
+from collections import namedtuple
+from app import db
+from .tables import liked_memes, saved_memes, seen_memes
+
+ViewerState = namedtuple("ViewerState", ["liked", "saved", "seen"])
+
+# the state of a meme the viewer has never interacted with
+EMPTY_VIEWER_STATE = ViewerState(liked=False, saved=False, seen=False)
+
+
+def _meme_ids_in(table: db.Table, user_id: int, meme_ids: list) -> set:
+    """
+    Get the ids of the memes a user has a row for in an association table.
+    @param table: The association table (liked_memes, saved_memes, seen_memes).
+    @param user_id: The id of the user.
+    @param meme_ids: The ids of the memes to check.
+    @return: The subset of meme_ids present in the table for the user.
+    """
+    rows = db.session.execute(
+        db.select(table.c.meme_id).where(
+            table.c.user_id == user_id, table.c.meme_id.in_(meme_ids)
+        )
+    )
+    return {meme_id for (meme_id,) in rows}
+
+
+def load_viewer_state(user_id: int, meme_ids: list) -> dict:
+    """
+    Load the liked, saved and seen flags of a user for a page of memes,
+    using a single query per association table.
+    @param user_id: The id of the viewing user.
+    @param meme_ids: The ids of the memes on the page.
+    @return: A dict mapping every meme id to a ViewerState.
+    """
+    meme_ids = list(meme_ids)
+    if not meme_ids:
+        return {}
+    liked = _meme_ids_in(liked_memes, user_id, meme_ids)
+    saved = _meme_ids_in(saved_memes, user_id, meme_ids)
+    seen = _meme_ids_in(seen_memes, user_id, meme_ids)
+    return {
+        meme_id: ViewerState(
+            liked=meme_id in liked, saved=meme_id in saved, seen=meme_id in seen
+        )
+        for meme_id in meme_ids
+    }
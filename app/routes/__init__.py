@@ -1,6 +1,7 @@
 from flask import Blueprint
 from flask_wtf import FlaskForm
 from app.forms import UploadMemeForm
+from app.models import EMPTY_VIEWER_STATE, avatar_url
 
 #     FileUploadForm,
 #     BookmarkForm,
@@ -18,6 +19,22 @@ def inject_forms() -> dict:
     )
 
 
+# Default viewer state and authors for templates rendered without a precomputed map
+@endpoint.context_processor
+def inject_viewer_state() -> dict:
+    return dict(
+        viewer_state={},
+        authors={},
+        empty_viewer_state=EMPTY_VIEWER_STATE,
+    )
+
+
+# Local, pre-sized avatars of users and authors, see app.models.avatars
+@endpoint.context_processor
+def inject_avatars() -> dict:
+    return dict(avatar_url=avatar_url)
+
+
 #     upload_form: FlaskForm = FileUploadForm()
 #     bookmark_form: FlaskForm = BookmarkForm()
 #     edit_file_form: FlaskForm = EditFileForm()
@@ -30,14 +47,21 @@ def inject_forms() -> dict:
 from .index import index_page as index_page
 from .auth import login as login, logout as logout, register as register
 from .meme import upload_meme as upload_meme
-from .api_test_routes import fix_memes as fix_memes
+from .api_test_routes import (
+    dump_memes as dump_memes,
+    purge_memes as purge_memes,
+)
 from .save import (
-    toggle_save_meme as toggle_save_meme,
-    toggle_like_meme as toggle_like_meme,
+    save_meme as save_meme,
+    like_meme as like_meme,
 )
+from .img import resized_image as resized_image
+from .impressions import record_seen as record_seen
+from .media import media as media
 from .user import (
     user as user,
     choose_profile_image as choose_profile_image,
+    choose_default_avatar as choose_default_avatar,
     user_id as user_id,
     edit_user as edit_user,
     delete_user as delete_user,
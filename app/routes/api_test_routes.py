@@ -1,26 +1,18 @@
 from . import endpoint
-from flask import redirect, url_for
-from app import db
-from app.models import Meme
+from .auth import admin_required
+from flask import jsonify
+from app.models import purge_all_memes, purge_expired_memes
 
 
-@endpoint.route("/fix/memes", methods=["GET"])
-def fix_memes():
-    memes = Meme.query.all()
-    for meme in memes:
-        meme.fix_db_urls()
-        db.session.commit()
-    return redirect(url_for("routes.index_page"))
+@endpoint.route("/dump/memes", methods=["POST"])
+@admin_required
+def dump_memes():
+    """Hard-delete every meme and its files, in chunks, see purge_all_memes."""
+    return jsonify(status="success", purged=purge_all_memes())
 
 
-@endpoint.route("/dump/memes", methods=["GET"])
-def dump_memes():
-    memes = Meme.query.all()
-    for meme in memes:
-        try:
-            meme.delete_files()
-        except FileNotFoundError or TypeError:
-            pass
-        db.session.delete(meme)
-        db.session.commit()
-    return redirect(url_for("routes.index_page"))
+@endpoint.route("/purge/memes", methods=["POST"])
+@admin_required
+def purge_memes():
+    """Hard-delete the memes soft-deleted past PURGE_RETENTION_DAYS."""
+    return jsonify(status="success", purged=purge_expired_memes())
@@ -1,5 +1,6 @@
-from flask import render_template, redirect, url_for, flash, Response, request
-from flask_login import current_user, login_user, logout_user
+from functools import wraps
+from flask import render_template, redirect, url_for, flash, Response, request, abort
+from flask_login import current_user, login_required, login_user, logout_user
 from app.models import User
 from app.forms import LoginForm, RegistrationForm
 from . import endpoint
@@ -8,9 +9,23 @@ __all__ = [
     "login",
     "logout",
     "register",
+    "admin_required",
 ]
 
 
+def admin_required(view):
+    """Restrict a view to logged in admins, others get a 403."""
+
+    @wraps(view)
+    @login_required
+    def wrapper(*args, **kwargs):
+        if not current_user.is_admin():
+            abort(403)
+        return view(*args, **kwargs)
+
+    return wrapper
+
+
 @endpoint.route("/login", methods=["GET", "POST"])
 def login():
     if current_user.is_authenticated:
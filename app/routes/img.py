@@ -0,0 +1,52 @@
+from flask import abort, request, send_file
+from flask_login import login_required
+from app import conf, db
+from app.models import Meme
+from app.utils import DiskCache
+from app.utils.thumbnails import (
+    render_variant,
+    supported_modern_formats,
+    variant_filename,
+)
+from . import endpoint
+
+# resized variants rendered by /img, evicted least recently used first
+image_cache = DiskCache(conf.IMAGE_CACHE_FOLDER, conf.IMAGE_CACHE_MAX_BYTES)
+
+
+def negotiate_format():
+    """Get the best modern format the client explicitly accepts, or None."""
+    accepted = {mimetype for mimetype, _ in request.accept_mimetypes}
+    return next(
+        (fmt for fmt in supported_modern_formats() if f"image/{fmt}" in accepted),
+        None,
+    )
+
+
+@endpoint.route("/img/<int:meme_id>/<int:width>", methods=["GET"])
+@login_required
+def resized_image(meme_id, width):
+    """
+    Serve a meme scaled down to one of IMAGE_WIDTHS, in AVIF or WebP when
+    the client accepts it. Variants are rendered from the original on
+    first use and cached on disk.
+    """
+    if width not in conf.IMAGE_WIDTHS:
+        abort(404)
+    meme = db.session.get(Meme, meme_id)
+    if meme is None or meme.deleted or meme.filename is None:
+        abort(404)
+    fmt = negotiate_format()
+    filepath, orientation = meme.filepath, meme.orientation or 1
+    try:
+        path = image_cache.get_or_create(
+            variant_filename(meme.filename, width, fmt),
+            lambda out_path: render_variant(
+                filepath, out_path, width, fmt, orientation
+            ),
+        )
+    except FileNotFoundError:
+        abort(404)
+    response = send_file(path, mimetype=f"image/{fmt}" if fmt else None)
+    response.vary.add("Accept")
+    return response
@@ -0,0 +1,24 @@
+from flask import jsonify, request, abort
+from . import endpoint
+from flask_login import current_user, login_required
+from app.models import impression_buffer
+
+# the most impressions accepted per request
+_MAX_BATCH = 200
+
+
+@endpoint.route("/seen", methods=["POST"])
+@login_required
+def record_seen():
+    """
+    Record the memes the feed showed, sent in batches as JSON:
+    {"meme_ids": [1, 2, 3]}. They are written behind, see ImpressionBuffer.
+    """
+    payload = request.get_json(silent=True) or {}
+    meme_ids = payload.get("meme_ids")
+    if not isinstance(meme_ids, list) or len(meme_ids) > _MAX_BATCH:
+        abort(400)
+    if not all(type(meme_id) is int and meme_id > 0 for meme_id in meme_ids):
+        abort(400)
+    recorded = impression_buffer.record(current_user.id, set(meme_ids))
+    return jsonify(status="success", recorded=recorded)
@@ -1,17 +1,36 @@
 from flask import redirect, url_for, render_template
 from flask_login import current_user
 from . import endpoint
-from app.models import Meme
+from app.models import Meme, load_viewer_state, load_authors
 import os
 
 
+def feed_context(user_id: int, memes: list) -> dict:
+    """
+    Build the template context for a page of meme cards, loading the viewer
+    state and the authors of the whole page in bulk.
+    @param user_id: The id of the viewing user.
+    @param memes: The memes on the page.
+    @return: The memes, viewer_state and authors template variables.
+    """
+    return dict(
+        memes=memes,
+        viewer_state=load_viewer_state(user_id, [meme.id for meme in memes]),
+        authors=load_authors(meme.posted_by for meme in memes),
+    )
+
+
 @endpoint.route("/")
 @endpoint.route("/index", methods=["GET"])
 def index_page():
     if not current_user.is_authenticated:
         return redirect(url_for("routes.login"))
     user_id = current_user.id
-    memes = Meme.query.filter_by(deleted=False).all()
+    page = Meme.feed_page()
     return render_template(
-        "index.jinja", user_id=user_id, title="Intragram", memes=memes
+        "index.jinja",
+        user_id=user_id,
+        title="Intragram",
+        next_cursor=page.next_cursor,
+        **feed_context(user_id, page.memes),
     )
@@ -0,0 +1,68 @@
+import mimetypes, os, re
+from urllib.parse import quote
+from flask import abort, current_app, request, send_file
+from werkzeug.security import safe_join
+from app import conf
+from . import endpoint
+
+# content-addressed originals are named after the sha256 of their bytes
+_CONTENT_HASH = re.compile(r"[0-9a-f]{64}")
+
+
+def _etag(path: str, filename: str) -> str:
+    """Get a strong ETag: the content hash of an original, else the file's mtime and size."""
+    stem = os.path.splitext(os.path.basename(filename))[0]
+    if _CONTENT_HASH.fullmatch(stem):
+        return stem
+    stat = os.stat(path)
+    return f"{stat.st_mtime_ns:x}-{stat.st_size:x}"
+
+
+def _offload_response(path: str, filename: str):
+    """
+    Build an empty response that tells the front proxy to send the file,
+    see MEDIA_OFFLOAD. The proxy serves byte ranges itself.
+    """
+    response = current_app.response_class(
+        mimetype=mimetypes.guess_type(filename)[0] or "application/octet-stream"
+    )
+    if conf.MEDIA_OFFLOAD == "x-accel-redirect":
+        response.headers["X-Accel-Redirect"] = (
+            conf.MEDIA_ACCEL_PREFIX.rstrip("/") + "/" + quote(filename)
+        )
+    else:
+        response.headers["X-Sendfile"] = path
+    response.set_etag(_etag(path, filename))
+    response = response.make_conditional(request)
+    if response.status_code == 304:
+        # some proxies send the file regardless of the status code
+        response.headers.pop("X-Accel-Redirect", None)
+        response.headers.pop("X-Sendfile", None)
+    return response
+
+
+@endpoint.route("/media/<version>/<path:filename>", methods=["GET"])
+def media(version, filename):
+    """
+    Serve an original or a thumbnail from the uploads folder. The version
+    segment changes whenever the content does (see Meme.media_url), so the
+    response can be cached for good. Supports conditional and byte range
+    requests, or hands the file to the front proxy when MEDIA_OFFLOAD is set.
+    """
+    path = safe_join(conf.UPLOADS_FOLDER, filename)
+    if path is None or not os.path.isfile(path):
+        abort(404)
+    if conf.MEDIA_OFFLOAD:
+        response = _offload_response(path, filename)
+    else:
+        response = send_file(
+            path,
+            etag=_etag(path, filename),
+            max_age=conf.MEDIA_MAX_AGE,
+            conditional=True,
+        )
+        response.accept_ranges = "bytes"
+    response.cache_control.public = True
+    response.cache_control.max_age = conf.MEDIA_MAX_AGE
+    response.cache_control.immutable = True
+    return response
@@ -1,10 +1,21 @@
-from flask import render_template, redirect, url_for, flash, Response, request
+from flask import (
+    render_template,
+    redirect,
+    url_for,
+    flash,
+    Response,
+    request,
+    jsonify,
+    abort,
+)
 from flask_login import current_user, login_required
 from app import db
 from app.models import Meme, User
 from . import endpoint
+from .index import feed_context
 from app.forms import UploadMemeForm
 from werkzeug.utils import secure_filename
+from app.utils import InvalidCursor, UploadRejected
 
 
 @endpoint.route("/meme/<int:meme_id>", methods=["GET"])
@@ -14,11 +25,25 @@ def get_meme(meme_id):
     return render_template("view_meme.jinja", meme=meme)
 
 
-@endpoint.route("/meme/<int:page>", methods=["GET"])
+@endpoint.route("/meme/feed", methods=["GET"])
 @login_required
-def get_memes(page):
-    memes = Meme.query.paginate(page=page, per_page=10)
-    return render_template("meme.jinja", memes=memes)
+def get_memes():
+    """
+    Return the next page of the feed as an HTML fragment for infinite scroll.
+    Query params: cursor (from the previous page), per_page (optional).
+    """
+    cursor = request.args.get("cursor")
+    per_page = request.args.get("per_page", type=int)
+    if per_page is not None:
+        per_page = max(1, min(per_page, 50))
+    try:
+        page = Meme.feed_page(cursor=cursor, per_page=per_page)
+    except InvalidCursor:
+        abort(400)
+    html = render_template(
+        "meme_cards.jinja", **feed_context(current_user.id, page.memes)
+    )
+    return jsonify(html=html, next_cursor=page.next_cursor)
 
 
 @endpoint.route("/meme/upload", methods=["POST"])
@@ -29,13 +54,32 @@ def upload_meme():
         upload = form.file.data
         url = form.url.data
         private = form.private.data
+        meme = None
         if upload:
-            meme = Meme.from_upload(upload, current_user.id, private)
+            try:
+                meme = Meme.from_upload(upload, current_user.id, private)
+            except UploadRejected as err:
+                flash(str(err), "error")
+                return redirect(url_for("routes.index_page"))
             db.session.add(meme)
             db.session.commit()
         elif url:
-            meme = Meme.from_url(url, current_user.id, private)
-            meme.__setattr__("url", url)
+            try:
+                meme = Meme.from_url(url, current_user.id, private)
+            except UploadRejected as err:
+                flash(str(err), "error")
+                return redirect(url_for("routes.index_page"))
             db.session.add(meme)
             db.session.commit()
+        if meme is not None and meme.duplicate_of_id:
+            flash(f"Possible duplicate of meme #{meme.duplicate_of_id}", "warning")
     return redirect(url_for("routes.index_page"))
+
+
+@endpoint.app_errorhandler(413)
+def upload_too_large(error):
+    """Reject request bodies over MAX_CONTENT_LENGTH before they are read."""
+    if request.path == url_for("routes.upload_meme"):
+        flash("The image is too large.", "error")
+        return redirect(url_for("routes.index_page"))
+    return error
@@ -1,41 +1,29 @@
-from flask import jsonify, request
+from flask import jsonify, request, abort
 from . import endpoint
 from flask_login import current_user, login_required
-from app.models import Meme, User
+from app.models import Meme
 from app import db
 
 
-@endpoint.route("/toggle_save_meme", methods=["POST"])
+@endpoint.route("/meme/<int:meme_id>/save", methods=["POST", "DELETE"])
 @login_required
-def toggle_save_meme():
-    meme_id = request.form.get("meme_id")
-    meme = Meme.query.get(meme_id)
-    user_id = current_user.id
+def save_meme(meme_id):
+    """POST saves the meme, DELETE unsaves it. Both are idempotent."""
+    saved = request.method == "POST"
+    save_count = Meme.set_saved(meme_id, current_user.id, saved)
+    if save_count is None:
+        abort(404)
+    db.session.commit()
+    return jsonify(status="success", saved=saved, save_count=save_count)
 
-    meme = Meme.query.get(meme_id)
 
-    if meme.saved_by_user(user_id):
-        User.query.get(user_id).unsave_meme(meme)
-        db.session.commit()
-    else:
-        User.query.get(user_id).save_meme(meme)
-        db.session.commit()
-
-    return jsonify(status="success")
-
-
-@endpoint.route("/toggle_like_meme", methods=["POST"])
+@endpoint.route("/meme/<int:meme_id>/like", methods=["POST", "DELETE"])
 @login_required
-def toggle_like_meme():
-    meme_id = request.form.get("meme_id")
-    meme = Meme.query.get(meme_id)
-    user_id = current_user.id
-
-    if meme.liked_by_user(user_id):
-        User.query.get(user_id).unlike_meme(meme)
-        db.session.commit()
-    else:
-        User.query.get(user_id).like_meme(meme)
-        db.session.commit()
-
-    return jsonify(status="success")
+def like_meme(meme_id):
+    """POST likes the meme, DELETE unlikes it. Both are idempotent."""
+    liked = request.method == "POST"
+    like_count = Meme.set_liked(meme_id, current_user.id, liked)
+    if like_count is None:
+        abort(404)
+    db.session.commit()
+    return jsonify(status="success", liked=liked, like_count=like_count)
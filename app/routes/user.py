@@ -1,10 +1,10 @@
-import os
-from flask import render_template, redirect, url_for, flash, Response, request
+from flask import abort, render_template, redirect, url_for, flash, Response, request
 from flask_login import current_user, login_required
 from app import db
 from . import endpoint
-from app.models import User, Group, Meme
-from app.forms import AdminLoginForm, RegistrationForm
+from app.models import User, Group, Meme, default_avatars, store_avatar
+from app.forms import AdminLoginForm, AvatarForm, DefaultAvatarForm, RegistrationForm
+from app.utils import UploadRejected
 
 
 @endpoint.route("/user", methods=["GET"])
@@ -13,19 +13,38 @@ def user():
     return render_template("user_page.jinja")
 
 
-@endpoint.route("/user/image/", defaults={"img": None}, methods=["GET", "POST"])
-@endpoint.route("/user/image/<string:img>", methods=["GET", "POST"])
+@endpoint.route("/user/image/", methods=["GET", "POST"])
 @login_required
-def choose_profile_image(img):
-    if img:
-        current_user.set_profile_image(img)
-        return redirect(url_for("routes.index"))
-    else:
-        default_images = [
-            image for image in os.listdir("app/static/images/default_images")
-        ]
-        print(default_images)
-        return render_template("set_image.jinja", default_images=default_images, id=id)
+def choose_profile_image():
+    form = AvatarForm()
+    if form.validate_on_submit():
+        try:
+            key = store_avatar(form.file.data.stream)
+        except UploadRejected as err:
+            flash(str(err), "error")
+            return redirect(url_for("routes.choose_profile_image"))
+        current_user.set_profile_image(key)
+        db.session.commit()
+        return redirect(url_for("routes.index_page"))
+    return render_template(
+        "set_image.jinja",
+        default_avatars=default_avatars.get(),
+        form=form,
+        default_form=DefaultAvatarForm(),
+    )
+
+
+@endpoint.route("/user/image/<string:img>", methods=["POST"])
+@login_required
+def choose_default_avatar(img):
+    # the avatar key of one of the default images
+    if img not in default_avatars.get().values():
+        abort(404)
+    if not DefaultAvatarForm().validate_on_submit():
+        abort(400)
+    current_user.set_profile_image(img)
+    db.session.commit()
+    return redirect(url_for("routes.index_page"))
 
 
 @endpoint.route("/user/<int:id>", methods=["GET"])
@@ -1 +0,0 @@
-from .test_memes import generate_test_memes as generate_test_memes
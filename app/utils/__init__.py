@@ -1 +1,31 @@
-from .utils import *
+from .cache import TTLCache as TTLCache
+from .disk_cache import DiskCache as DiskCache
+from .feed import (
+    FeedPage as FeedPage,
+    InvalidCursor as InvalidCursor,
+    encode_cursor as encode_cursor,
+    decode_cursor as decode_cursor,
+    get_feed_page as get_feed_page,
+)
+from .ingest import (
+    IngestedImage as IngestedImage,
+    UploadRejected as UploadRejected,
+    hash_file as hash_file,
+    ingest_file as ingest_file,
+    ingest_stream as ingest_stream,
+    prepare_original as prepare_original,
+    remove_metadata as remove_metadata,
+    sniff_format as sniff_format,
+    stored_format as stored_format,
+)
+from .normalize import NormalizePolicy as NormalizePolicy
+from .avatars import (
+    AVATAR_SIZES as AVATAR_SIZES,
+    AvatarManifest as AvatarManifest,
+    render_avatar as render_avatar,
+)
+from .fetch import (
+    FetchError as FetchError,
+    check_url as check_url,
+    fetch_image as fetch_image,
+)
@@ -0,0 +1,136 @@
+import json, os, threading
+from PIL import Image, ImageOps
+from .ingest import hash_file
+from .storage import remove_files, temp_path
+
+# Avatars are rendered once per source image into small square variants,
+# named by the content hash of the source (the avatar key), so their URLs
+# never change for the same bytes and can be cached for good.
+
+# the side of each variant: the 40px avatar of a meme card and its 2x copy
+AVATAR_SIZES = (40, 80)
+AVATAR_FORMAT = dict(format="WEBP", quality=80, method=6)
+
+# the number of hex digits of the source's sha256 an avatar key keeps
+KEY_LENGTH = 16
+
+
+def avatar_filename(key: str, size: int) -> str:
+    """
+    Get the filename of an avatar variant.
+    @param key: The avatar key.
+    @param size: One of AVATAR_SIZES.
+    @return: The filename, relative to the avatars folder.
+    """
+    return f"{key}_{size}.webp"
+
+
+def is_avatar_key(value: str) -> bool:
+    """Check if a value has the shape of an avatar key."""
+    return (
+        value is not None
+        and len(value) == KEY_LENGTH
+        and all(char in "0123456789abcdef" for char in value)
+    )
+
+
+def render_avatar(source: str, folder: str, key: str = None) -> str:
+    """
+    Render the variants of an avatar, unless they already exist.
+    @param source: The path of the source image.
+    @param folder: The avatars folder.
+    @param key: The avatar key if already known, computed from source otherwise.
+    @return: The avatar key.
+    """
+    key = key or hash_file(source)[:KEY_LENGTH]
+    paths = {
+        size: os.path.join(folder, avatar_filename(key, size)) for size in AVATAR_SIZES
+    }
+    if all(os.path.exists(path) for path in paths.values()):
+        return key
+    os.makedirs(folder, exist_ok=True)
+    with Image.open(source) as img:
+        # JPEGs are decoded at a reduced scale, photos are far larger than avatars
+        largest = max(AVATAR_SIZES)
+        img.draft("RGB", (largest * 2, largest * 2))
+        img = ImageOps.exif_transpose(img).convert("RGB")
+        # largest first, so each size is cropped from the previous one
+        for size in sorted(AVATAR_SIZES, reverse=True):
+            img = ImageOps.fit(img, (size, size), Image.LANCZOS)
+            partial = temp_path(folder, "webp")
+            try:
+                img.save(partial, **AVATAR_FORMAT)
+                os.replace(partial, paths[size])
+            finally:
+                remove_files([partial])
+    return key
+
+
+class AvatarManifest:
+    """
+    The avatar keys of the default profile images, by filename. The
+    manifest is kept in memory and in the avatars folder, and rebuilt only
+    when the folder of default images changes, so requests stat a single
+    directory instead of listing and hashing it.
+    """
+
+    def __init__(self, source_folder: str, folder: str) -> None:
+        """
+        Instantiate an object of the class.
+        @param source_folder: The folder of the default profile images.
+        @param folder: The avatars folder the variants are rendered to.
+        @return: None
+        """
+        self.source_folder = source_folder
+        self.folder = folder
+        self.path = os.path.join(folder, "default_avatars.json")
+        self._version = None
+        self._avatars = {}
+        self._lock = threading.Lock()
+
+    def get(self) -> dict:
+        """
+        Get the manifest, rebuilding it if the default images changed.
+        @return: A dict of default image filename to avatar key, in filename order.
+        """
+        try:
+            version = os.stat(self.source_folder).st_mtime_ns
+        except FileNotFoundError:
+            return {}
+        if version != self._version:
+            with self._lock:
+                if version != self._version:
+                    self._avatars = self._load(version) or self._build(version)
+                    self._version = version
+        return self._avatars
+
+    def _load(self, version: int):
+        """Read the manifest another process or run wrote, None if it is stale."""
+        try:
+            with open(self.path) as file:
+                manifest = json.load(file)
+        except (OSError, ValueError):
+            return None
+        if manifest.get("version") != version:
+            return None
+        return manifest["avatars"]
+
+    def _build(self, version: int) -> dict:
+        """Render the variants of every default image and write the manifest."""
+        avatars = {}
+        for filename in sorted(os.listdir(self.source_folder)):
+            source = os.path.join(self.source_folder, filename)
+            try:
+                avatars[filename] = render_avatar(source, self.folder)
+            except (OSError, ValueError):
+                # not an image, e.g. a README next to the defaults
+                continue
+        os.makedirs(self.folder, exist_ok=True)
+        partial = temp_path(self.folder, "json")
+        try:
+            with open(partial, "w") as file:
+                json.dump(dict(version=version, avatars=avatars), file)
+            os.replace(partial, self.path)
+        finally:
+            remove_files([partial])
+        return avatars
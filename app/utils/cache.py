@@ -0,0 +1,100 @@
+import threading, time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """
+    A small thread-safe, process-local LRU cache whose entries expire.
+
+    @field ttl: The number of seconds an entry stays valid.
+    @field max_size: The maximum number of entries kept.
+    """
+
+    def __init__(self, ttl: float, max_size: int) -> None:
+        """
+        Instantiate an object of the class.
+        @param ttl: The number of seconds an entry stays valid.
+        @param max_size: The maximum number of entries kept.
+        @return: None
+        """
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        """Whether the cache keeps anything at all."""
+        return self.ttl > 0 and self.max_size > 0
+
+    def get(self, key, default=None):
+        """
+        Get a cached value.
+        @param key: The key of the value.
+        @param default: Returned when the key is missing or expired.
+        @return: The cached value or default.
+        """
+        return self.get_many([key]).get(key, default)
+
+    def get_many(self, keys) -> dict:
+        """
+        Get the cached values for several keys.
+        @param keys: The keys to look up.
+        @return: A dict of key to value for the keys that were cached.
+        """
+        now = time.monotonic()
+        found = {}
+        with self._lock:
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is None:
+                    continue
+                value, expires = entry
+                if expires < now:
+                    del self._entries[key]
+                    continue
+                self._entries.move_to_end(key)
+                found[key] = value
+        return found
+
+    def put(self, key, value) -> None:
+        """
+        Cache a value.
+        @param key: The key of the value.
+        @param value: The value.
+        @return: None
+        """
+        self.put_many({key: value})
+
+    def put_many(self, items: dict) -> None:
+        """
+        Cache several values, evicting the least recently used entries.
+        @param items: A dict of key to value.
+        @return: None
+        """
+        if not self.enabled:
+            return
+        expires = time.monotonic() + self.ttl
+        with self._lock:
+            for key, value in items.items():
+                self._entries[key] = (value, expires)
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key) -> None:
+        """
+        Remove a key from the cache.
+        @param key: The key to remove.
+        @return: None
+        """
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        """
+        Remove every entry from the cache.
+        @return: None
+        """
+        with self._lock:
+            self._entries.clear()
@@ -0,0 +1,114 @@
+import os, threading
+from collections import OrderedDict
+from .storage import remove_files, temp_path
+
+
+class DiskCache:
+    """
+    A size-capped LRU cache of files in a folder, e.g. resized image variants.
+
+    Recency is kept in memory and mirrored to the files' mtime, so the
+    order survives restarts. Concurrent requests for the same missing file
+    in this process are collapsed: one thread creates it while the others
+    wait for it. Each process evicts on its own; a file another process
+    evicted is treated as a miss.
+
+    @field folder: The folder holding the cached files.
+    @field max_bytes: The maximum total size of the cached files.
+    """
+
+    def __init__(self, folder: str, max_bytes: int) -> None:
+        """
+        Instantiate an object of the class.
+        @param folder: The folder holding the cached files.
+        @param max_bytes: The maximum total size of the cached files.
+        @return: None
+        """
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self._entries = None
+        self._total = 0
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+    def path(self, name: str) -> str:
+        """Get the path of a cached file."""
+        return os.path.join(self.folder, name)
+
+    def _load(self) -> None:
+        """Index the files already in the folder, least recently used first."""
+        files = []
+        os.makedirs(self.folder, exist_ok=True)
+        with os.scandir(self.folder) as entries:
+            for entry in entries:
+                if entry.is_file() and not entry.name.startswith(".partial-"):
+                    stat = entry.stat()
+                    files.append((stat.st_mtime, entry.name, stat.st_size))
+        self._entries = OrderedDict((name, size) for _, name, size in sorted(files))
+        self._total = sum(self._entries.values())
+
+    def get(self, name: str):
+        """
+        Look up a cached file and mark it as recently used.
+        @param name: The filename of the cached file.
+        @return: The path of the file, or None if it is not cached.
+        """
+        path = self.path(name)
+        with self._lock:
+            if self._entries is None:
+                self._load()
+            try:
+                # refresh the mtime so the recency survives restarts
+                os.utime(path)
+            except FileNotFoundError:
+                self._total -= self._entries.pop(name, 0)
+                return None
+            if name in self._entries:
+                self._entries.move_to_end(name)
+            else:
+                # created by another process
+                self._add(name, os.path.getsize(path))
+        return path
+
+    def get_or_create(self, name: str, create, timeout: float = 30) -> str:
+        """
+        Get a cached file, creating it if it is missing. Only one thread
+        creates a given file; concurrent callers wait for its result.
+        @param name: The filename of the cached file.
+        @param create: Called with a temp path to write the file to.
+        @param timeout: Seconds to wait for another thread creating the file.
+        @return: The path of the file.
+        """
+        while True:
+            path = self.get(name)
+            if path is not None:
+                return path
+            with self._lock:
+                pending = self._inflight.get(name)
+                if pending is None:
+                    self._inflight[name] = done = threading.Event()
+            if pending is None:
+                break
+            # another thread is creating the file; if it failed, retry ourselves
+            pending.wait(timeout)
+        partial = temp_path(self.folder, os.path.splitext(name)[1].lstrip("."))
+        try:
+            create(partial)
+            os.replace(partial, self.path(name))
+            with self._lock:
+                self._add(name, os.path.getsize(self.path(name)))
+        finally:
+            remove_files([partial])
+            with self._lock:
+                del self._inflight[name]
+            done.set()
+        return self.path(name)
+
+    def _add(self, name: str, size: int) -> None:
+        """Index a new file and evict the least recently used ones over max_bytes."""
+        self._total += size - self._entries.pop(name, 0)
+        self._entries[name] = size
+        while self._total > self.max_bytes and len(self._entries) > 1:
+            evicted, evicted_size = self._entries.popitem(last=False)
+            self._total -= evicted_size
+            remove_files([self.path(evicted)])
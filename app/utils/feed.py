@@ -0,0 +1,66 @@
+import base64
+from collections import namedtuple
+from datetime import datetime
+from sqlalchemy import and_, or_
+
+FeedPage = namedtuple("FeedPage", ["memes", "next_cursor"])
+
+
+class InvalidCursor(ValueError):
+    """Raised when a feed cursor cannot be decoded."""
+
+
+def encode_cursor(date_posted: datetime, meme_id: int) -> str:
+    """
+    Encode the position of a meme in the feed as an opaque cursor.
+    @param date_posted: The date the meme was posted.
+    @param meme_id: The id of the meme.
+    @return: A url-safe cursor string.
+    """
+    raw = f"{date_posted.isoformat()}|{meme_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple:
+    """
+    Decode a cursor created by encode_cursor.
+    @param cursor: The cursor string.
+    @return: A (date_posted, meme_id) tuple.
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        date_part, id_part = base64.urlsafe_b64decode(padded).decode().split("|")
+        return datetime.fromisoformat(date_part), int(id_part)
+    except (ValueError, UnicodeDecodeError) as err:
+        raise InvalidCursor(cursor) from err
+
+
+def get_feed_page(query, model, cursor: str = None, per_page: int = 10) -> FeedPage:
+    """
+    Fetch one page of the feed, newest first, using keyset pagination on
+    (date_posted, id) so no OFFSET or COUNT query is needed.
+    @param query: The base query, already filtered (e.g. deleted=False).
+    @param model: The mapped class with date_posted and id columns.
+    @param cursor: The cursor returned with the previous page, if any.
+    @param per_page: The number of memes per page.
+    @return: A FeedPage with the memes and the cursor of the next page.
+    """
+    if cursor:
+        date_posted, meme_id = decode_cursor(cursor)
+        query = query.filter(
+            or_(
+                model.date_posted < date_posted,
+                and_(model.date_posted == date_posted, model.id < meme_id),
+            )
+        )
+    # fetch one extra row to know whether another page exists
+    rows = (
+        query.order_by(model.date_posted.desc(), model.id.desc())
+        .limit(per_page + 1)
+        .all()
+    )
+    next_cursor = None
+    if len(rows) > per_page:
+        rows = rows[:per_page]
+        next_cursor = encode_cursor(rows[-1].date_posted, rows[-1].id)
+    return FeedPage(rows, next_cursor)
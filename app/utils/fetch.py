@@ -0,0 +1,141 @@
+import os, threading, time
+from urllib.parse import urlsplit
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import HTTPError as ConnectionPoolError
+from .ingest import UploadRejected, ingest_stream, prepare_original, stored_format
+
+# connections kept open per host by the shared session
+_POOL_SIZE = 10
+
+# the redirects followed before a download fails
+_MAX_REDIRECTS = 5
+
+# the Content-Types accepted besides image/*, for servers that do not know
+# the type; the content is sniffed either way, see ingest_stream
+_GENERIC_TYPES = ("application/octet-stream", "binary/octet-stream")
+
+_session = None
+_session_lock = threading.Lock()
+
+
+class FetchError(ValueError):
+    """Raised when an image URL cannot be downloaded."""
+
+
+def check_url(url: str) -> str:
+    """
+    Check that a URL can be fetched.
+    @param url: The URL of an image.
+    @return: The host of the URL.
+    @raise UploadRejected: If the URL is not an absolute http(s) URL.
+    """
+    parts = urlsplit(url)
+    if parts.scheme not in ("http", "https") or not parts.hostname:
+        raise UploadRejected("Only http and https image URLs are accepted.")
+    return parts.hostname
+
+
+def get_session() -> requests.Session:
+    """
+    Get the session shared by every fetch of this process, so connections
+    to a host are pooled and reused across downloads.
+    @return: The session.
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=_POOL_SIZE, pool_maxsize=_POOL_SIZE)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            session.headers["User-Agent"] = "Meme-Share image fetcher"
+            session.max_redirects = _MAX_REDIRECTS
+            _session = session
+        return _session
+
+
+class _DeadlineReader:
+    """Wraps a response body to enforce a total download time."""
+
+    def __init__(self, raw, deadline: float) -> None:
+        self.raw = raw
+        self.deadline = deadline
+
+    def read(self, size: int) -> bytes:
+        chunks = []
+        while size > 0:
+            if time.monotonic() > self.deadline:
+                raise FetchError("The download took too long.")
+            # read1 returns after a single read from the socket, so a body
+            # trickled in slowly cannot keep a read going past the deadline
+            chunk = self.raw.read1(size, decode_content=True)
+            if not chunk:
+                break
+            chunks.append(chunk)
+            size -= len(chunk)
+        return b"".join(chunks)
+
+
+def fetch_image(
+    url: str,
+    folder: str,
+    max_bytes: int,
+    max_pixels: int,
+    connect_timeout: float,
+    read_timeout: float,
+    total_timeout: float,
+    policy,
+) -> dict:
+    """
+    Download an image into a temp file in folder, streaming it through the
+    same checks as uploads. Runs in a job queue worker, so it only takes
+    and returns plain values.
+    @param url: The URL of the image.
+    @param folder: The staging folder of the temp file, see ingest_stream.
+    @param max_bytes: The maximum size of the image.
+    @param max_pixels: The maximum width * height of the image.
+    @param connect_timeout: Seconds to wait for a connection.
+    @param read_timeout: Seconds to wait for each read from the socket.
+    @param total_timeout: Seconds the whole download may take.
+    @param policy: The NormalizePolicy of the stored originals.
+    @return: A dict with the "path" of the temp file, its "content_hash"
+    and the "ext" it is stored with.
+    @raise FetchError: If the server does not return the image.
+    @raise UploadRejected: If the content is not an accepted image or too large.
+    """
+    check_url(url)
+    deadline = time.monotonic() + total_timeout
+    try:
+        response = get_session().get(
+            url, stream=True, timeout=(connect_timeout, read_timeout)
+        )
+    except requests.RequestException as err:
+        raise FetchError(f"Failed to download {url}: {err}") from err
+    with response:
+        if response.status_code != 200:
+            raise FetchError(f"Failed to download {url}: HTTP {response.status_code}")
+        content_type = response.headers.get("Content-Type", "")
+        content_type = content_type.split(";")[0].strip().lower()
+        if content_type and not (
+            content_type.startswith("image/") or content_type in _GENERIC_TYPES
+        ):
+            raise UploadRejected("The URL does not point to an image.")
+        length = response.headers.get("Content-Length")
+        if length and length.isdigit() and int(length) > max_bytes:
+            raise UploadRejected(
+                f"Images can be at most {max_bytes // (1024 * 1024)} MB."
+            )
+        try:
+            ingested = ingest_stream(
+                _DeadlineReader(response.raw, deadline), folder, max_bytes, max_pixels
+            )
+        except (requests.RequestException, ConnectionPoolError) as err:
+            raise FetchError(f"Failed to download {url}: {err}") from err
+    try:
+        target, ext = stored_format(ingested, policy)
+        prepare_original(ingested, target, policy)
+    except BaseException:
+        os.remove(ingested.path)
+        raise
+    return dict(path=ingested.path, content_hash=ingested.content_hash, ext=ext)
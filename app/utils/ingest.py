@@ -0,0 +1,259 @@
+import hashlib, os, struct
+from collections import namedtuple
+from PIL import Image
+from .metadata import ORIENTATION_TAG, STRIPPERS
+from .normalize import (
+    NORMALIZED_EXTENSIONS,
+    keep_pristine,
+    normalize_image,
+    normalized_format,
+    pristine_path,
+)
+from .phash import dhash_file, to_signed
+from .storage import CHUNK_SIZE, remove_files, temp_path
+
+# the image formats accepted for memes: (magic bytes, offset, Pillow format, extension)
+_SIGNATURES = (
+    (b"\xff\xd8\xff", 0, "JPEG", "jpg"),
+    (b"\x89PNG\r\n\x1a\n", 0, "PNG", "png"),
+    (b"GIF87a", 0, "GIF", "gif"),
+    (b"GIF89a", 0, "GIF", "gif"),
+    (b"WEBP", 8, "WEBP", "webp"),
+)
+
+# bytes needed to recognize every signature
+_SNIFF_SIZE = 16
+
+# the info keys Pillow reads metadata into, for the formats without a
+# container-level stripper, e.g. a GIF comment
+_METADATA_KEYS = ("exif", "xmp", "XML:com.adobe.xmp", "comment")
+
+# an image streamed into a temp file and checked, but not decoded
+IngestedImage = namedtuple(
+    "IngestedImage",
+    [
+        "path",
+        "content_hash",
+        "format",
+        "ext",
+        "width",
+        "height",
+        "has_metadata",
+        "orientation",
+    ],
+)
+
+
+class UploadRejected(ValueError):
+    """Raised when an upload is not an accepted image or exceeds a limit."""
+
+
+def sniff_format(head: bytes):
+    """
+    Identify an accepted image format from the first bytes of a file.
+    @param head: At least the first 16 bytes of the file.
+    @return: A (Pillow format, extension) tuple, or None if not accepted.
+    """
+    if head[:4] == b"RIFF" and head[8:12] != b"WEBP":
+        return None
+    for magic, offset, fmt, ext in _SIGNATURES:
+        if head[offset : offset + len(magic)] == magic:
+            return fmt, ext
+    return None
+
+
+def ingest_stream(stream, folder: str, max_bytes: int, max_pixels: int):
+    """
+    Stream an upload into a temp file in folder, chunk by chunk. The format
+    is sniffed from the first chunk and the content hashed on the way.
+    Only the header is parsed afterwards, to reject decompression bombs
+    before anything decodes the pixels. The caller moves the temp file
+    into place with os.replace, or removes it.
+    @param stream: A readable binary file object.
+    @param folder: The staging folder of the temp file, not served and on
+    the same filesystem as the destination, so the final rename is atomic.
+    @param max_bytes: The maximum size of the file.
+    @param max_pixels: The maximum width * height of the image.
+    @return: An IngestedImage.
+    """
+    path = temp_path(folder, "upload")
+    try:
+        digest = hashlib.sha256()
+        size = 0
+        with open(path, "wb") as out:
+            head = stream.read(_SNIFF_SIZE)
+            sniffed = sniff_format(head)
+            if sniffed is None:
+                raise UploadRejected(
+                    "Only JPEG, PNG, GIF and WebP images are accepted."
+                )
+            chunk = head
+            while chunk:
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadRejected(
+                        f"Images can be at most {max_bytes // (1024 * 1024)} MB."
+                    )
+                digest.update(chunk)
+                out.write(chunk)
+                chunk = stream.read(CHUNK_SIZE)
+        fmt, ext = sniffed
+        try:
+            # Image.open only parses the header; Pillow's own bomb check
+            # raises for images over twice its MAX_IMAGE_PIXELS
+            with Image.open(path, formats=[fmt]) as img:
+                width, height = img.size
+                # Pillow does not report every chunk or segment that carries
+                # metadata (e.g. PNG tEXt, JPEG COM or IPTC), so the formats
+                # the container-level strippers handle are always stripped
+                has_metadata = fmt in STRIPPERS or any(
+                    key in img.info for key in _METADATA_KEYS
+                )
+                # the EXIF block is parsed with the header, not the pixels
+                orientation = img.getexif().get(ORIENTATION_TAG, 1)
+                if orientation not in range(1, 9):
+                    orientation = 1
+        except (OSError, Image.DecompressionBombError) as err:
+            raise UploadRejected("The image could not be read.") from err
+        if width * height > max_pixels:
+            raise UploadRejected(
+                f"Images can be at most {max_pixels // 1000000} megapixels."
+            )
+    except BaseException:
+        os.remove(path)
+        raise
+    return IngestedImage(
+        path, digest.hexdigest(), fmt, ext, width, height, has_metadata, orientation
+    )
+
+
+def hash_file(path: str) -> str:
+    """
+    Get the sha256 of a file, the content_hash it would be stored under.
+    @param path: The path of the file.
+    @return: The hex digest.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def ingest_file(
+    path: str, folder: str, max_bytes: int, max_pixels: int, policy
+) -> dict:
+    """
+    Ingest a local image like an upload: copy it into a temp file in folder
+    through the same checks, prepare it for storage and compute its perceptual
+    hash. Runs in a worker process, so it only takes and returns plain values.
+    @param path: The path of the image.
+    @param folder: The staging folder of the temp file, see ingest_stream.
+    @param max_bytes: The maximum size of the image.
+    @param max_pixels: The maximum width * height of the image.
+    @param policy: The NormalizePolicy of the stored originals.
+    @return: A dict with the "path" of the temp file, its "content_hash",
+    the "ext" it is stored with and its "phash" (None if it could not be
+    computed).
+    @raise UploadRejected: If the file is not an accepted image or too large.
+    """
+    with open(path, "rb") as file:
+        ingested = ingest_stream(file, folder, max_bytes, max_pixels)
+    try:
+        target, ext = stored_format(ingested, policy)
+        prepare_original(ingested, target, policy)
+        try:
+            # a normalized original was turned upright
+            orientation = ingested.orientation if target is None else 1
+            phash = to_signed(dhash_file(ingested.path, orientation))
+        except (OSError, ValueError):
+            phash = None
+    except BaseException:
+        os.remove(ingested.path)
+        raise
+    return dict(
+        path=ingested.path,
+        content_hash=ingested.content_hash,
+        ext=ext,
+        phash=phash,
+    )
+
+
+def stored_format(ingested: IngestedImage, policy):
+    """
+    Decide how an ingested image is stored, from its header and size.
+    @param ingested: The IngestedImage.
+    @param policy: The NormalizePolicy of the stored originals.
+    @return: A (Pillow format to normalize into or None, extension) tuple.
+    """
+    target = normalized_format(
+        ingested.path, ingested.format, ingested.width, ingested.height, policy
+    )
+    return target, NORMALIZED_EXTENSIONS.get(target, ingested.ext)
+
+
+def prepare_original(ingested: IngestedImage, target: str, policy) -> None:
+    """
+    Turn the temp file of an ingested image into the original that is
+    stored: strip its metadata, then normalize it if it exceeds the policy,
+    keeping the stripped upload in cold storage first if the policy asks to.
+    @param ingested: The IngestedImage.
+    @param target: The format returned by stored_format, None to only strip.
+    @param policy: The NormalizePolicy of the stored originals.
+    @return: None
+    @raise UploadRejected: If the image cannot be decoded.
+    """
+    if ingested.has_metadata:
+        remove_metadata(ingested.path, ingested.format, ingested.orientation)
+    if target is not None:
+        if policy.pristine_folder:
+            keep_pristine(
+                ingested.path,
+                pristine_path(
+                    policy.pristine_folder, ingested.content_hash, ingested.ext
+                ),
+            )
+        try:
+            normalize_image(ingested.path, target, ingested.orientation, policy)
+        except (OSError, Image.DecompressionBombError) as err:
+            # e.g. a truncated upload, whose header was fine
+            raise UploadRejected("The image could not be read.") from err
+
+
+def remove_metadata(path: str, fmt: str = None, orientation: int = 1) -> None:
+    """
+    Drop the EXIF, XMP and other metadata of an image in place. JPEG, PNG
+    and WebP are stripped losslessly at the container level, keeping only
+    the orientation, see app.utils.metadata. Other formats, or files the
+    stripper cannot parse, are re-encoded with every frame of an animation.
+    @param path: The path of the image.
+    @param fmt: The Pillow format of the image, as sniffed at ingest.
+    @param orientation: The EXIF orientation to keep.
+    @return: None
+    """
+    partial = temp_path(os.path.dirname(path), "upload")
+    try:
+        stripper = STRIPPERS.get(fmt)
+        if stripper is not None:
+            with open(path, "rb") as file:
+                data = file.read()
+            try:
+                data = stripper(data, orientation)
+            except (ValueError, IndexError, struct.error):
+                stripper = None
+            else:
+                with open(partial, "wb") as out:
+                    out.write(data)
+        if stripper is None:
+            with Image.open(path) as img:
+                # Pillow writes a GIF comment back unless it is dropped
+                img.info.pop("comment", None)
+                # frames are read lazily, so write next to the original and swap
+                img.save(
+                    partial,
+                    format=img.format,
+                    save_all=getattr(img, "is_animated", False),
+                )
+        os.replace(partial, path)
+    finally:
+        remove_files([partial])
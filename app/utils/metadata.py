@@ -0,0 +1,192 @@
+import struct, zlib
+
+# Lossless metadata stripping at the container level: the EXIF, XMP, IPTC
+# and comment segments of JPEG, PNG and WebP files are dropped without
+# decoding or re-encoding the image data. What changes how the image renders
+# (color profiles, transparency, animation) is kept, plus a minimal EXIF
+# block with the orientation so browsers still show rotated photos upright.
+
+# the EXIF tag browsers and the thumbnailer rotate images by
+ORIENTATION_TAG = 0x0112
+
+_JPEG_SOI = b"\xff\xd8"
+_JPEG_EOI = 0xD9
+_JPEG_SOS = 0xDA
+_JPEG_APP0 = 0xE0
+_JPEG_APP2 = 0xE2
+_JPEG_APP14 = 0xEE
+_JPEG_COM = 0xFE
+# markers without a length: TEM and RST0-7
+_JPEG_STANDALONE = {0x01, *range(0xD0, 0xD8)}
+
+_PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+# ancillary chunks that change how the image renders, including APNG
+_PNG_KEEP = {
+    b"tRNS",
+    b"gAMA",
+    b"cHRM",
+    b"sRGB",
+    b"iCCP",
+    b"sBIT",
+    b"pHYs",
+    b"bKGD",
+    b"acTL",
+    b"fcTL",
+    b"fdAT",
+}
+
+# VP8X flags of the metadata chunks
+_WEBP_EXIF_FLAG = 0x08
+_WEBP_XMP_FLAG = 0x04
+
+
+def orientation_exif(orientation: int) -> bytes:
+    """
+    Build a TIFF-structured EXIF block holding only the orientation.
+    @param orientation: The EXIF orientation, 1 to 8.
+    @return: The EXIF block, without the JPEG "Exif" header.
+    """
+    return (
+        b"MM\x00\x2a\x00\x00\x00\x08"
+        + struct.pack(">HHHIHH", 1, ORIENTATION_TAG, 3, 1, orientation, 0)
+        + b"\x00\x00\x00\x00"
+    )
+
+
+def strip_jpeg(data: bytes, orientation: int = 1) -> bytes:
+    """
+    Drop the APPn and COM segments of a JPEG except JFIF (APP0), ICC
+    profiles (APP2) and Adobe color transforms (APP14), and anything after
+    the end of the image, e.g. MPF preview images.
+    @param data: The JPEG file.
+    @param orientation: Written back as a minimal EXIF segment unless 1.
+    @return: The stripped file.
+    """
+    if not data.startswith(_JPEG_SOI):
+        raise ValueError("Not a JPEG file.")
+    out = [_JPEG_SOI]
+    exif = None
+    if orientation != 1:
+        exif = b"Exif\x00\x00" + orientation_exif(orientation)
+        exif = b"\xff\xe1" + struct.pack(">H", len(exif) + 2) + exif
+    pos = 2
+    while pos < len(data):
+        if data[pos] != 0xFF:
+            raise ValueError("Invalid JPEG marker.")
+        marker = data[pos + 1]
+        if marker == 0xFF:
+            # fill byte before a marker
+            pos += 1
+            continue
+        if marker == _JPEG_EOI:
+            out.append(data[pos : pos + 2])
+            break
+        if marker in _JPEG_STANDALONE:
+            out.append(data[pos : pos + 2])
+            pos += 2
+            continue
+        (length,) = struct.unpack(">H", data[pos + 2 : pos + 4])
+        end = pos + 2 + length
+        payload = data[pos + 4 : end]
+        app = _JPEG_APP0 <= marker <= 0xEF
+        keep = not app and marker != _JPEG_COM
+        keep = keep or marker in (_JPEG_APP0, _JPEG_APP14)
+        keep = keep or (marker == _JPEG_APP2 and payload.startswith(b"ICC_PROFILE\x00"))
+        if keep:
+            if exif is not None and marker != _JPEG_APP0:
+                # EXIF goes right after SOI, or after JFIF's APP0
+                out.append(exif)
+                exif = None
+            out.append(data[pos:end])
+        pos = end
+        if marker == _JPEG_SOS:
+            # entropy-coded data runs to the next marker that is not a
+            # stuffed 0xFF00 or a restart marker
+            scan_end = pos
+            while True:
+                scan_end = data.find(b"\xff", scan_end)
+                if scan_end == -1 or scan_end + 1 >= len(data):
+                    raise ValueError("Truncated JPEG scan.")
+                following = data[scan_end + 1]
+                if following == 0x00 or 0xD0 <= following <= 0xD7:
+                    scan_end += 2
+                    continue
+                break
+            out.append(data[pos:scan_end])
+            pos = scan_end
+    return b"".join(out)
+
+
+def _png_chunk(kind: bytes, payload: bytes) -> bytes:
+    """Serialize a PNG chunk with its CRC."""
+    return (
+        struct.pack(">I", len(payload))
+        + kind
+        + payload
+        + struct.pack(">I", zlib.crc32(kind + payload))
+    )
+
+
+def strip_png(data: bytes, orientation: int = 1) -> bytes:
+    """
+    Drop the ancillary chunks of a PNG that do not affect rendering, e.g.
+    tEXt, zTXt, iTXt, eXIf and tIME.
+    @param data: The PNG file.
+    @param orientation: Written back as a minimal eXIf chunk unless 1.
+    @return: The stripped file.
+    """
+    if not data.startswith(_PNG_SIGNATURE):
+        raise ValueError("Not a PNG file.")
+    out = [_PNG_SIGNATURE]
+    pos = len(_PNG_SIGNATURE)
+    while pos + 8 <= len(data):
+        length, kind = struct.unpack(">I4s", data[pos : pos + 8])
+        end = pos + 12 + length
+        if kind == b"IDAT" and orientation != 1:
+            # eXIf must precede the image data
+            out.append(_png_chunk(b"eXIf", orientation_exif(orientation)))
+            orientation = 1
+        if kind[0] & 0x20 == 0 or kind in _PNG_KEEP:
+            out.append(data[pos:end])
+        pos = end
+        if kind == b"IEND":
+            break
+    return b"".join(out)
+
+
+def strip_webp(data: bytes, orientation: int = 1) -> bytes:
+    """
+    Drop the EXIF and XMP chunks of an extended WebP and clear their flags.
+    @param data: The WebP file.
+    @param orientation: Written back as a minimal EXIF chunk unless 1.
+    @return: The stripped file.
+    """
+    if data[:4] != b"RIFF" or data[8:12] != b"WEBP":
+        raise ValueError("Not a WebP file.")
+    chunks = []
+    pos = 12
+    while pos + 8 <= len(data):
+        kind, length = struct.unpack("<4sI", data[pos : pos + 8])
+        end = pos + 8 + length + (length & 1)
+        if kind not in (b"EXIF", b"XMP "):
+            chunks.append(bytearray(data[pos:end]))
+        pos = end
+    if chunks and chunks[0][:4] == b"VP8X":
+        flags = chunks[0][8] & ~(_WEBP_EXIF_FLAG | _WEBP_XMP_FLAG)
+        if orientation != 1:
+            exif = orientation_exif(orientation)
+            chunks.append(
+                b"EXIF"
+                + struct.pack("<I", len(exif))
+                + exif
+                + b"\x00" * (len(exif) & 1)
+            )
+            flags |= _WEBP_EXIF_FLAG
+        chunks[0][8] = flags
+    # a simple (VP8/VP8L) WebP cannot carry metadata or an orientation
+    body = b"WEBP" + b"".join(chunks)
+    return b"RIFF" + struct.pack("<I", len(body)) + body
+
+
+# the container-level strippers by Pillow format
+STRIPPERS = {"JPEG": strip_jpeg, "PNG": strip_png, "WEBP": strip_webp}
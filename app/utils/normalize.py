@@ -0,0 +1,143 @@
+import os, shutil
+from collections import namedtuple
+from io import BytesIO
+from PIL import Image
+from .storage import content_filename, remove_files, sharded_folder, temp_path
+from .thumbnails import apply_orientation
+
+# The ingest policy bounding the originals that are stored and served:
+# uploads over the maximum long edge or byte size are downscaled and
+# re-encoded into the target format, trying each quality of the ladder,
+# best first, until the file fits. Smaller uploads are stored as uploaded.
+
+# the policy, see Meme.normalize_policy: max_edge and max_bytes are 0 to
+# disable the bound, format is a Pillow format or None to keep the uploaded
+# one, qualities is the ladder and pristine_folder is where the uploads are
+# kept before normalization, None to drop them
+NormalizePolicy = namedtuple(
+    "NormalizePolicy",
+    ["max_edge", "format", "qualities", "max_bytes", "pristine_folder"],
+)
+
+# the formats originals are normalized into, by Pillow format
+NORMALIZED_EXTENSIONS = {"JPEG": "jpg", "PNG": "png", "WEBP": "webp"}
+
+# images are not downscaled below this long edge to meet max_bytes
+_MIN_EDGE = 640
+
+
+def normalized_format(path: str, fmt: str, width: int, height: int, policy):
+    """
+    Decide whether an ingested image is normalized, from its header and size.
+    Animations are stored as uploaded.
+    @param path: The path of the image.
+    @param fmt: The Pillow format of the image.
+    @param width: The width of the image.
+    @param height: The height of the image.
+    @param policy: The NormalizePolicy.
+    @return: The Pillow format to re-encode the image in, or None to keep it.
+    """
+    too_large = policy.max_edge and max(width, height) > policy.max_edge
+    too_heavy = policy.max_bytes and os.path.getsize(path) > policy.max_bytes
+    if not (too_large or too_heavy):
+        return None
+    with Image.open(path) as img:
+        if getattr(img, "is_animated", False):
+            return None
+    if policy.format:
+        return policy.format
+    # a still GIF is kept lossless
+    return fmt if fmt in NORMALIZED_EXTENSIONS else "PNG"
+
+
+def pristine_path(folder: str, content_hash: str, ext: str) -> str:
+    """
+    Get the path the pristine upload of some content is kept at.
+    @param folder: The pristine folder of the policy.
+    @param content_hash: The sha256 of the upload.
+    @param ext: The extension of the upload.
+    @return: The path.
+    """
+    filename = content_filename(content_hash, ext)
+    return os.path.join(sharded_folder(folder, filename), filename)
+
+
+def keep_pristine(path: str, target: str) -> None:
+    """
+    Copy an upload into cold storage before it is normalized, unless the
+    same content is already kept.
+    @param path: The path of the upload.
+    @param target: The path returned by pristine_path.
+    @return: None
+    """
+    if os.path.exists(target):
+        return
+    folder = os.path.dirname(target)
+    os.makedirs(folder, exist_ok=True)
+    partial = temp_path(folder, "pristine")
+    try:
+        shutil.copyfile(path, partial)
+        os.replace(partial, target)
+    finally:
+        remove_files([partial])
+
+
+def _encode(img: Image.Image, fmt: str, quality: int) -> bytes:
+    """Encode an image in memory."""
+    out = BytesIO()
+    if fmt == "PNG":
+        img.save(out, "PNG", optimize=True)
+    elif fmt == "WEBP":
+        img.save(out, "WEBP", quality=quality, method=4)
+    else:
+        img.save(out, fmt, quality=quality, optimize=True, progressive=True)
+    return out.getvalue()
+
+
+def _encode_within(img: Image.Image, fmt: str, policy):
+    """Encode an image at the best quality of the ladder that fits max_bytes, None if none does."""
+    # PNG has no quality, a single attempt decides
+    qualities = policy.qualities if fmt != "PNG" else policy.qualities[:1]
+    for quality in qualities:
+        data = _encode(img, fmt, quality)
+        if not policy.max_bytes or len(data) <= policy.max_bytes:
+            return data
+    return None
+
+
+def normalize_image(path: str, fmt: str, orientation: int, policy) -> None:
+    """
+    Downscale an image to the policy's long edge and re-encode it in place,
+    turned upright. If no quality of the ladder fits max_bytes, the image
+    is downscaled further, down to a long edge of 640 pixels, where the
+    lowest quality is kept.
+    @param path: The path of the image.
+    @param fmt: The Pillow format to encode, see normalized_format.
+    @param orientation: The EXIF orientation of the image, baked into the pixels.
+    @param policy: The NormalizePolicy.
+    @return: None
+    """
+    with Image.open(path) as img:
+        if policy.max_edge:
+            # JPEGs are decoded at a reduced scale when that is still large enough
+            img.draft("RGB", (policy.max_edge, policy.max_edge))
+        img = apply_orientation(img, orientation)
+        if fmt == "JPEG":
+            img = img.convert("RGB" if img.mode != "L" else "L")
+        elif img.mode not in ("RGB", "RGBA", "L", "LA"):
+            img = img.convert("RGBA" if "transparency" in img.info else "RGB")
+        if policy.max_edge:
+            img.thumbnail((policy.max_edge, policy.max_edge), Image.LANCZOS)
+        while True:
+            data = _encode_within(img, fmt, policy)
+            if data is not None:
+                break
+            width, height = img.size
+            if max(width, height) * 3 // 4 < _MIN_EDGE:
+                data = _encode(img, fmt, policy.qualities[-1])
+                break
+            img = img.resize(
+                (max(1, width * 3 // 4), max(1, height * 3 // 4)), Image.LANCZOS
+            )
+    with open(path, "wb") as out:
+        out.write(data)
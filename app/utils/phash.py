@@ -0,0 +1,197 @@
+import threading
+from itertools import combinations
+from PIL import Image
+from .thumbnails import apply_orientation
+
+# dHash compares horizontally adjacent pixels of a 9x8 grayscale image
+HASH_BITS = 64
+_HASH_MASK = (1 << HASH_BITS) - 1
+
+
+def dhash(img: Image.Image, orientation: int = 1) -> int:
+    """
+    Compute the 64 bit difference hash of an image. Re-encoded, resized or
+    lightly edited copies of an image have hashes a few bits apart.
+    The image is hashed upright, so a photo stored with an EXIF
+    orientation hashes like its rotated thumbnails and re-uploads.
+    @param img: An open image; JPEGs should not be loaded yet so the
+    decoder can use its fastest reduced scale.
+    @param orientation: The EXIF orientation of the image, see Meme.orientation.
+    @return: The hash as an unsigned 64 bit int.
+    """
+    img.draft("L", (64, 64))
+    img = apply_orientation(img.convert("L"), orientation)
+    pixels = img.resize((9, 8), Image.Resampling.LANCZOS).tobytes()
+    value = 0
+    for row in range(8):
+        for col in range(8):
+            left = pixels[row * 9 + col]
+            right = pixels[row * 9 + col + 1]
+            value = (value << 1) | (left > right)
+    return value
+
+
+def dhash_file(path: str, orientation: int = 1) -> int:
+    """
+    Compute the difference hash of an image file.
+    @param path: The path of the image.
+    @param orientation: The EXIF orientation of the image, 1 if it is upright.
+    @return: The hash as an unsigned 64 bit int.
+    """
+    with Image.open(path) as img:
+        return dhash(img, orientation)
+
+
+def to_signed(value: int) -> int:
+    """Convert an unsigned 64 bit hash to the signed value stored in BIGINT columns."""
+    return value - (1 << HASH_BITS) if value >> (HASH_BITS - 1) else value
+
+
+def to_unsigned(value: int) -> int:
+    """Convert a hash read from a BIGINT column back to unsigned."""
+    return value & _HASH_MASK
+
+
+def hamming(a: int, b: int) -> int:
+    """Get the number of differing bits of two unsigned hashes."""
+    return (a ^ b).bit_count()
+
+
+class MultiIndexHash:
+    """
+    An in-memory index for Hamming-distance lookups of 64 bit hashes
+    (multi-index hashing, Norouzi et al.).
+
+    Each hash is split into `chunks` substrings, each with its own table.
+    By the pigeonhole principle, two hashes within distance r agree within
+    r // chunks bits on at least one substring, so a lookup only probes the
+    substrings close to the query's and verifies those few candidates,
+    instead of scanning every hash.
+
+    @field chunks: The number of substrings. 3 (21-22 bit tables) keeps the
+    candidate lists short up to a million hashes for distances up to 8.
+    """
+
+    def __init__(self, chunks: int = 3) -> None:
+        """
+        Instantiate an object of the class.
+        @param chunks: The number of substrings each hash is split into.
+        @return: None
+        """
+        self.chunks = chunks
+        # (shift, width) of each substring, widths differ by at most one bit
+        self._chunks = []
+        shift = 0
+        for index in range(chunks):
+            width = (HASH_BITS - shift) // (chunks - index)
+            self._chunks.append((shift, width))
+            shift += width
+        self._flips = {}
+        self._tables = [dict() for _ in range(chunks)]
+        self._ids = {}
+        # the hash of each item, to move or remove it
+        self._values = {}
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        """Get the number of distinct hashes in the index."""
+        return len(self._ids)
+
+    def _substrings(self, value: int):
+        """Yield (table index, substring) pairs of a hash."""
+        for index, (shift, width) in enumerate(self._chunks):
+            yield index, (value >> shift) & ((1 << width) - 1)
+
+    def add(self, value: int, item_id: int) -> None:
+        """
+        Add an item to the index. An item already in it under another hash
+        is moved to the new one.
+        @param value: The unsigned hash of the item.
+        @param item_id: The id of the item, e.g. a meme id.
+        @return: None
+        """
+        with self._lock:
+            previous = self._values.get(item_id)
+            if previous == value:
+                return
+            if previous is not None:
+                self.remove(item_id)
+            ids = self._ids.get(value)
+            if ids is None:
+                self._ids[value] = ids = []
+                for index, substring in self._substrings(value):
+                    self._tables[index].setdefault(substring, []).append(value)
+            ids.append(item_id)
+            self._values[item_id] = value
+
+    def remove(self, item_id: int) -> None:
+        """
+        Remove an item from the index, if it is in it.
+        @param item_id: The id of the item.
+        @return: None
+        """
+        with self._lock:
+            value = self._values.pop(item_id, None)
+            if value is None:
+                return
+            ids = self._ids[value]
+            ids.remove(item_id)
+            if ids:
+                return
+            # the last item with this hash
+            del self._ids[value]
+            for index, substring in self._substrings(value):
+                table = self._tables[index]
+                values = table[substring]
+                values.remove(value)
+                if not values:
+                    del table[substring]
+
+    def _flip_masks(self, width: int, radius: int) -> list:
+        """Get the XOR masks that flip up to radius of width bits, cached."""
+        key = (width, radius)
+        masks = self._flips.get(key)
+        if masks is None:
+            masks = [
+                sum(1 << bit for bit in bits)
+                for distance in range(radius + 1)
+                for bits in combinations(range(width), distance)
+            ]
+            self._flips[key] = masks
+        return masks
+
+    def search(self, value: int, max_distance: int) -> list:
+        """
+        Find the items within max_distance bits of a hash.
+        @param value: The unsigned hash to look up.
+        @param max_distance: The maximum Hamming distance.
+        @return: A list of (distance, item id) tuples, nearest first.
+        """
+        radius = max_distance // self.chunks
+        matches = {}
+        with self._lock:
+            for index, substring in self._substrings(value):
+                table = self._tables[index]
+                for mask in self._flip_masks(self._chunks[index][1], radius):
+                    for candidate in table.get(substring ^ mask, ()):
+                        if candidate in matches:
+                            continue
+                        distance = hamming(value, candidate)
+                        if distance <= max_distance:
+                            matches[candidate] = distance
+            found = [
+                (distance, item_id)
+                for candidate, distance in matches.items()
+                for item_id in self._ids[candidate]
+            ]
+        return sorted(found)
+
+    def clear(self) -> None:
+        """
+        Remove every item from the index.
+        @return: None
+        """
+        with self._lock:
+            self._tables = [dict() for _ in range(self.chunks)]
+            self._ids = {}
+            self._values = {}
@@ -0,0 +1,164 @@
+import hashlib, os, re, threading, uuid
+from concurrent.futures import ThreadPoolExecutor
+from .thumbnails import (
+    MODERN_FORMATS,
+    THUMBNAIL_SIZES,
+    animated_thumbnail_filename,
+    thumbnail_filename,
+    variant_filename,
+)
+
+# bytes read per chunk while hashing and copying uploads
+CHUNK_SIZE = 64 * 1024
+
+# originals and thumbnails are spread over SHARD_LEVELS levels of
+# subdirectories named after hex digits of the content hash, e.g.
+# uploads/ab/cd/abcd...png, so no directory grows past a few hundred files
+SHARD_LEVELS = 2
+
+_CONTENT_HASH = re.compile(r"[0-9a-f]{64}")
+
+# paths unlinked per task of the background removal pool
+_REMOVAL_BATCH = 256
+
+_removal_pool = None
+_removal_pool_lock = threading.Lock()
+
+
+def content_filename(content_hash: str, ext: str) -> str:
+    """
+    Get the content-addressed filename of an original.
+    @param content_hash: The sha256 hex digest of the content.
+    @param ext: The file extension, without the dot.
+    @return: The filename.
+    """
+    return f"{content_hash}.{ext.lower()}"
+
+
+def shard_dir(filename: str) -> str:
+    """
+    Get the subdirectory an original and its thumbnails are stored in.
+    Content-addressed files are sharded by their hash, older files by the
+    hash of their name.
+    @param filename: The filename of the original.
+    @return: The relative subdirectory, e.g. "ab/cd".
+    """
+    key = os.path.splitext(filename)[0]
+    if not _CONTENT_HASH.fullmatch(key):
+        key = hashlib.sha256(filename.encode("utf-8")).hexdigest()
+    return "/".join(key[level * 2 : level * 2 + 2] for level in range(SHARD_LEVELS))
+
+
+def sharded_folder(folder: str, filename: str, create: bool = False) -> str:
+    """
+    Get the shard of folder an original and its thumbnails belong in.
+    @param folder: The uploads or thumbnails folder.
+    @param filename: The filename of the original.
+    @param create: Create the directory if it does not exist.
+    @return: The path of the shard.
+    """
+    path = os.path.join(folder, *shard_dir(filename).split("/"))
+    if create:
+        os.makedirs(path, exist_ok=True)
+    return path
+
+
+def is_sharded(path: str, filename: str) -> bool:
+    """
+    Check if a stored path is in the shard of an original.
+    @param path: The path of the original or one of its thumbnails.
+    @param filename: The filename of the original.
+    @return: Whether the path is in the sharded layout.
+    """
+    parent = os.path.normpath(os.path.dirname(path)).replace(os.sep, "/")
+    return parent.endswith("/" + shard_dir(filename))
+
+
+def locate_original(folder: str, filename: str) -> str:
+    """
+    Find an original stored in either layout, e.g. for a repost of content
+    stored before the uploads were sharded.
+    @param folder: The uploads folder.
+    @param filename: The filename of the original.
+    @return: The sharded path, unless only the flat path exists.
+    """
+    sharded = os.path.join(sharded_folder(folder, filename), filename)
+    flat = os.path.join(folder, filename)
+    if not os.path.exists(sharded) and os.path.exists(flat):
+        return flat
+    return sharded
+
+
+def temp_path(folder: str, ext: str) -> str:
+    """
+    Get a unique path for a partially written file in folder. Keeping the
+    temp file in the destination folder makes the final os.replace atomic.
+    @param folder: The destination folder.
+    @param ext: The file extension, without the dot.
+    @return: The temp path.
+    """
+    return os.path.join(folder, f".partial-{uuid.uuid4()}.{ext.lower()}")
+
+
+def thumbnail_paths(thumb_folder: str, filename: str) -> list:
+    """
+    Get the paths of every thumbnail variant an original can have.
+    @param thumb_folder: The thumbnails folder.
+    @param filename: The filename of the original.
+    @return: A list of paths, which may or may not exist.
+    """
+    return [
+        os.path.join(thumb_folder, thumbnail_filename(size_type, filename, fmt))
+        for size_type in THUMBNAIL_SIZES
+        for fmt in (None, *MODERN_FORMATS)
+    ] + [os.path.join(thumb_folder, animated_thumbnail_filename(filename))]
+
+
+def variant_filenames(filename: str, widths: list) -> list:
+    """
+    Get the filenames of every resized variant an original can have.
+    @param filename: The filename of the original.
+    @param widths: The widths variants are rendered at.
+    @return: A list of filenames, which may or may not be cached.
+    """
+    return [
+        variant_filename(filename, width, fmt)
+        for width in widths
+        for fmt in (None, *MODERN_FORMATS)
+    ]
+
+
+def remove_files(paths) -> None:
+    """
+    Delete files, ignoring the ones that are already gone.
+    @param paths: The paths to delete; None entries are skipped.
+    @return: None
+    """
+    for path in paths:
+        if not path:
+            continue
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def remove_files_later(paths, workers: int = 4) -> list:
+    """
+    Delete files on a background thread pool shared by the process, e.g.
+    after a purge committed, so the caller does not wait for the unlinks.
+    @param paths: The paths to delete; None entries are skipped.
+    @param workers: The size of the pool, used when it is first created.
+    @return: The futures of the submitted batches.
+    """
+    global _removal_pool
+    with _removal_pool_lock:
+        if _removal_pool is None:
+            _removal_pool = ThreadPoolExecutor(
+                max_workers=workers, thread_name_prefix="file-removal"
+            )
+    paths = [path for path in paths if path]
+    return [
+        _removal_pool.submit(remove_files, paths[start : start + _REMOVAL_BATCH])
+        for start in range(0, len(paths), _REMOVAL_BATCH)
+    ]
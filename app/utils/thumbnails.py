@@ -0,0 +1,352 @@
+import base64, os
+from io import BytesIO
+from PIL import Image, ImageSequence
+
+# the bounding box of each thumbnail size
+THUMBNAIL_SIZES = {"sm": (309, 309), "md": (468, 468)}
+
+# bump whenever render_thumbnails writes different output, so the immutable
+# media URLs of existing thumbnails change with it
+THUMBNAIL_VERSION = 1
+
+# modern formats written next to the legacy thumbnail, best first. AVIF is
+# only written when the installed Pillow can encode it.
+MODERN_FORMATS = {
+    "avif": dict(format="AVIF", quality=55, speed=6),
+    "webp": dict(format="WEBP", quality=80, method=4),
+}
+
+# the long edge of the inline placeholder image, and its encoding
+PLACEHOLDER_SIZE = 16
+PLACEHOLDER_FORMAT = dict(format="WEBP", quality=40, method=6)
+
+# the transposition that displays an image upright, by EXIF orientation
+_ORIENTATION_TRANSPOSE = {
+    2: Image.Transpose.FLIP_LEFT_RIGHT,
+    3: Image.Transpose.ROTATE_180,
+    4: Image.Transpose.FLIP_TOP_BOTTOM,
+    5: Image.Transpose.TRANSPOSE,
+    6: Image.Transpose.ROTATE_270,
+    7: Image.Transpose.TRANSVERSE,
+    8: Image.Transpose.ROTATE_90,
+}
+
+# the encoder of the animated variant of animated GIFs and WebPs
+ANIMATION_FORMAT = dict(format="WEBP", quality=70, method=4)
+
+# the animated variant is scaled down by this factor until it fits the byte cap
+_ANIMATION_DOWNSCALE = 0.75
+_ANIMATION_MIN_SIDE = 120
+
+
+def supported_modern_formats() -> list:
+    """
+    Get the modern formats the installed Pillow can encode.
+    @return: A list of MODERN_FORMATS keys, best first.
+    """
+    Image.init()
+    return [
+        fmt
+        for fmt, options in MODERN_FORMATS.items()
+        if options["format"] in Image.SAVE
+    ]
+
+
+def alternative_formats(filename: str, formats: list) -> list:
+    """
+    Get the modern formats worth offering next to the original's format,
+    i.e. all but the original's own, e.g. no WebP copy of a WebP original.
+    @param filename: The filename of the original.
+    @param formats: MODERN_FORMATS keys.
+    @return: The formats, in the same order.
+    """
+    ext = os.path.splitext(filename)[1].lstrip(".").lower()
+    return [fmt for fmt in formats if fmt != ext]
+
+
+def thumbnail_filename(size_type: str, filename: str, fmt: str = None) -> str:
+    """
+    Get the filename of a thumbnail.
+    @param size_type: A key of THUMBNAIL_SIZES.
+    @param filename: The filename of the original.
+    @param fmt: A key of MODERN_FORMATS, or None for the original's format.
+    @return: The filename of the thumbnail.
+    """
+    if fmt is not None:
+        filename = f"{os.path.splitext(filename)[0]}.{fmt}"
+    return f"{size_type}_thumbnail_{filename}"
+
+
+def apply_orientation(img: Image.Image, orientation: int) -> Image.Image:
+    """
+    Turn an image upright, see Meme.orientation.
+    @param img: The image as stored.
+    @param orientation: The EXIF orientation recorded at ingest, 1 to 8.
+    @return: The upright image, img itself if it already is.
+    """
+    transpose = _ORIENTATION_TRANSPOSE.get(orientation)
+    return img if transpose is None else img.transpose(transpose)
+
+
+def upright_size(size: tuple, orientation: int) -> tuple:
+    """Get the displayed (width, height) of an image stored with an EXIF orientation."""
+    width, height = size
+    return (height, width) if orientation in (5, 6, 7, 8) else (width, height)
+
+
+def fit_size(size: tuple, box: tuple) -> tuple:
+    """Get the size Image.thumbnail scales an image of size down to, to fit box."""
+    width, height = size
+    scale = min(box[0] / width, box[1] / height, 1)
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def placeholder(img: Image.Image) -> dict:
+    """
+    Describe an upright image, e.g. a thumbnail, for the placeholder shown
+    until its thumbnail loads.
+    @param img: The image.
+    @return: A dict with its dominant "color" as #rrggbb and a "placeholder",
+    a data URI of a PLACEHOLDER_SIZE pixels copy of it.
+    """
+    img = img.convert("RGBA")
+    # transparent memes are shown on the card's white background
+    flat = Image.new("RGB", img.size, (255, 255, 255))
+    flat.paste(img, mask=img.getchannel("A"))
+    tiny = flat.copy()
+    tiny.thumbnail((PLACEHOLDER_SIZE, PLACEHOLDER_SIZE), Image.LANCZOS)
+    # the most common color of a coarse palette, not the average
+    palette = tiny.quantize(colors=5)
+    _, index = max(palette.getcolors())
+    color = palette.getpalette()[index * 3 : index * 3 + 3]
+    out = BytesIO()
+    tiny.save(out, **PLACEHOLDER_FORMAT)
+    return dict(
+        color="#{:02x}{:02x}{:02x}".format(*color),
+        placeholder=f"data:image/{PLACEHOLDER_FORMAT['format'].lower()};base64,"
+        + base64.b64encode(out.getvalue()).decode(),
+    )
+
+
+def describe_thumbnail(
+    thumb_path: str, filepath: str = None, orientation: int = 1
+) -> dict:
+    """
+    Compute the placeholder of a meme from its existing thumbnail, e.g. to
+    backfill memes thumbnailed before placeholders existed. The original is
+    never decoded, only its header is read for its dimensions.
+    @param thumb_path: The path of a thumbnail.
+    @param filepath: The path of the original, None to skip its dimensions.
+    @param orientation: The EXIF orientation of the original.
+    @return: The dict of placeholder, plus the displayed "size" and the
+    "file_size" of the original if filepath is given.
+    """
+    with Image.open(thumb_path) as img:
+        result = placeholder(img)
+    if filepath is not None:
+        with Image.open(filepath) as img:
+            result["size"] = upright_size(img.size, orientation)
+        result["file_size"] = os.path.getsize(filepath)
+    return result
+
+
+def animated_thumbnail_filename(filename: str) -> str:
+    """
+    Get the filename of the animated WebP variant of an animated original.
+    @param filename: The filename of the original.
+    @return: The filename of the variant.
+    """
+    return f"animated_thumbnail_{os.path.splitext(filename)[0]}.webp"
+
+
+def render_animation(
+    filepath: str, out_path: str, size: tuple, max_bytes: int, max_frames: int
+) -> bool:
+    """
+    Write an animated WebP of an animated GIF or WebP, fit into size and
+    cut after max_frames. If it exceeds max_bytes, the frames are scaled
+    down until it fits, or the variant is dropped.
+    @param filepath: The path of the original.
+    @param out_path: The path of the variant.
+    @param size: The bounding box of the frames.
+    @param max_bytes: The maximum size of the variant.
+    @param max_frames: The maximum number of frames kept.
+    @return: Whether the variant was written.
+    """
+    frames = []
+    durations = []
+    with Image.open(filepath) as img:
+        loop = img.info.get("loop", 0)
+        for frame in ImageSequence.Iterator(img):
+            if len(frames) == max_frames:
+                break
+            # GIFs store 0 for "as fast as possible", which browsers play at 10 fps
+            durations.append(frame.info.get("duration") or 100)
+            frame = frame.convert("RGBA")
+            frame.thumbnail(size)
+            frames.append(frame)
+    while True:
+        frames[0].save(
+            out_path,
+            save_all=True,
+            append_images=frames[1:],
+            duration=durations,
+            loop=loop,
+            **ANIMATION_FORMAT,
+        )
+        if os.path.getsize(out_path) <= max_bytes:
+            return True
+        width, height = frames[0].size
+        if min(width, height) * _ANIMATION_DOWNSCALE < _ANIMATION_MIN_SIDE:
+            os.remove(out_path)
+            return False
+        smaller = (
+            round(width * _ANIMATION_DOWNSCALE),
+            round(height * _ANIMATION_DOWNSCALE),
+        )
+        frames = [frame.resize(smaller, Image.LANCZOS) for frame in frames]
+
+
+def make_thumbnail(
+    filepath: str,
+    filename: str,
+    thumb_folder: str,
+    size_type: str,
+    orientation: int = 1,
+) -> str:
+    """
+    Write one thumbnail of an image.
+    @param filepath: The path of the original.
+    @param filename: The filename of the original.
+    @param thumb_folder: The folder the thumbnail is written to.
+    @param size_type: A key of THUMBNAIL_SIZES.
+    @param orientation: The EXIF orientation of the original.
+    @return: The path of the thumbnail.
+    """
+    os.makedirs(thumb_folder, exist_ok=True)
+    thumb_path = os.path.join(thumb_folder, thumbnail_filename(size_type, filename))
+    with Image.open(filepath) as img:
+        img.thumbnail(THUMBNAIL_SIZES[size_type])
+        img = apply_orientation(img, orientation)
+        img.save(thumb_path)
+    return thumb_path
+
+
+def render_thumbnails(
+    filepath: str,
+    filename: str,
+    thumb_folder: str,
+    formats: list = None,
+    animation_max_bytes: int = 0,
+    animation_max_frames: int = 0,
+    orientation: int = 1,
+) -> dict:
+    """
+    Write every thumbnail size of an image from a single decode. JPEGs are
+    decoded at a reduced scale (draft mode) when much larger than the
+    biggest thumbnail, and each smaller size is derived from the previous
+    one instead of from the original. Each size is written in the
+    original's format and in every other supported modern format. Animated
+    originals get still thumbnails of their first frame, the poster, plus
+    an animated WebP variant, see render_animation. Runs in a worker
+    process, so it only takes and returns plain values.
+    @param filepath: The path of the original.
+    @param filename: The filename of the original.
+    @param thumb_folder: The folder the thumbnails are written to.
+    @param formats: The modern formats to write, defaults to every supported one.
+    @param animation_max_bytes: The maximum size of the animated variant, 0 for none.
+    @param animation_max_frames: The maximum number of frames of the animated variant.
+    @param orientation: The EXIF orientation of the original, applied to the thumbnails.
+    @return: A dict with "paths" (size type to legacy thumbnail path),
+    "formats" (the modern formats that were written), "animated" (whether
+    the animated variant was written), the displayed "size" of the original
+    and the "color" and "placeholder" of placeholder.
+    """
+    # largest first, so each size cascades into the next one
+    sizes = sorted(
+        THUMBNAIL_SIZES.items(), key=lambda item: item[1][0] * item[1][1], reverse=True
+    )
+    if formats is None:
+        formats = supported_modern_formats()
+    # the legacy thumbnail of a WebP original already is the WebP one
+    formats = alternative_formats(filename, formats)
+    os.makedirs(thumb_folder, exist_ok=True)
+    thumb_paths = {}
+    with Image.open(filepath) as img:
+        is_animated = getattr(img, "is_animated", False)
+        original_size = upright_size(img.size, orientation)
+        for size_type, size in sizes:
+            # thumbnail() resizes in place; on the first call it also picks the
+            # JPEG draft scale and uses reduce() before resampling
+            img.thumbnail(size)
+            if not thumb_paths:
+                # the boxes are square, so turning after the first resize is
+                # the same as turning first, and much cheaper
+                img = apply_orientation(img, orientation)
+            thumb_path = os.path.join(
+                thumb_folder, thumbnail_filename(size_type, filename)
+            )
+            img.save(thumb_path)
+            thumb_paths[size_type] = thumb_path
+            for fmt in formats:
+                img.save(
+                    os.path.join(
+                        thumb_folder, thumbnail_filename(size_type, filename, fmt)
+                    ),
+                    **MODERN_FORMATS[fmt],
+                )
+        # from the smallest thumbnail, already decoded
+        description = placeholder(img)
+    animated = bool(is_animated and animation_max_bytes) and render_animation(
+        filepath,
+        os.path.join(thumb_folder, animated_thumbnail_filename(filename)),
+        THUMBNAIL_SIZES["md"],
+        animation_max_bytes,
+        animation_max_frames,
+    )
+    return dict(
+        paths=thumb_paths,
+        formats=formats,
+        animated=animated,
+        size=original_size,
+        **description,
+    )
+
+
+def variant_filename(filename: str, width: int, fmt: str = None) -> str:
+    """
+    Get the filename of an on-demand resized variant of an original.
+    @param filename: The filename of the original.
+    @param width: The maximum width of the variant.
+    @param fmt: A key of MODERN_FORMATS, or None for the original's format.
+    @return: The filename of the variant.
+    """
+    stem, ext = os.path.splitext(filename)
+    return f"{stem}_{width}w.{fmt or ext.lstrip('.')}"
+
+
+def render_variant(
+    filepath: str, out_path: str, width: int, fmt: str = None, orientation: int = 1
+) -> None:
+    """
+    Write a copy of an image scaled down to a maximum width, keeping its
+    aspect ratio. Images narrower than width are not upscaled.
+    @param filepath: The path of the original.
+    @param out_path: The path the variant is written to.
+    @param width: The maximum width of the variant.
+    @param fmt: A key of MODERN_FORMATS, or None for the original's format.
+    @param orientation: The EXIF orientation of the original.
+    @return: None
+    """
+    with Image.open(filepath) as img:
+        original_format = img.format
+        # only the upright width is bounded; draft mode still applies to JPEGs
+        if orientation in (5, 6, 7, 8):
+            img.thumbnail((img.width, width))
+        else:
+            img.thumbnail((width, img.height))
+        img = apply_orientation(img, orientation)
+        if fmt is None:
+            img.save(out_path, format=original_format)
+        else:
+            img.save(out_path, **MODERN_FORMATS[fmt])
@@ -1,7 +1,5 @@
 from app import app
 
-# from app.scripts import test_memes
-
 if __name__ == "__main__":
     app.run(
         host="127.0.0.1", port=5505, debug=True
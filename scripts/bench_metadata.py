@@ -0,0 +1,158 @@
+"""
+Benchmark the lossless, container-level metadata stripping against the
+previous Pillow decode/re-encode, and check that stripping leaves the
+pixels untouched.
+
+usage: python scripts/bench_metadata.py [corpus_dir] [--repeat N]
+
+The corpus is built from app/static/images/test_memes: phone-camera sized
+JPEGs carrying EXIF, XMP and a comment, PNG screenshots with text chunks,
+and extended WebPs with EXIF and XMP chunks.
+"""
+
+import argparse, importlib.util, io, os, statistics, sys, time
+from PIL import Image, PngImagePlugin
+
+_project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+
+# load app/utils/metadata.py by path so the benchmark does not need the
+# app's environment variables or database
+_spec = importlib.util.spec_from_file_location(
+    "metadata", os.path.join(_project_root, "app", "utils", "metadata.py")
+)
+metadata = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(metadata)
+
+_XMP = (
+    b'<x:xmpmeta xmlns:x="adobe:ns:meta/"><rdf:RDF><rdf:Description '
+    b'xmp:CreatorTool="bench"/></rdf:RDF></x:xmpmeta>'
+) * 40
+
+
+def legacy_strip(data: bytes, fmt: str) -> bytes:
+    """The previous remove_metadata: decode and re-encode with Pillow."""
+    out = io.BytesIO()
+    with Image.open(io.BytesIO(data)) as img:
+        img.save(out, format=img.format, save_all=getattr(img, "is_animated", False))
+    return out.getvalue()
+
+
+def container_strip(data: bytes, fmt: str) -> bytes:
+    """The new remove_metadata, keeping the orientation."""
+    with Image.open(io.BytesIO(data)) as img:
+        orientation = img.getexif().get(metadata.ORIENTATION_TAG, 1)
+    return metadata.STRIPPERS[fmt](data, orientation)
+
+
+def _exif(orientation: int) -> Image.Exif:
+    """An EXIF block like a phone camera's, with a maker note."""
+    exif = Image.Exif()
+    exif[metadata.ORIENTATION_TAG] = orientation
+    exif[0x010F] = "Bench Camera"
+    exif[0x0110] = "Model 1"
+    exif[0x0131] = "bench 1.0"
+    exif[0x9286] = "x" * 4096
+    return exif
+
+
+def build_corpus(source_dir: str) -> list:
+    """Build (name, format, bytes) samples carrying metadata from the source images."""
+    corpus = []
+    for filename in sorted(os.listdir(source_dir)):
+        if not filename.lower().endswith((".jpg", ".jpeg", ".png", ".webp", ".gif")):
+            continue
+        with Image.open(os.path.join(source_dir, filename)) as img:
+            img = img.convert("RGB")
+        stem = os.path.splitext(filename)[0]
+
+        photo = io.BytesIO()
+        img.resize((4032, 3024)).save(
+            photo, "JPEG", quality=90, exif=_exif(6), comment=b"bench"
+        )
+        # splice an XMP APP1 segment in after SOI
+        xmp = b"http://ns.adobe.com/xap/1.0/\x00" + _XMP
+        photo = photo.getvalue()
+        photo = (
+            photo[:2]
+            + b"\xff\xe1"
+            + (len(xmp) + 2).to_bytes(2, "big")
+            + xmp
+            + photo[2:]
+        )
+        corpus.append((f"{stem}_4032.jpg", "JPEG", photo))
+
+        screenshot = io.BytesIO()
+        info = PngImagePlugin.PngInfo()
+        info.add_text("Software", "bench")
+        info.add_itxt("XML:com.adobe.xmp", _XMP.decode())
+        img.resize((1170, 2532)).save(screenshot, "PNG", pnginfo=info, exif=_exif(1))
+        corpus.append((f"{stem}_1170.png", "PNG", screenshot.getvalue()))
+
+        webp = io.BytesIO()
+        img.resize((1080, 1350)).save(webp, "WEBP", quality=80, exif=_exif(8), xmp=_XMP)
+        corpus.append((f"{stem}_1080.webp", "WEBP", webp.getvalue()))
+    return corpus
+
+
+def check(corpus: list) -> None:
+    """Exit if stripping changed any pixel, kept metadata or lost the orientation."""
+    for name, fmt, data in corpus:
+        stripped = container_strip(data, fmt)
+        with Image.open(io.BytesIO(data)) as before, Image.open(
+            io.BytesIO(stripped)
+        ) as after:
+            orientation = before.getexif().get(metadata.ORIENTATION_TAG, 1)
+            exif = after.getexif()
+            if before.tobytes() != after.tobytes():
+                sys.exit(f"{name}: pixels changed")
+            if exif.get(metadata.ORIENTATION_TAG, 1) != orientation:
+                sys.exit(f"{name}: orientation lost")
+            if set(exif) - {metadata.ORIENTATION_TAG} or b"bench" in stripped:
+                sys.exit(f"{name}: metadata kept")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "corpus_dir",
+        nargs="?",
+        default=os.path.join(_project_root, "app", "static", "images", "test_memes"),
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    corpus = build_corpus(args.corpus_dir)
+    if not corpus:
+        sys.exit(f"no images found in {args.corpus_dir}")
+    check(corpus)
+    print(f"{len(corpus)} images x {args.repeat} runs, pixels verified identical")
+    results = {}
+    for name, strip in (
+        ("re-encode (legacy)", legacy_strip),
+        ("container strip", container_strip),
+    ):
+        timings = {}
+        sizes = {}
+        for _ in range(args.repeat):
+            for sample, fmt, data in corpus:
+                start = time.perf_counter()
+                stripped = strip(data, fmt)
+                timings.setdefault(fmt, []).append(time.perf_counter() - start)
+                sizes[sample] = len(stripped)
+        total = sum(sum(values) for values in timings.values())
+        results[name] = total
+        per_format = "  ".join(
+            f"{fmt} {statistics.median(values) * 1000:6.1f}ms"
+            for fmt, values in timings.items()
+        )
+        print(
+            f"{name:>18}: total {total:7.2f}s  median {per_format}  "
+            f"output {sum(sizes.values()) / 1024 / 1024:6.1f}MB"
+        )
+    print(f"input: {sum(len(data) for _, _, data in corpus) / 1024 / 1024:6.1f}MB")
+    legacy, container = results.values()
+    print(f"speedup: {legacy / container:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
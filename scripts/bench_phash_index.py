@@ -0,0 +1,69 @@
+"""
+Benchmark near-duplicate lookups in the perceptual hash index against a
+linear scan, and check both return the same matches.
+
+usage: python scripts/bench_phash_index.py [--size N] [--queries N] [--max-distance N]
+"""
+
+import argparse, importlib.util, os, random, time
+
+_project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+
+# load app/utils/phash.py by path so the benchmark does not need the
+# app's environment variables or database
+_spec = importlib.util.spec_from_file_location(
+    "phash", os.path.join(_project_root, "app", "utils", "phash.py")
+)
+phash = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(phash)
+
+
+def linear_search(hashes: list, value: int, max_distance: int) -> list:
+    """The scan the index replaces."""
+    return sorted(
+        (phash.hamming(value, candidate), item_id)
+        for item_id, candidate in enumerate(hashes)
+        if phash.hamming(value, candidate) <= max_distance
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--size", type=int, default=1000000)
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--max-distance", type=int, default=6)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    hashes = [rng.getrandbits(phash.HASH_BITS) for _ in range(args.size)]
+    # near-duplicates of indexed hashes, a few bits apart
+    queries = [
+        hashes[rng.randrange(args.size)]
+        ^ sum(1 << bit for bit in rng.sample(range(64), rng.randint(0, 4)))
+        for _ in range(args.queries)
+    ]
+
+    start = time.perf_counter()
+    index = phash.MultiIndexHash()
+    for item_id, value in enumerate(hashes):
+        index.add(value, item_id)
+    print(f"built index of {args.size} hashes in {time.perf_counter() - start:.1f}s")
+
+    start = time.perf_counter()
+    for value in queries:
+        index.search(value, args.max_distance)
+    elapsed = time.perf_counter() - start
+    print(f"{'index':>7}: {elapsed / len(queries) * 1000:8.3f}ms per lookup")
+
+    sample = queries[:5]
+    start = time.perf_counter()
+    for value in sample:
+        assert linear_search(hashes, value, args.max_distance) == index.search(
+            value, args.max_distance
+        )
+    elapsed = time.perf_counter() - start
+    print(f"{'linear':>7}: {elapsed / len(sample) * 1000:8.3f}ms per lookup")
+
+
+if __name__ == "__main__":
+    main()
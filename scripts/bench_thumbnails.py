@@ -0,0 +1,110 @@
+"""
+Benchmark the single-decode thumbnail pipeline against the previous
+per-size approach, which re-opened and re-decoded the original for
+every thumbnail size.
+
+usage: python scripts/bench_thumbnails.py [corpus_dir] [--repeat N]
+
+The corpus defaults to app/static/images/test_memes, plus phone-camera
+sized JPEG and PNG copies of those memes generated in a temp folder.
+"""
+
+import argparse, importlib.util, os, statistics, sys, tempfile, time
+from PIL import Image
+
+_project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+
+# load app/utils/thumbnails.py by path so the benchmark does not need the
+# app's environment variables or database
+_spec = importlib.util.spec_from_file_location(
+    "thumbnails", os.path.join(_project_root, "app", "utils", "thumbnails.py")
+)
+thumbnails = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(thumbnails)
+
+
+def legacy_render_thumbnails(filepath: str, filename: str, thumb_folder: str) -> dict:
+    """The previous Meme.create_thumbnail, called once per size."""
+    thumb_paths = {}
+    for size_type, size in thumbnails.THUMBNAIL_SIZES.items():
+        img = Image.open(filepath)
+        img.thumbnail(size)
+        thumb_path = os.path.join(thumb_folder, f"{size_type}_thumbnail_{filename}")
+        img.save(thumb_path)
+        thumb_paths[size_type] = thumb_path
+    return thumb_paths
+
+
+def render_legacy_formats(filepath: str, filename: str, thumb_folder: str) -> dict:
+    """The single-decode pipeline without the modern formats, for a fair comparison."""
+    return thumbnails.render_thumbnails(filepath, filename, thumb_folder, formats=[])
+
+
+def build_corpus(source_dir: str, work_dir: str) -> list:
+    """Collect the source images and add large JPEG/PNG variants of them."""
+    corpus = []
+    for filename in sorted(os.listdir(source_dir)):
+        if not filename.lower().endswith((".jpg", ".jpeg", ".png", ".webp", ".gif")):
+            continue
+        path = os.path.join(source_dir, filename)
+        corpus.append(path)
+        with Image.open(path) as img:
+            img = img.convert("RGB")
+            large = img.resize((4032, 3024))
+            stem = os.path.splitext(filename)[0]
+            large_jpg = os.path.join(work_dir, f"{stem}_4032.jpg")
+            large.save(large_jpg, quality=90)
+            corpus.append(large_jpg)
+            screenshot = img.resize((1170, 2532))
+            screenshot_png = os.path.join(work_dir, f"{stem}_1170.png")
+            screenshot.save(screenshot_png)
+            corpus.append(screenshot_png)
+    return corpus
+
+
+def time_pipeline(render, corpus: list, thumb_folder: str, repeat: int) -> list:
+    """Run a pipeline over the corpus and return the per-image timings."""
+    timings = []
+    for _ in range(repeat):
+        for path in corpus:
+            start = time.perf_counter()
+            render(path, os.path.basename(path), thumb_folder)
+            timings.append(time.perf_counter() - start)
+    return timings
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "corpus_dir",
+        nargs="?",
+        default=os.path.join(_project_root, "app", "static", "images", "test_memes"),
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        corpus = build_corpus(args.corpus_dir, work_dir)
+        if not corpus:
+            sys.exit(f"no images found in {args.corpus_dir}")
+        thumb_folder = os.path.join(work_dir, "thumbnails")
+        os.makedirs(thumb_folder)
+        print(f"{len(corpus)} images x {args.repeat} runs")
+        results = {}
+        for name, render in (
+            ("per-size (legacy)", legacy_render_thumbnails),
+            ("single-decode", render_legacy_formats),
+        ):
+            timings = time_pipeline(render, corpus, thumb_folder, args.repeat)
+            results[name] = sum(timings)
+            print(
+                f"{name:>18}: total {sum(timings):7.2f}s  "
+                f"median {statistics.median(timings) * 1000:7.1f}ms  "
+                f"{len(timings) / sum(timings):6.1f} img/s"
+            )
+        legacy, single = results.values()
+        print(f"speedup: {legacy / single:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -6,11 +6,20 @@ param (
 
 if ($environment -eq "dev") {
     . .\.venv\Scripts\Activate.ps1
+    # the single-process dev server runs the jobs itself
+    $env:JOB_WORKER_IN_APP = "true"
     flask.exe run --reload --debugger
 }
 elseif ($environment -eq "prod") {
     . .\.venv\Scripts\Activate.ps1
-    flask.exe run
+    # one job dispatcher next to the web server
+    $jobs = Start-Process flask.exe -ArgumentList "run-jobs" -NoNewWindow -PassThru
+    try {
+        flask.exe run
+    }
+    finally {
+        Stop-Process -Id $jobs.Id
+    }
 }
 else {
     Write-Host "Invalid environment specified. Use 'dev' or 'prod'."
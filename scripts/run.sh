@@ -26,8 +26,12 @@ fi
 # Activate the virtual environment and run Flask accordingly
 if [ "$1" == "dev" ]; then
     source ./.venv/bin/activate
-    flask run --reload --debugger
+    # the single-process dev server runs the jobs itself
+    JOB_WORKER_IN_APP=true flask run --reload --debugger
 elif [ "$1" == "prod" ]; then
     source ./.venv/bin/activate
+    # one job dispatcher next to the web server
+    flask run-jobs &
+    trap "kill $!" EXIT
     flask run
 fi
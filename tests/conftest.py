@@ -0,0 +1,82 @@
+import io, os, sqlite3, tempfile
+from contextlib import contextmanager
+import pytest
+from sqlalchemy import event
+from sqlalchemy.exc import IntegrityError
+from PIL import Image
+
+# the app reads its configuration from the environment when it is imported
+os.environ.setdefault(
+    "SQLALCHEMY_DATABASE_URI",
+    "sqlite:///" + os.path.join(tempfile.mkdtemp(prefix="memeshare-tests-"), "test.db"),
+)
+os.environ.setdefault("SECRET_KEY", "test")
+os.environ.setdefault("ADMIN_PASSWORD", "test")
+# tests run the job queue explicitly
+os.environ.setdefault("JOB_WORKER_IN_APP", "false")
+os.environ.setdefault("PHASH_INDEX_PRELOAD", "false")
+
+
+@pytest.fixture
+def make_image():
+    """Encode a small solid image into bytes, passing extra save arguments through."""
+
+    def make(fmt: str = "PNG", size: tuple = (64, 48), **params) -> bytes:
+        out = io.BytesIO()
+        Image.new("RGB", size, (200, 30, 30)).save(out, fmt, **params)
+        return out.getvalue()
+
+    return make
+
+
+@pytest.fixture
+def app():
+    """The app, with empty tables and an app context pushed."""
+    from app import app, db
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        yield app
+        db.session.remove()
+
+
+@pytest.fixture
+def lost_race():
+    """Simulate a lost insert race, see _lost_race."""
+    return _lost_race
+
+
+@contextmanager
+def _lost_race(statement_prefix: str, winner_sql: str):
+    """
+    Make the first statement starting with statement_prefix fail like a
+    lost insert race: it raises an IntegrityError, and the row of the
+    concurrent winner shows up once the failure is rolled back.
+    """
+    from app import db
+
+    engine = db.engine
+    state = dict(raised=False, pending=False)
+
+    def before(conn, cursor, statement, parameters, context, executemany):
+        if not state["raised"] and statement.startswith(statement_prefix):
+            state["raised"] = state["pending"] = True
+            raise IntegrityError(
+                statement,
+                parameters,
+                sqlite3.IntegrityError("UNIQUE constraint failed"),
+            )
+
+    def after(conn, cursor, statement, parameters, context, executemany):
+        if state["pending"] and statement.startswith("ROLLBACK TO SAVEPOINT"):
+            state["pending"] = False
+            cursor.execute(winner_sql)
+
+    event.listen(engine, "before_cursor_execute", before)
+    event.listen(engine, "after_cursor_execute", after)
+    try:
+        yield state
+    finally:
+        event.remove(engine, "before_cursor_execute", before)
+        event.remove(engine, "after_cursor_execute", after)
@@ -0,0 +1,41 @@
+import re
+import pytest
+from app import db
+from app.models import User, default_avatars
+
+
+@pytest.fixture
+def client(app):
+    app.config["WTF_CSRF_ENABLED"] = True
+    user = User("alice", "alice@example.com", "password1")
+    db.session.add(user)
+    db.session.commit()
+    client = app.test_client()
+    app.config["WTF_CSRF_ENABLED"] = False
+    client.post("/login", data={"username": "alice", "password": "password1"})
+    app.config["WTF_CSRF_ENABLED"] = True
+    yield client
+    app.config["WTF_CSRF_ENABLED"] = False
+
+
+def _profile_image() -> str:
+    db.session.expire_all()
+    return db.session.execute(db.select(User.profile_image)).scalar_one()
+
+
+def test_choosing_a_default_avatar_needs_a_post_with_csrf(client):
+    key = next(iter(default_avatars.get().values()))
+    before = _profile_image()
+    assert client.get(f"/user/image/{key}").status_code == 405
+    assert client.post(f"/user/image/{key}").status_code == 400
+    assert _profile_image() == before
+
+    page = client.get("/user/image/").get_data(as_text=True)
+    token = re.search(r'id="default_avatar_csrf_token"[^>]*value="([^"]+)"', page)
+    response = client.post(f"/user/image/{key}", data={"csrf_token": token[1]})
+    assert response.status_code == 302
+    assert _profile_image() == key
+
+
+def test_choosing_an_unknown_avatar(client):
+    assert client.post("/user/image/deadbeefdeadbeef").status_code == 404
@@ -0,0 +1,88 @@
+import pytest
+from app import db
+from app.models import Meme, User, duplicate_index
+from app.models.duplicates import DuplicateIndex
+from app.utils.phash import MultiIndexHash, to_signed
+
+_HASH = 0x0123456789ABCDEF
+_OTHER = 0xFEDCBA9876543210
+
+
+def test_multi_index_hash_moves_and_removes_items():
+    index = MultiIndexHash()
+    index.add(_HASH, 1)
+    index.add(_HASH, 2)
+    index.add(_HASH, 1)
+    assert index.search(_HASH, 0) == [(0, 1), (0, 2)]
+    index.add(_OTHER, 1)
+    assert index.search(_HASH, 0) == [(0, 2)]
+    assert index.search(_OTHER, 0) == [(0, 1)]
+    index.remove(2)
+    index.remove(2)
+    assert index.search(_HASH, 6) == []
+    assert len(index) == 1
+    index.remove(1)
+    assert len(index) == 0
+    assert not any(index._tables)
+
+
+@pytest.fixture
+def meme(app):
+    # the tables are recreated for every test, so are the ids
+    duplicate_index._index.clear()
+    user = User("alice", "alice@example.com", "password1")
+    db.session.add(user)
+    db.session.commit()
+    # the original does not exist, so the meme has no hash yet, like a
+    # meme waiting for its fetch job
+    meme = Meme(user.id, "missing.png", False)
+    db.session.add(meme)
+    db.session.commit()
+    assert meme.phash is None
+    return meme
+
+
+def _found(index, phash: int) -> list:
+    return [meme_id for _, meme_id in index.search(to_signed(phash), 0)]
+
+
+def test_hash_set_on_an_existing_meme_is_indexed(meme):
+    meme.phash = to_signed(_HASH)
+    db.session.commit()
+    assert meme.phash_updated_at is not None
+    assert _found(duplicate_index, _HASH) == [meme.id]
+
+    meme.phash = to_signed(_OTHER)
+    db.session.commit()
+    assert _found(duplicate_index, _HASH) == []
+    assert _found(duplicate_index, _OTHER) == [meme.id]
+
+    meme.phash = None
+    db.session.commit()
+    assert _found(duplicate_index, _OTHER) == []
+
+
+def test_rolled_back_hash_is_not_indexed(meme):
+    meme.phash = to_signed(_HASH)
+    db.session.flush()
+    db.session.rollback()
+    assert _found(duplicate_index, _HASH) == []
+
+
+def test_refresh_picks_up_hashes_changed_by_other_processes(app, meme):
+    # an index that only sees the database, like another process's
+    index = DuplicateIndex()
+    index.init_app(app)
+    index.refresh(force=True)
+    assert _found(index, _HASH) == []
+
+    meme.phash = to_signed(_HASH)
+    db.session.commit()
+    index.refresh(force=True)
+    assert _found(index, _HASH) == [meme.id]
+
+    meme.phash = to_signed(_OTHER)
+    db.session.commit()
+    index.refresh(force=True)
+    assert _found(index, _HASH) == []
+    assert _found(index, _OTHER) == [meme.id]
@@ -0,0 +1,66 @@
+import io, re
+import pytest
+from PIL import Image
+from werkzeug.datastructures import FileStorage
+from app import db
+from app.jobs import ThumbnailHandler
+from app.models import Meme, User
+
+
+@pytest.fixture
+def client(app):
+    app.config["WTF_CSRF_ENABLED"] = False
+    user = User("alice", "alice@example.com", "password1")
+    db.session.add(user)
+    db.session.commit()
+    client = app.test_client()
+    client.post("/login", data={"username": "alice", "password": "password1"})
+    return client
+
+
+def _post(user_id: int, data: bytes, filename: str) -> Meme:
+    """Post a meme and run its thumbnail job in this process."""
+    meme = Meme.from_upload(
+        FileStorage(io.BytesIO(data), filename=filename), user_id, False
+    )
+    db.session.add(meme)
+    db.session.commit()
+    handler = ThumbnailHandler()
+    fn, args = handler.prepare(meme)
+    handler.complete(meme, fn(*args))
+    db.session.commit()
+    return meme
+
+
+def _gif() -> bytes:
+    frames = [Image.new("RGB", (320, 240), color) for color in ("red", "blue", "lime")]
+    out = io.BytesIO()
+    frames[0].save(out, "GIF", save_all=True, append_images=frames[1:], duration=100)
+    return out.getvalue()
+
+
+def test_animated_cards_offer_the_modern_poster_formats(client):
+    user_id = db.session.execute(db.select(User.id)).scalar_one()
+    meme = _post(user_id, _gif(), "animated.gif")
+    assert meme.animated and "webp" in meme.get_thumbnail_formats()
+
+    html = client.get("/").get_data(as_text=True)
+    picture = re.search(r"<picture>(.*?)</picture>", html, re.S)[1]
+    assert re.search(r'<source type="image/webp"[^>]*srcset="[^"]+\.webp', picture)
+    img = re.search(r"<img [^>]*>", picture)[0]
+    assert "js-animated" in img
+    assert re.search(r'data-animation-src="[^"]+\.webp"', img)
+
+
+def test_webp_cards_offer_no_redundant_webp_source(client, make_image):
+    user_id = db.session.execute(db.select(User.id)).scalar_one()
+    meme = _post(user_id, make_image("WEBP", (320, 240)), "still.webp")
+    assert meme.filename.endswith(".webp")
+    assert "webp" not in meme.get_thumbnail_formats()
+
+    # rendered before the thumbnails skipped the original's format
+    meme.thumbnail_formats = "webp"
+    db.session.commit()
+    html = client.get("/").get_data(as_text=True)
+    picture = re.search(r"<picture>(.*?)</picture>", html, re.S)[1]
+    assert "<source" not in picture
@@ -0,0 +1,189 @@
+import os, socket, threading, time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+from app import db
+from app.jobs.fetch import FetchHandler
+from app.jobs.queue import JobQueue
+from app.models import Job, Meme, User
+from app.utils import UploadRejected
+from app.utils.fetch import FetchError, fetch_image
+from app.utils.normalize import NormalizePolicy
+
+# a policy that never normalizes
+_KEEP = NormalizePolicy(0, None, (85,), 0, None)
+
+_MAX_BYTES = 64 * 1024
+
+
+class _StandIn(BaseHTTPRequestHandler):
+    """Serves the cases of the tests by path."""
+
+    png = None
+
+    def log_message(self, format, *args) -> None:
+        pass
+
+    def _send(self, status: int, content_type: str, body: bytes, length=None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        if length is not None:
+            self.send_header("Content-Length", str(length))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self) -> None:
+        if self.path == "/image.png":
+            self._send(200, "image/png", self.png, len(self.png))
+        elif self.path == "/unknown-type":
+            self._send(200, "application/octet-stream", self.png, len(self.png))
+        elif self.path == "/page.html":
+            body = b"<html><body>not an image</body></html>"
+            self._send(200, "text/html; charset=utf-8", body, len(body))
+        elif self.path == "/missing.png":
+            self._send(404, "text/plain", b"not found", 9)
+        elif self.path == "/declared-large.png":
+            self._send(200, "image/png", self.png, _MAX_BYTES + 1)
+        elif self.path == "/undeclared-large.png":
+            # no Content-Length, the cap applies while streaming
+            self._send(200, "image/png", self.png + b"\0" * (2 * _MAX_BYTES))
+        elif self.path == "/slow.png":
+            self._send(200, "image/png", self.png[:16], len(self.png) + 1000)
+            try:
+                for _ in range(100):
+                    time.sleep(0.05)
+                    self.wfile.write(b"\0" * 10)
+                    self.wfile.flush()
+            except OSError:
+                pass
+        elif self.path == "/loop":
+            self.send_response(302)
+            self.send_header("Location", "/loop")
+            self.end_headers()
+        else:
+            self._send(404, "text/plain", b"not found", 9)
+
+
+@pytest.fixture(scope="module")
+def server():
+    """A local HTTP stand-in for the hosts memes are fetched from."""
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), _StandIn)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_port}"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.fixture(autouse=True)
+def png(make_image):
+    _StandIn.png = make_image("PNG")
+
+
+def _fetch(url: str, folder, connect=2.0, read=2.0, total=5.0) -> dict:
+    return fetch_image(url, str(folder), _MAX_BYTES, 10**8, connect, read, total, _KEEP)
+
+
+def test_fetch_success(server, tmp_path):
+    result = _fetch(f"{server}/image.png", tmp_path)
+    assert result["ext"] == "png"
+    with open(result["path"], "rb") as file:
+        assert file.read() == _StandIn.png
+
+
+def test_fetch_generic_content_type_is_sniffed(server, tmp_path):
+    assert _fetch(f"{server}/unknown-type", tmp_path)["ext"] == "png"
+
+
+def test_fetch_slow_body_past_the_deadline(server, tmp_path):
+    start = time.monotonic()
+    with pytest.raises(FetchError, match="took too long"):
+        _fetch(f"{server}/slow.png", tmp_path, total=0.5)
+    # the server trickles the body for 5s
+    assert time.monotonic() - start < 2
+    assert os.listdir(tmp_path) == []
+
+
+@pytest.mark.parametrize("path", ["/declared-large.png", "/undeclared-large.png"])
+def test_fetch_oversized_body(server, tmp_path, path):
+    with pytest.raises(UploadRejected):
+        _fetch(server + path, tmp_path)
+    assert os.listdir(tmp_path) == []
+
+
+def test_fetch_non_image_content_type(server, tmp_path):
+    with pytest.raises(UploadRejected, match="not point to an image"):
+        _fetch(f"{server}/page.html", tmp_path)
+
+
+def test_fetch_http_error(server, tmp_path):
+    with pytest.raises(FetchError, match="HTTP 404"):
+        _fetch(f"{server}/missing.png", tmp_path)
+
+
+def test_fetch_redirect_limit(server, tmp_path):
+    with pytest.raises(FetchError, match="redirects"):
+        _fetch(f"{server}/loop", tmp_path)
+
+
+def test_fetch_connect_timeout(tmp_path):
+    # a listener whose backlog is full leaves further connects unanswered
+    listener = socket.socket()
+    listener.bind(("127.0.0.1", 0))
+    listener.listen(0)
+    port = listener.getsockname()[1]
+    filler = []
+    try:
+        while len(filler) < 16:
+            client = socket.socket()
+            client.settimeout(0.2)
+            filler.append(client)
+            try:
+                client.connect(("127.0.0.1", port))
+            except socket.timeout:
+                break
+        else:
+            pytest.skip("the backlog of the listener never filled")
+        start = time.monotonic()
+        with pytest.raises(FetchError):
+            _fetch(f"http://127.0.0.1:{port}/image.png", tmp_path, connect=0.3)
+        assert time.monotonic() - start < 2
+    finally:
+        for client in filler:
+            client.close()
+        listener.close()
+
+
+@pytest.fixture
+def fetch_job(app):
+    user = User("alice", "alice@example.com", "password1")
+    db.session.add(user)
+    db.session.commit()
+    meme = Meme.from_url("http://127.0.0.1/image.png", user.id, False)
+    db.session.add(meme)
+    db.session.commit()
+    job = db.session.execute(
+        db.select(Job).where(Job.meme_id == meme.id, Job.kind == FetchHandler.kind)
+    ).scalar_one()
+    # claimed once by the dispatcher
+    job.attempts = 1
+    job.status = Job.RUNNING
+    db.session.commit()
+    return job
+
+
+@pytest.mark.parametrize(
+    "error, status",
+    [
+        (UploadRejected("Only JPEG, PNG, GIF and WebP images are accepted."), "failed"),
+        (FetchError("Failed to download: HTTP 503"), "pending"),
+    ],
+)
+def test_fetch_job_retries_only_transient_errors(app, fetch_job, error, status):
+    queue = JobQueue()
+    queue.init_app(app)
+    queue.register(FetchHandler())
+    queue._record_error(fetch_job, error)
+    assert fetch_job.status == status
+    meme = db.session.get(Meme, fetch_job.meme_id)
+    failed = meme.thumbnail_status == Meme.THUMBNAIL_FAILED
+    assert failed == (status == "failed")
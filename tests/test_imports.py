@@ -0,0 +1,65 @@
+import os
+from sqlalchemy import event
+from app import db
+from app.commands import import_memes
+from app.models import MediaFile, Meme, User
+
+
+def _import(app, directory: str, batch_size: int) -> list:
+    """Run import-memes, returning the statements run in the parent process."""
+    statements = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db.engine, "before_cursor_execute", count)
+    try:
+        result = app.test_cli_runner().invoke(
+            import_memes,
+            [directory, "--workers", "2", "--batch-size", str(batch_size)],
+        )
+    finally:
+        event.remove(db.engine, "before_cursor_execute", count)
+    assert result.exit_code == 0, result.output
+    return statements
+
+
+def _write_images(folder: str, widths: range, make_image) -> None:
+    os.makedirs(folder)
+    for width in widths:
+        # different sizes make different contents
+        with open(os.path.join(folder, f"{width}.png"), "wb") as f:
+            f.write(make_image("PNG", (width, 16)))
+
+
+def _lookups(statements: list) -> list:
+    return [
+        s
+        for s in statements
+        if not s.startswith(("INSERT INTO meme ", "INSERT INTO job "))
+    ]
+
+
+def test_import_batch_runs_a_constant_number_of_queries(app, make_image, tmp_path):
+    db.session.add(User("alice", "alice@example.com", "password1"))
+    db.session.commit()
+    _write_images(str(tmp_path / "first"), range(10, 12), make_image)
+    _write_images(str(tmp_path / "small"), range(16, 18), make_image)
+    _write_images(str(tmp_path / "large"), range(20, 26), make_image)
+
+    # the first import loads the duplicate index
+    _import(app, str(tmp_path / "first"), 10)
+    small = _import(app, str(tmp_path / "small"), 10)
+    large = _import(app, str(tmp_path / "large"), 10)
+    # a meme is two INSERTs, with its thumbnail job, and the lookups do not
+    # depend on the number of files
+    assert len(large) - len(small) == 2 * 4
+    assert len(_lookups(large)) == len(_lookups(small))
+    assert db.session.execute(db.select(db.func.count(Meme.id))).scalar_one() == 10
+    files = db.session.execute(db.select(MediaFile)).scalars().all()
+    assert len(files) == 10 and all(file.ref_count == 1 for file in files)
+    # the solid images look alike, so later ones are flagged as duplicates
+    memes = Meme.query.order_by(Meme.id).all()
+    assert all(meme.duplicate_of_id is not None for meme in memes[2:])
+    for meme in memes:
+        assert os.path.exists(meme.filepath)
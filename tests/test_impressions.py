@@ -0,0 +1,127 @@
+import pytest
+from app import db
+from app.models import Meme, User, seen_memes
+from app.models.impressions import ImpressionBuffer, impression_buffer, mark_seen
+
+
+@pytest.fixture
+def ids(app):
+    """The ids of two users and three memes, the last one deleted."""
+    users = [
+        User(name, f"{name}@example.com", "password1") for name in ("alice", "bob")
+    ]
+    db.session.add_all(users)
+    db.session.commit()
+    memes = [Meme(users[0].id, f"{i}.png", False) for i in range(3)]
+    memes[2].deleted = True
+    db.session.add_all(memes)
+    db.session.commit()
+    return [user.id for user in users], [meme.id for meme in memes]
+
+
+def _seen() -> set:
+    return set(db.session.execute(db.select(seen_memes)).all())
+
+
+@pytest.fixture
+def buffer(app):
+    buffer = ImpressionBuffer()
+    buffer.init_app(app)
+    # only explicit flushes, the thread waits forever
+    buffer.flush_interval = 3600
+    yield buffer
+    buffer.stop()
+
+
+def test_mark_seen_inserts_the_missing_live_pairs(ids):
+    (alice, bob), (meme, other, deleted) = ids
+    assert mark_seen([(alice, meme)]) == 1
+    pairs = [(alice, meme), (alice, other), (bob, meme), (bob, deleted), (999, meme)]
+    assert mark_seen(pairs) == 2
+    assert mark_seen(pairs) == 0
+    assert _seen() == {(alice, meme), (alice, other), (bob, meme)}
+
+
+def test_mark_seen_after_a_lost_race(ids, lost_race):
+    (alice, bob), (meme, other, _) = ids
+    winner = f"INSERT INTO seen_memes VALUES ({alice}, {meme})"
+    with lost_race("INSERT INTO seen_memes", winner) as state:
+        inserted = mark_seen([(alice, meme), (alice, other), (bob, other)])
+    assert state["raised"]
+    assert inserted == 2
+    assert _seen() == {(alice, meme), (alice, other), (bob, other)}
+
+
+def test_buffer_dedupes_impressions(ids, buffer):
+    (alice, bob), (meme, other, _) = ids
+    assert buffer.record(alice, [meme, other]) == 2
+    assert buffer.record(alice, [meme]) == 0
+    assert buffer.record(bob, [meme]) == 1
+    assert buffer.pending() == 3
+    assert _seen() == set()
+    assert buffer.flush() == 3
+    assert buffer.pending() == 0
+    assert _seen() == {(alice, meme), (alice, other), (bob, meme)}
+
+
+def test_buffer_flushes_when_full(ids, buffer):
+    (alice, bob), (meme, other, _) = ids
+    buffer.max_size = 3
+    buffer.record(alice, [meme, other])
+    assert buffer.pending() == 2
+    buffer.record(bob, [meme])
+    assert buffer.pending() == 0
+    assert _seen() == {(alice, meme), (alice, other), (bob, meme)}
+
+
+def test_buffer_flushes_on_stop(ids, buffer):
+    (alice, _), (meme, _, _) = ids
+    buffer.record(alice, [meme])
+    assert buffer._thread.is_alive()
+    buffer.stop()
+    assert not buffer._thread.is_alive()
+    assert buffer.pending() == 0
+    db.session.expire_all()
+    assert _seen() == {(alice, meme)}
+
+
+def test_buffer_in_sync_mode_writes_before_returning(ids, buffer):
+    (alice, _), (meme, _, _) = ids
+    buffer.sync = True
+    assert buffer.record(alice, [meme]) == 1
+    assert buffer.pending() == 0
+    assert buffer._thread is None
+    assert _seen() == {(alice, meme)}
+
+
+@pytest.fixture
+def client(app, ids, monkeypatch):
+    monkeypatch.setitem(app.config, "WTF_CSRF_ENABLED", False)
+    monkeypatch.setattr(impression_buffer, "sync", True)
+    client = app.test_client()
+    client.post("/login", data={"username": "alice", "password": "password1"})
+    return client
+
+
+def test_seen_rejects_bad_payloads(client):
+    payloads = [
+        None,
+        {},
+        {"meme_ids": 1},
+        {"meme_ids": [1, "2"]},
+        {"meme_ids": [1, True]},
+        {"meme_ids": [0]},
+        {"meme_ids": [-1]},
+        {"meme_ids": list(range(1, 202))},
+    ]
+    for payload in payloads:
+        assert client.post("/seen", json=payload).status_code == 400, payload
+    assert _seen() == set()
+
+
+def test_seen_records_impressions(client, ids):
+    (alice, _), (meme, other, _) = ids
+    response = client.post("/seen", json={"meme_ids": [meme, other, meme]})
+    assert response.status_code == 200
+    assert response.get_json() == dict(status="success", recorded=2)
+    assert _seen() == {(alice, meme), (alice, other)}
@@ -0,0 +1,112 @@
+import io, os
+import pytest
+from PIL import Image, PngImagePlugin
+from werkzeug.datastructures import FileStorage
+from app.utils.ingest import ingest_stream, prepare_original, stored_format
+from app.utils.normalize import NormalizePolicy
+
+# a policy that never normalizes, so only the metadata stripping applies
+_KEEP = NormalizePolicy(0, None, (85,), 0, None)
+
+_SECRET = b"Secret Person"
+
+
+def _ingest(folder, data: bytes):
+    """Ingest bytes like an upload and prepare the stored original."""
+    ingested = ingest_stream(io.BytesIO(data), str(folder), 10 * 1024 * 1024, 10**8)
+    target, _ = stored_format(ingested, _KEEP)
+    prepare_original(ingested, target, _KEEP)
+    with open(ingested.path, "rb") as file:
+        return ingested, file.read()
+
+
+def _jpeg_segment(marker: int, payload: bytes) -> bytes:
+    return bytes([0xFF, marker]) + (len(payload) + 2).to_bytes(2, "big") + payload
+
+
+def test_png_text_chunks_are_stripped(tmp_path, make_image):
+    info = PngImagePlugin.PngInfo()
+    info.add_text("Author", _SECRET.decode())
+    info.add_itxt("Description", _SECRET.decode())
+    info.add_text("Comment", _SECRET.decode(), zip=True)
+    data = make_image("PNG", pnginfo=info)
+    ingested, stored = _ingest(tmp_path, data)
+    assert _SECRET not in stored
+    with Image.open(io.BytesIO(stored)) as img, Image.open(io.BytesIO(data)) as src:
+        assert img.tobytes() == src.tobytes()
+        assert not img.text
+
+
+def test_jpeg_comment_and_iptc_are_stripped(tmp_path, make_image):
+    data = make_image("JPEG", comment=_SECRET)
+    iptc = _jpeg_segment(0xED, b"Photoshop 3.0\x008BIM\x04\x04" + _SECRET)
+    data = data[:2] + iptc + data[2:]
+    ingested, stored = _ingest(tmp_path, data)
+    assert _SECRET not in stored
+    with Image.open(io.BytesIO(stored)) as img, Image.open(io.BytesIO(data)) as src:
+        assert img.tobytes() == src.tobytes()
+
+
+def test_jpeg_exif_is_stripped_but_orientation_kept(tmp_path, make_image):
+    exif = Image.Exif()
+    exif[0x0112] = 6
+    exif[0x013B] = _SECRET.decode()
+    ingested, stored = _ingest(tmp_path, make_image("JPEG", exif=exif))
+    assert ingested.orientation == 6
+    assert _SECRET not in stored
+    with Image.open(io.BytesIO(stored)) as img:
+        assert dict(img.getexif()) == {0x0112: 6}
+
+
+def test_webp_xmp_is_stripped(tmp_path, make_image):
+    data = make_image("WEBP", xmp=b"<x:xmpmeta>" + _SECRET + b"</x:xmpmeta>")
+    ingested, stored = _ingest(tmp_path, data)
+    assert _SECRET not in stored
+    with Image.open(io.BytesIO(stored)) as img:
+        assert img.size == (64, 48)
+
+
+def test_gif_comment_is_stripped(tmp_path, make_image):
+    ingested, stored = _ingest(tmp_path, make_image("GIF", comment=_SECRET))
+    assert ingested.has_metadata
+    assert _SECRET not in stored
+
+
+@pytest.mark.parametrize("fmt", ["PNG", "JPEG", "WEBP"])
+def test_clean_images_stay_readable(tmp_path, make_image, fmt):
+    data = make_image(fmt)
+    ingested, stored = _ingest(tmp_path, data)
+    with Image.open(io.BytesIO(stored)) as img, Image.open(io.BytesIO(data)) as src:
+        assert img.tobytes() == src.tobytes()
+
+
+class _SpyStream(io.BytesIO):
+    """Records the folders holding in-flight temp files while it is read."""
+
+    def __init__(self, data: bytes, folders: dict) -> None:
+        super().__init__(data)
+        self.folders = folders
+        self.partials = set()
+
+    def read(self, size=-1):
+        for name, folder in self.folders.items():
+            if any(entry.startswith(".partial-") for entry in os.listdir(folder)):
+                self.partials.add(name)
+        return super().read(size)
+
+
+def test_uploads_are_staged_outside_the_served_folder(app, make_image):
+    from app import conf, db
+    from app.models import Meme, User
+
+    user = User("alice", "alice@example.com", "password1")
+    db.session.add(user)
+    db.session.commit()
+    folders = dict(uploads=conf.UPLOADS_FOLDER, staging=conf.STAGING_FOLDER)
+    stream = _SpyStream(make_image("PNG"), folders)
+    meme = Meme.from_upload(FileStorage(stream, filename="a.png"), user.id, False)
+    assert stream.partials == {"staging"}
+    static = os.path.abspath(app.static_folder)
+    assert os.path.commonpath([conf.STAGING_FOLDER, static]) != static
+    assert os.path.exists(meme.filepath)
+    assert not [e for e in os.listdir(conf.STAGING_FOLDER) if e.startswith(".partial-")]
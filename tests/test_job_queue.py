@@ -0,0 +1,77 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from app import db
+from app.jobs.queue import JobHandler, JobQueue
+from app.models import Job, Meme, User
+
+_TIMEOUT = 10
+
+
+class _BlockingHandler(JobHandler):
+    """Runs until the test releases it, optionally failing."""
+
+    kind = "test-blocking"
+    io_bound = True
+
+    def __init__(self, error: Exception = None) -> None:
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.error = error
+        self.completed = []
+
+    def prepare(self, meme: Meme) -> tuple:
+        return self._work, ()
+
+    def _work(self):
+        self.started.set()
+        assert self.release.wait(_TIMEOUT)
+        if self.error is not None:
+            raise self.error
+        return "done"
+
+    def complete(self, meme: Meme, result) -> None:
+        self.completed.append(result)
+
+
+@pytest.fixture
+def job_id(app):
+    user = User("alice", "alice@example.com", "password1")
+    db.session.add(user)
+    db.session.commit()
+    meme = Meme(user.id, "test.png", False)
+    db.session.add(meme)
+    db.session.commit()
+    job = Job(_BlockingHandler.kind, meme.id)
+    db.session.add(job)
+    db.session.commit()
+    return job.id
+
+
+def _queue(app, handler: JobHandler) -> JobQueue:
+    queue = JobQueue()
+    queue.init_app(app)
+    queue.poll_interval = 0.05
+    queue.register(handler)
+    return queue
+
+
+@pytest.mark.parametrize("error", [None, RuntimeError("boom")])
+def test_job_deleted_while_running_does_not_stop_the_dispatcher(app, job_id, error):
+    handler = _BlockingHandler(error)
+    queue = _queue(app, handler)
+    with ThreadPoolExecutor(1) as pool:
+        dispatcher = pool.submit(queue.run, True)
+        assert handler.started.wait(_TIMEOUT)
+        # e.g. purge-deleted removing the jobs of a purged meme
+        db.session.execute(db.delete(Job).where(Job.id == job_id))
+        db.session.commit()
+        handler.release.set()
+        assert dispatcher.result(_TIMEOUT) == 1
+    assert handler.completed == []
+    assert db.session.get(Job, job_id) is None
+
+
+def test_record_error_ignores_a_deleted_job(app):
+    queue = _queue(app, _BlockingHandler())
+    queue._record_error(None, RuntimeError("boom"))
@@ -0,0 +1,100 @@
+import pytest
+from app import db
+from app.jobs.maintenance import MaintenanceRunner, MaintenanceTask
+from app.models import MaintenanceRun, Meme, User
+
+
+def _double(value: int) -> int:
+    return value * 2
+
+
+class _Task(MaintenanceTask):
+    """Stores twice the meme id in its width, failing on the ids in broken."""
+
+    name = "double"
+    io_bound = True
+
+    def __init__(self) -> None:
+        self.broken = set()
+        self.seen = []
+
+    def prepare(self, meme: Meme) -> tuple:
+        self.seen.append(meme.id)
+        if meme.id in self.broken:
+            raise ValueError("broken")
+        return _double, (meme.id,)
+
+    def apply(self, meme: Meme, result: int) -> None:
+        meme.width = result
+
+
+class _Interrupted(Exception):
+    pass
+
+
+@pytest.fixture
+def memes(app):
+    user = User("alice", "alice@example.com", "password1")
+    db.session.add(user)
+    db.session.commit()
+    memes = [Meme(user.id, f"{i}.png", False) for i in range(10)]
+    db.session.add_all(memes)
+    db.session.commit()
+    return [meme.id for meme in memes]
+
+
+def test_interrupted_run_resumes_and_retries_failures(memes):
+    task = _Task()
+    task.broken = {memes[1], memes[6]}
+    runner = MaintenanceRunner()
+    runner.register(task)
+    chunks = []
+
+    def interrupt_after_two_chunks(line: str) -> None:
+        if "memes/s" in line:
+            chunks.append(line)
+            if len(chunks) == 2:
+                raise _Interrupted
+
+    with pytest.raises(_Interrupted):
+        runner.run("double", chunk_size=3, workers=2, report=interrupt_after_two_chunks)
+    db.session.rollback()
+    run = db.session.get(MaintenanceRun, "double")
+    assert run.last_id == memes[5]
+    assert (run.processed, run.failed) == (5, 1)
+    assert run.finished_at is None
+
+    # the rest of the memes, the failures are left for the next run
+    task.seen.clear()
+    run = runner.run("double", chunk_size=3, workers=2, report=lambda line: None)
+    assert task.seen == [memes[1]] + memes[6:]
+    assert (run.processed, run.failed) == (8, 2)
+    assert run.last_id == memes[-1]
+    assert run.finished_at is None
+
+    # the next run retries only the failures, and finishes once they succeed
+    task.broken = set()
+    task.seen.clear()
+    run = runner.run("double", chunk_size=3, workers=2, report=lambda line: None)
+    assert sorted(task.seen) == [memes[1], memes[6]]
+    assert (run.processed, run.failed) == (10, 0)
+    assert run.finished_at is not None
+    widths = db.session.execute(db.select(Meme.id, Meme.width)).all()
+    assert all(width == meme_id * 2 for meme_id, width in widths)
+
+
+def test_failures_of_deleted_memes_are_dropped(memes):
+    task = _Task()
+    task.broken = {memes[2]}
+    runner = MaintenanceRunner()
+    runner.register(task)
+    run = runner.run("double", chunk_size=4, workers=1, report=lambda line: None)
+    assert run.failed == 1 and run.finished_at is None
+
+    db.session.get(Meme, memes[2]).deleted = True
+    db.session.commit()
+    task.seen.clear()
+    run = runner.run("double", chunk_size=4, workers=1, report=lambda line: None)
+    assert task.seen == []
+    assert run.failed == 0
+    assert run.finished_at is not None
@@ -0,0 +1,43 @@
+from app import db
+from app.models import MediaFile, User
+
+
+def test_lost_acquire_race_keeps_the_rest_of_the_transaction(app, lost_race):
+    db.session.add(User("alice", "alice@example.com", "password1"))
+    db.session.flush()
+    winner = "INSERT INTO media_file VALUES ('abc', 'abc.png', 1)"
+    with lost_race("INSERT INTO media_file", winner) as state:
+        filename, created = MediaFile.acquire("abc", "abc.webp")
+    assert state["raised"]
+    assert (filename, created) == ("abc.png", False)
+    db.session.commit()
+    # the user added before the race is still committed
+    assert db.session.execute(db.select(User.username)).scalars().all() == ["alice"]
+    assert db.session.get(MediaFile, "abc").ref_count == 2
+
+
+def test_acquire(app):
+    assert MediaFile.acquire("abc", "abc.png") == ("abc.png", True)
+    assert MediaFile.acquire("abc", "abc.webp") == ("abc.png", False)
+    db.session.commit()
+    assert db.session.get(MediaFile, "abc").ref_count == 2
+
+
+def test_acquire_many(app):
+    MediaFile.acquire("abc", "abc.png")
+    acquired = MediaFile.acquire_many({"abc": "abc.webp", "def": "def.webp"})
+    assert acquired == {"abc": ("abc.png", False), "def": ("def.webp", True)}
+    db.session.commit()
+    assert db.session.get(MediaFile, "abc").ref_count == 2
+    assert db.session.get(MediaFile, "def").ref_count == 1
+
+
+def test_acquire_many_after_a_lost_race(app, lost_race):
+    winner = "INSERT INTO media_file VALUES ('abc', 'abc.png', 1)"
+    with lost_race("INSERT INTO media_file", winner) as state:
+        acquired = MediaFile.acquire_many({"abc": "abc.webp", "def": "def.webp"})
+    assert state["raised"]
+    assert acquired == {"abc": ("abc.png", False), "def": ("def.webp", True)}
+    db.session.commit()
+    assert db.session.get(MediaFile, "abc").ref_count == 2
+    assert db.session.get(MediaFile, "def").ref_count == 1
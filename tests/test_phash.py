@@ -0,0 +1,60 @@
+import io
+import pytest
+from PIL import Image, ImageDraw
+from werkzeug.datastructures import FileStorage
+from app import db
+from app.jobs import PerceptualHashTask, ThumbnailHandler
+from app.models import Meme, User
+from app.utils.phash import dhash_file, hamming, to_unsigned
+
+
+def _upright() -> Image.Image:
+    """A landscape image whose halves differ, so turning it changes its hash."""
+    img = Image.new("RGB", (640, 480), (250, 250, 250))
+    draw = ImageDraw.Draw(img)
+    for index in range(8):
+        shade = 30 * index
+        draw.rectangle(
+            (80 * index, 0, 80 * index + 40, 480), fill=(shade, 0, 255 - shade)
+        )
+    draw.ellipse((40, 40, 200, 200), fill=(0, 0, 0))
+    return img
+
+
+def _rotated_jpeg(path) -> None:
+    """Store the upright image turned sideways, with EXIF orientation 6 to undo it."""
+    exif = Image.Exif()
+    exif[0x0112] = 6
+    _upright().transpose(Image.Transpose.ROTATE_90).save(path, "JPEG", exif=exif)
+
+
+def test_dhash_file_hashes_the_upright_image(tmp_path):
+    _upright().save(tmp_path / "upright.jpg", "JPEG")
+    _rotated_jpeg(tmp_path / "rotated.jpg")
+    upright = dhash_file(str(tmp_path / "upright.jpg"))
+    assert hamming(upright, dhash_file(str(tmp_path / "rotated.jpg"), 6)) <= 4
+    assert hamming(upright, dhash_file(str(tmp_path / "rotated.jpg"))) > 12
+
+
+def test_rotated_upload_hashes_like_its_thumbnail(app, tmp_path):
+    user = User("alice", "alice@example.com", "password1")
+    db.session.add(user)
+    db.session.commit()
+    _rotated_jpeg(tmp_path / "rotated.jpg")
+    with open(tmp_path / "rotated.jpg", "rb") as file:
+        meme = Meme.from_upload(
+            FileStorage(file, filename="rotated.jpg"), user.id, False
+        )
+    db.session.add(meme)
+    db.session.commit()
+    assert meme.orientation == 6
+    handler = ThumbnailHandler()
+    fn, args = handler.prepare(meme)
+    handler.complete(meme, fn(*args))
+    db.session.commit()
+
+    # what `flask maintenance run phash` and the backfill compute
+    fn, args = PerceptualHashTask().prepare(meme)
+    from_thumbnail = fn(*args)
+    assert hamming(to_unsigned(meme.phash), to_unsigned(from_thumbnail)) <= 4
+    assert Meme.find_possible_duplicate(from_thumbnail) == meme.id
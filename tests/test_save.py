@@ -0,0 +1,60 @@
+import pytest
+from app import db
+from app.models import Meme, User
+from app.models.tables import liked_memes, saved_memes
+
+
+@pytest.fixture
+def client(app):
+    app.config["WTF_CSRF_ENABLED"] = False
+    user = User("alice", "alice@example.com", "password1")
+    db.session.add(user)
+    db.session.commit()
+    client = app.test_client()
+    client.post("/login", data={"username": "alice", "password": "password1"})
+    return client
+
+
+@pytest.fixture
+def meme(client):
+    user = db.session.execute(db.select(User)).scalar_one()
+    meme = Meme(user.id, "missing.png", False)
+    db.session.add(meme)
+    db.session.commit()
+    return meme
+
+
+@pytest.mark.parametrize("action", ["like", "save"])
+def test_like_and_save(client, meme, action):
+    response = client.post(f"/meme/{meme.id}/{action}")
+    assert response.status_code == 200
+    assert response.get_json()[f"{action}d"] is True
+    assert response.get_json()[f"{action}_count"] == 1
+    # idempotent
+    assert client.post(f"/meme/{meme.id}/{action}").get_json()[f"{action}_count"] == 1
+    response = client.delete(f"/meme/{meme.id}/{action}")
+    assert response.get_json()[f"{action}_count"] == 0
+
+
+@pytest.mark.parametrize(
+    "action, table", [("like", liked_memes), ("save", saved_memes)]
+)
+def test_like_and_save_a_deleted_meme(client, meme, action, table):
+    meme.deleted = True
+    db.session.commit()
+    assert client.post(f"/meme/{meme.id}/{action}").status_code == 404
+    rows = db.session.execute(db.select(db.func.count()).select_from(table)).scalar()
+    assert rows == 0
+
+
+def test_lost_like_race_keeps_the_rest_of_the_transaction(client, meme, lost_race):
+    winner = f"INSERT INTO liked_memes (user_id, meme_id) VALUES ({meme.posted_by}, {meme.id})"
+    meme.private = True
+    with lost_race("INSERT INTO liked_memes", winner) as state:
+        like_count = Meme.set_liked(meme.id, meme.posted_by, True)
+    assert state["raised"]
+    # the concurrent request counted its like, this one did not
+    assert like_count == 0
+    db.session.commit()
+    db.session.expire_all()
+    assert db.session.get(Meme, meme.id).private
@@ -0,0 +1,65 @@
+import gc, os, warnings
+import pytest
+from PIL import Image
+from app.utils.thumbnails import (
+    THUMBNAIL_SIZES,
+    make_thumbnail,
+    render_thumbnails,
+    thumbnail_filename,
+)
+
+
+def _unclosed_files(run) -> list:
+    """Run a function and collect the warnings of files it left open."""
+    with warnings.catch_warnings(record=True) as caught:
+        # an unclosed file warns when it is garbage collected
+        warnings.simplefilter("always", ResourceWarning)
+        try:
+            run()
+        finally:
+            gc.collect()
+    return [w for w in caught if issubclass(w.category, ResourceWarning)]
+
+
+def test_make_thumbnail(tmp_path):
+    original = tmp_path / "meme.png"
+    Image.new("RGB", (800, 600), (200, 30, 30)).save(original)
+    path = make_thumbnail(str(original), "meme.png", str(tmp_path), "sm", 6)
+    with Image.open(path) as thumb:
+        # turned upright: the orientation swaps the sides
+        assert thumb.height > thumb.width
+
+
+def test_make_thumbnail_closes_a_truncated_original(tmp_path):
+    original = tmp_path / "meme.png"
+    Image.new("RGB", (800, 600), (200, 30, 30)).save(original)
+    data = original.read_bytes()
+    original.write_bytes(data[: len(data) // 2])
+
+    def run():
+        with pytest.raises(OSError):
+            make_thumbnail(str(original), "meme.png", str(tmp_path), "sm")
+
+    assert _unclosed_files(run) == []
+
+
+def test_render_thumbnails_encodes_a_webp_original_once_per_size(tmp_path, monkeypatch):
+    original = tmp_path / "meme.webp"
+    Image.new("RGB", (800, 600), (200, 30, 30)).save(original)
+    saved = []
+    save = Image.Image.save
+
+    def record(img, fp, *args, **kwargs):
+        if isinstance(fp, str):
+            saved.append(os.path.basename(fp))
+        return save(img, fp, *args, **kwargs)
+
+    monkeypatch.setattr(Image.Image, "save", record)
+    result = render_thumbnails(
+        str(original), "meme.webp", str(tmp_path / "thumbs"), ["webp"]
+    )
+    assert result["formats"] == []
+    assert len(saved) == len(set(saved))
+    assert sorted(saved) == sorted(
+        thumbnail_filename(size_type, "meme.webp") for size_type in THUMBNAIL_SIZES
+    )